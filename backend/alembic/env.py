@@ -0,0 +1,87 @@
+from logging.config import fileConfig
+from alembic import context
+from app.core.database import Base, engine
+from app.models import chat as chat_models  # Import models to register them
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+# Full-text search objects are created with raw SQL (see revisions 0010 and 0017) and have no model
+SEARCH_INDEX_TABLES = ("messages_fts", "file_chunks_fts", "archived_messages_fts")
+SEARCH_INDEX_COLUMNS = ("search_vector",)
+
+
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    """Keep autogenerate from proposing to drop the search index objects"""
+    if type_ == "table" and name.startswith(SEARCH_INDEX_TABLES):
+        return False
+    if type_ == "column" and name in SEARCH_INDEX_COLUMNS:
+        return False
+    if type_ == "index" and name.endswith("_search_vector"):
+        return False
+    return True
+
+
+def run_migrations_offline() -> None:
+    """Run migrations in 'offline' mode, emitting SQL to stdout"""
+    context.configure(
+        url=str(engine.url),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=engine.dialect.name == "sqlite",
+        include_object=include_object,
+        dialect_opts={"paramstyle": "named"},
+    )
+    
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """Run migrations against the application's database engine"""
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run_migrations(connection)
+        return
+    
+    with engine.connect() as connection:
+        _run_migrations(connection)
+
+
+def _run_migrations(connection) -> None:
+    sqlite = connection.dialect.name == "sqlite"
+    if sqlite:
+        # Batch mode drops and recreates tables, which must not fire ON DELETE CASCADE.
+        # The pragma is ignored inside a transaction, so set it before one starts.
+        _set_sqlite_foreign_keys(connection, False)
+    
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite can't ALTER most constraints; batch mode recreates tables instead
+        render_as_batch=sqlite,
+        include_object=include_object,
+    )
+    
+    try:
+        with context.begin_transaction():
+            context.run_migrations()
+    finally:
+        if sqlite:
+            # The connection goes back to the application's pool
+            _set_sqlite_foreign_keys(connection, True)
+
+
+def _set_sqlite_foreign_keys(connection, enabled: bool) -> None:
+    connection.exec_driver_sql(f"PRAGMA foreign_keys={'ON' if enabled else 'OFF'}")
+    connection.commit()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,51 @@
+"""file retrieval index
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'file_chunks',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('file_id', sa.Integer(), nullable=False),
+        sa.Column('chunk_index', sa.Integer(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('term_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['file_id'], ['file_uploads.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_file_chunks_id', 'file_chunks', ['id'])
+    op.create_index('ix_file_chunks_file_id', 'file_chunks', ['file_id'])
+
+    op.create_table(
+        'chunk_terms',
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('term', sa.String(), nullable=False),
+        sa.Column('chunk_id', sa.Integer(), nullable=False),
+        sa.Column('term_frequency', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['chat_id'], ['chats.id']),
+        sa.ForeignKeyConstraint(['chunk_id'], ['file_chunks.id']),
+        sa.PrimaryKeyConstraint('chat_id', 'term', 'chunk_id'),
+    )
+    op.create_index('ix_chunk_terms_chunk_id', 'chunk_terms', ['chunk_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chunk_terms_chunk_id', table_name='chunk_terms')
+    op.drop_table('chunk_terms')
+    op.drop_index('ix_file_chunks_file_id', table_name='file_chunks')
+    op.drop_index('ix_file_chunks_id', table_name='file_chunks')
+    op.drop_table('file_chunks')
@@ -0,0 +1,28 @@
+"""keyset pagination indexes
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 09:20:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Keyset pagination orders chats by (updated_at, id), so it must never be NULL
+    op.execute("UPDATE chats SET updated_at = created_at WHERE updated_at IS NULL")
+
+    op.create_index('ix_chats_updated_at_id', 'chats', ['updated_at', 'id'])
+    op.create_index('ix_messages_chat_id_created_at_id', 'messages', ['chat_id', 'created_at', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_messages_chat_id_created_at_id', table_name='messages')
+    op.drop_index('ix_chats_updated_at_id', table_name='chats')
@@ -0,0 +1,24 @@
+"""chat_id indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:30:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # messages.chat_id is the leading column of ix_messages_chat_id_created_at_id (0003)
+    op.create_index('ix_file_uploads_chat_id', 'file_uploads', ['chat_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_file_uploads_chat_id', table_name='file_uploads')
@@ -0,0 +1,129 @@
+"""content addressed blobs
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 09:40:00
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 100
+
+file_uploads = sa.table(
+    'file_uploads',
+    sa.column('id', sa.Integer),
+    sa.column('content', sa.Text),
+    sa.column('blob_id', sa.Integer),
+)
+content_blobs = sa.table(
+    'content_blobs',
+    sa.column('id', sa.Integer),
+    sa.column('content', sa.Text),
+    sa.column('size', sa.Integer),
+    sa.column('ref_count', sa.Integer),
+    sa.column('created_at', sa.DateTime),
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'content_blobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=True),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('sha256'),
+    )
+    op.create_index('ix_content_blobs_id', 'content_blobs', ['id'])
+    
+    with op.batch_alter_table('file_uploads') as batch_op:
+        batch_op.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+    
+    # Move each existing file's text into its own blob. The original bytes are
+    # gone, so these blobs have no hash and are never matched by new uploads.
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(file_uploads.c.id, file_uploads.c.content)
+            .where(file_uploads.c.id > last_id)
+            .order_by(file_uploads.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for file_id, content in rows:
+            blob_id = connection.execute(
+                content_blobs.insert().values(
+                    content=content,
+                    size=len(content),
+                    ref_count=1,
+                    created_at=datetime.utcnow(),
+                ).returning(content_blobs.c.id)
+            ).scalar()
+            connection.execute(
+                file_uploads.update()
+                .where(file_uploads.c.id == file_id)
+                .values(blob_id=blob_id)
+            )
+        last_id = rows[-1][0]
+    
+    with op.batch_alter_table('file_uploads') as batch_op:
+        batch_op.alter_column('blob_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_file_uploads_blob_id', 'content_blobs', ['blob_id'], ['id'])
+        batch_op.create_index('ix_file_uploads_blob_id', ['blob_id'])
+        batch_op.drop_column('content')
+    
+    # Chunks now belong to the blob instead of the upload
+    with op.batch_alter_table('file_chunks') as batch_op:
+        batch_op.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE file_chunks SET blob_id = "
+        "(SELECT blob_id FROM file_uploads WHERE file_uploads.id = file_chunks.file_id)"
+    )
+    with op.batch_alter_table('file_chunks') as batch_op:
+        batch_op.drop_index('ix_file_chunks_file_id')
+        batch_op.drop_column('file_id')
+        batch_op.alter_column('blob_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_file_chunks_blob_id', 'content_blobs', ['blob_id'], ['id'])
+        batch_op.create_index('ix_file_chunks_blob_id_chunk_index', ['blob_id', 'chunk_index'], unique=True)
+
+
+def downgrade() -> None:
+    # Chunks are rebuilt on demand by the previous revision's code, so drop them
+    op.execute("DELETE FROM chunk_terms")
+    op.execute("DELETE FROM file_chunks")
+    with op.batch_alter_table('file_chunks') as batch_op:
+        batch_op.drop_index('ix_file_chunks_blob_id_chunk_index')
+        batch_op.drop_constraint('fk_file_chunks_blob_id', type_='foreignkey')
+        batch_op.drop_column('blob_id')
+        batch_op.add_column(sa.Column('file_id', sa.Integer(), nullable=False))
+        batch_op.create_foreign_key('fk_file_chunks_file_id', 'file_uploads', ['file_id'], ['id'])
+        batch_op.create_index('ix_file_chunks_file_id', ['file_id'])
+    
+    with op.batch_alter_table('file_uploads') as batch_op:
+        batch_op.add_column(sa.Column('content', sa.Text(), nullable=True))
+    op.execute(
+        "UPDATE file_uploads SET content = "
+        "(SELECT content FROM content_blobs WHERE content_blobs.id = file_uploads.blob_id)"
+    )
+    with op.batch_alter_table('file_uploads') as batch_op:
+        batch_op.alter_column('content', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_index('ix_file_uploads_blob_id')
+        batch_op.drop_constraint('fk_file_uploads_blob_id', type_='foreignkey')
+        batch_op.drop_column('blob_id')
+    
+    op.drop_index('ix_content_blobs_id', table_name='content_blobs')
+    op.drop_table('content_blobs')
@@ -0,0 +1,55 @@
+"""cascade deletes
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 09:50:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+# Names SQLite batch mode gives to foreign keys created without one
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+# (table, column, referred table)
+CASCADED_FOREIGN_KEYS = [
+    ('messages', 'chat_id', 'chats'),
+    ('file_uploads', 'chat_id', 'chats'),
+    ('file_chunks', 'blob_id', 'content_blobs'),
+    ('chunk_terms', 'chat_id', 'chats'),
+    ('chunk_terms', 'chunk_id', 'file_chunks'),
+]
+
+
+def _replace_foreign_key(table, column, referred_table, ondelete) -> None:
+    """Recreate the foreign key on ``table.column`` with a new ON DELETE action"""
+    foreign_keys = sa.inspect(op.get_bind()).get_foreign_keys(table)
+    existing = next(fk for fk in foreign_keys if fk['constrained_columns'] == [column])
+    name = existing['name'] or NAMING_CONVENTION['fk'] % {
+        'table_name': table,
+        'column_0_name': column,
+        'referred_table_name': referred_table,
+    }
+    
+    with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint(name, type_='foreignkey')
+        batch_op.create_foreign_key(
+            f'fk_{table}_{column}', referred_table, [column], ['id'], ondelete=ondelete
+        )
+
+
+def upgrade() -> None:
+    for table, column, referred_table in CASCADED_FOREIGN_KEYS:
+        _replace_foreign_key(table, column, referred_table, 'CASCADE')
+
+
+def downgrade() -> None:
+    for table, column, referred_table in reversed(CASCADED_FOREIGN_KEYS):
+        _replace_foreign_key(table, column, referred_table, None)
@@ -0,0 +1,35 @@
+"""completion cache
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'completion_cache',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('response', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index('ix_completion_cache_created_at', 'completion_cache', ['created_at'])
+    op.create_index('ix_completion_cache_expires_at', 'completion_cache', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_completion_cache_expires_at', table_name='completion_cache')
+    op.drop_index('ix_completion_cache_created_at', table_name='completion_cache')
+    op.drop_table('completion_cache')
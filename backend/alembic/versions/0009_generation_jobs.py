@@ -0,0 +1,47 @@
+"""generation jobs
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 10:20:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'generation_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('worker_id', sa.String(length=64), nullable=True),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_generation_jobs_id', 'generation_jobs', ['id'])
+    op.create_index('ix_generation_jobs_chat_id', 'generation_jobs', ['chat_id'])
+    op.create_index('ix_generation_jobs_status_id', 'generation_jobs', ['status', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generation_jobs_status_id', table_name='generation_jobs')
+    op.drop_index('ix_generation_jobs_chat_id', table_name='generation_jobs')
+    op.drop_index('ix_generation_jobs_id', table_name='generation_jobs')
+    op.drop_table('generation_jobs')
@@ -0,0 +1,73 @@
+"""full text search
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 10:30:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+# Indexed text: message bodies and the chunks of uploaded files' text.
+# SQLite keeps FTS5 external-content tables in step through triggers, which
+# also fire for ON DELETE CASCADE. PostgreSQL keeps a generated tsvector
+# column per row. Batch migrations recreate tables on SQLite and drop their
+# triggers, so a later batch_alter_table on these tables must recreate them.
+INDEXED_TABLES = ('messages', 'file_chunks')
+
+
+def _create_sqlite_index(table: str) -> None:
+    fts = f'{table}_fts'
+    op.execute(
+        f"CREATE VIRTUAL TABLE {fts} USING fts5("
+        f"content, content='{table}', content_rowid='id', tokenize='porter unicode61')"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE OF content ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); "
+        f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END"
+    )
+    # Index the existing rows
+    op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for table in INDEXED_TABLES:
+            _create_sqlite_index(table)
+        return
+    
+    for table in INDEXED_TABLES:
+        # Adding a stored generated column rewrites the table, indexing existing rows
+        op.execute(
+            f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('english', content)) STORED"
+        )
+        op.execute(f"CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for table in INDEXED_TABLES:
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+            op.execute(f"DROP TABLE IF EXISTS {table}_fts")
+        return
+    
+    for table in INDEXED_TABLES:
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_search_vector")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,163 @@
+"""compressed text
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 11:20:00
+
+"""
+import os
+import zlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# Columns of CompressedText (app/models/types.py)
+COMPRESSED_TABLES = ('messages', 'content_blobs', 'file_chunks')
+
+# On SQLite the FTS5 tables of revision 0010 read their text through views that
+# decompress it with decompress_text(), which the app registers per connection
+# (app/core/database.py). The triggers call it too, so other SQLite clients can
+# read and back up the database but cannot insert, update or delete messages or
+# file chunks (nor delete chats, which cascades). A later batch_alter_table on
+# these tables must drop and recreate the views as well as the triggers.
+INDEXED_TABLES = ('messages', 'file_chunks')
+
+# The stored format of app/core/compression.py, frozen here so this revision
+# doesn't change with the app: a codec byte (0x01 for zlib) before the data
+ZLIB_CODEC = b'\x01'
+MIN_BYTES = int(os.getenv('TEXT_COMPRESSION_MIN_BYTES', '1024'))
+LEVEL = int(os.getenv('TEXT_COMPRESSION_LEVEL', '6'))
+
+
+def _compress_text(value):
+    if not isinstance(value, str) or MIN_BYTES <= 0:
+        return value
+    encoded = value.encode('utf-8')
+    if len(encoded) < MIN_BYTES:
+        return value
+    compressed = zlib.compress(encoded, LEVEL)
+    if len(compressed) + 1 >= len(encoded):
+        return value
+    return ZLIB_CODEC + compressed
+
+
+def _decompress_text(value):
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    if value[:1] != ZLIB_CODEC:
+        raise ValueError(f"Unknown text compression codec {value[:1]!r}")
+    return zlib.decompress(value[1:]).decode('utf-8')
+
+
+def _drop_sqlite_index(table: str) -> None:
+    for trigger in ('insert', 'delete', 'update'):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+    op.execute(f"DROP TABLE IF EXISTS {table}_fts")
+    op.execute(f"DROP VIEW IF EXISTS {table}_search")
+
+
+def _create_sqlite_index(table: str, compressed: bool) -> None:
+    fts = f'{table}_fts'
+    source = table
+    new_content, old_content = 'new.content', 'old.content'
+    if compressed:
+        source = f'{table}_search'
+        op.execute(f"CREATE VIEW {source} AS SELECT id, decompress_text(content) AS content FROM {table}")
+        new_content, old_content = 'decompress_text(new.content)', 'decompress_text(old.content)'
+    op.execute(
+        f"CREATE VIRTUAL TABLE {fts} USING fts5("
+        f"content, content='{source}', content_rowid='id', tokenize='porter unicode61')"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, content) VALUES (new.id, {new_content}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, {old_content}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE OF content ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, {old_content}); "
+        f"INSERT INTO {fts}(rowid, content) VALUES (new.id, {new_content}); END"
+    )
+    op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _rewrite_content(table: str, convert) -> None:
+    """Pass every row's content through ``convert``, writing back the ones that change"""
+    rows_table = sa.table(table, sa.column('id', sa.Integer), sa.column('content'))
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(rows_table.c.id, rows_table.c.content)
+            .where(rows_table.c.id > last_id)
+            .order_by(rows_table.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        changed = []
+        for row_id, content in rows:
+            converted = convert(content)
+            if converted is not content:
+                changed.append({'row_id': row_id, 'content': converted})
+        if changed:
+            connection.execute(
+                rows_table.update()
+                .where(rows_table.c.id == sa.bindparam('row_id'))
+                .values(content=sa.bindparam('content')),
+                changed
+            )
+        last_id = rows[-1][0]
+
+
+def _postgres_supports_lz4() -> bool:
+    # Per-column compression methods exist from PostgreSQL 14; lz4 needs a server built with it
+    return bool(op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_settings WHERE name = 'default_toast_compression' AND 'lz4' = ANY(enumvals)"
+    )).first())
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        # Unindex first, so compressing rows doesn't fire the triggers, then index once.
+        # The freed pages are reused by new rows; VACUUM returns them to the filesystem.
+        for table in INDEXED_TABLES:
+            _drop_sqlite_index(table)
+        for table in COMPRESSED_TABLES:
+            _rewrite_content(table, _compress_text)
+        for table in INDEXED_TABLES:
+            _create_sqlite_index(table, compressed=True)
+        return
+    
+    # PostgreSQL compresses large values itself; lz4 is faster to read than the default pglz.
+    # Existing rows keep their compression until they are rewritten.
+    if _postgres_supports_lz4():
+        for table in COMPRESSED_TABLES:
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN content SET COMPRESSION lz4")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for table in INDEXED_TABLES:
+            _drop_sqlite_index(table)
+        for table in COMPRESSED_TABLES:
+            _rewrite_content(table, _decompress_text)
+        for table in INDEXED_TABLES:
+            _create_sqlite_index(table, compressed=False)
+        return
+    
+    if _postgres_supports_lz4():
+        for table in COMPRESSED_TABLES:
+            op.execute(f"ALTER TABLE {table} ALTER COLUMN content SET COMPRESSION DEFAULT")
@@ -0,0 +1,42 @@
+"""chat archives
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 11:50:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('chats') as batch_op:
+        batch_op.add_column(sa.Column('archived_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('restored_at', sa.DateTime(), nullable=True))
+    
+    op.create_table(
+        'chat_archives',
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('file_count', sa.Integer(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('chat_id'),
+    )
+
+
+def downgrade() -> None:
+    # Archived rows would be lost with the table, so put them back first
+    # (python -m app.archive restore --all) before downgrading
+    op.drop_table('chat_archives')
+    with op.batch_alter_table('chats') as batch_op:
+        batch_op.drop_column('restored_at')
+        batch_op.drop_column('archived_at')
@@ -0,0 +1,124 @@
+"""autoincrement ids
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-18 13:10:00
+
+"""
+import json
+import zlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+# Without AUTOINCREMENT SQLite hands out the ids of deleted rows again, so rows
+# created while a chat was archived (revision 0012) could take the ids of its
+# archived rows. PostgreSQL sequences never go back, so only SQLite changes.
+# (table, key of its rows in a chat_archives payload)
+ARCHIVED_TABLES = (('messages', 'messages'), ('file_uploads', 'files'))
+
+# messages is indexed for full-text search (revisions 0010 and 0011). Its FTS5
+# table stays, as the ids don't change, but the view and triggers that refer
+# to the table are dropped around the rebuild and created again.
+SEARCH_TRIGGERS = {
+    'insert': "AFTER INSERT ON messages BEGIN "
+              "INSERT INTO messages_fts(rowid, content) VALUES (new.id, decompress_text(new.content)); END",
+    'delete': "AFTER DELETE ON messages BEGIN "
+              "INSERT INTO messages_fts(messages_fts, rowid, content) "
+              "VALUES ('delete', old.id, decompress_text(old.content)); END",
+    'update': "AFTER UPDATE OF content ON messages BEGIN "
+              "INSERT INTO messages_fts(messages_fts, rowid, content) "
+              "VALUES ('delete', old.id, decompress_text(old.content)); "
+              "INSERT INTO messages_fts(rowid, content) VALUES (new.id, decompress_text(new.content)); END",
+}
+
+archives = sa.table(
+    'chat_archives',
+    sa.column('chat_id', sa.Integer),
+    sa.column('data', sa.LargeBinary),
+)
+
+
+def _read_archives(connection):
+    for chat_id, data in connection.execute(sa.select(archives.c.chat_id, archives.c.data)):
+        yield chat_id, json.loads(zlib.decompress(data))
+
+
+def _reserve_archived_ids(connection) -> dict:
+    """Give archived rows whose id was handed out again a new one; returns the highest id per table.
+    
+    Restoring such a chat used to renumber these rows anyway. Its rolling
+    summary assumed the old order, so it is dropped and written afresh.
+    """
+    taken = {
+        table: set(connection.execute(sa.text(f"SELECT id FROM {table}")).scalars())
+        for table, _ in ARCHIVED_TABLES
+    }
+    highest = {table: max(ids, default=0) for table, ids in taken.items()}
+    archived = list(_read_archives(connection))
+    for _, payload in archived:
+        for table, key in ARCHIVED_TABLES:
+            highest[table] = max([highest[table]] + [row['id'] for row in payload[key]])
+    
+    for chat_id, payload in archived:
+        changed = False
+        for table, key in ARCHIVED_TABLES:
+            for row in payload[key]:
+                if row['id'] in taken[table]:
+                    highest[table] += 1
+                    row['id'] = highest[table]
+                    changed = True
+                taken[table].add(row['id'])
+        if changed:
+            connection.execute(
+                archives.update()
+                .where(archives.c.chat_id == chat_id)
+                .values(data=zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode()))
+            )
+            connection.execute(sa.text("DELETE FROM chat_summaries WHERE chat_id = :chat_id"), {'chat_id': chat_id})
+    return highest
+
+
+def _rebuild(table: str, autoincrement: bool) -> None:
+    if table == 'messages':
+        for trigger in SEARCH_TRIGGERS:
+            op.execute(f"DROP TRIGGER IF EXISTS messages_fts_{trigger}")
+        op.execute("DROP VIEW IF EXISTS messages_search")
+    
+    with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': autoincrement}):
+        pass
+    
+    if table == 'messages':
+        op.execute("CREATE VIEW messages_search AS SELECT id, decompress_text(content) AS content FROM messages")
+        for trigger, body in SEARCH_TRIGGERS.items():
+            op.execute(f"CREATE TRIGGER messages_fts_{trigger} {body}")
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'sqlite':
+        return
+    
+    highest = _reserve_archived_ids(connection)
+    for table, _ in ARCHIVED_TABLES:
+        _rebuild(table, autoincrement=True)
+        # Copying the rows set the counter to the highest live id; archived ids count too
+        connection.execute(sa.text("DELETE FROM sqlite_sequence WHERE name = :table"), {'table': table})
+        connection.execute(
+            sa.text("INSERT INTO sqlite_sequence (name, seq) VALUES (:table, :seq)"),
+            {'table': table, 'seq': highest[table]}
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    
+    for table, _ in ARCHIVED_TABLES:
+        _rebuild(table, autoincrement=False)
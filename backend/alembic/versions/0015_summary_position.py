@@ -0,0 +1,34 @@
+"""summary position
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-18 13:40:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Summaries cover messages in (created_at, id) order rather than by id alone
+    op.add_column('chat_summaries', sa.Column('through_created_at', sa.DateTime(), nullable=True))
+    op.execute(
+        "UPDATE chat_summaries SET through_created_at = "
+        "(SELECT created_at FROM messages WHERE messages.id = chat_summaries.through_message_id)"
+    )
+    # Summaries whose last message is gone are rebuilt after the chat's next answer
+    op.execute("DELETE FROM chat_summaries WHERE through_created_at IS NULL")
+    with op.batch_alter_table('chat_summaries') as batch_op:
+        batch_op.alter_column('through_created_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('chat_summaries') as batch_op:
+        batch_op.drop_column('through_created_at')
@@ -0,0 +1,74 @@
+"""blob postings
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-18 14:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+# The retrieval postings of revision 0002 were copied into every chat that
+# uploaded the same file. They are now kept once per blob and reached through
+# the chat's file_uploads. The old table is renamed out of the way, with its
+# index-backed names freed, and copied from.
+PREVIOUS_TABLE = 'chunk_terms_previous'
+
+
+def _set_aside(table: str) -> None:
+    op.drop_index('ix_chunk_terms_chunk_id', table_name=table)
+    op.rename_table(table, PREVIOUS_TABLE)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(f"ALTER INDEX {table}_pkey RENAME TO {PREVIOUS_TABLE}_pkey")
+
+
+def upgrade() -> None:
+    _set_aside('chunk_terms')
+    op.create_table(
+        'chunk_terms',
+        sa.Column('blob_id', sa.Integer(), nullable=False),
+        sa.Column('term', sa.String(), nullable=False),
+        sa.Column('chunk_id', sa.Integer(), nullable=False),
+        sa.Column('term_frequency', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['blob_id'], ['content_blobs.id'], name='fk_chunk_terms_blob_id', ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['chunk_id'], ['file_chunks.id'], name='fk_chunk_terms_chunk_id', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('blob_id', 'term', 'chunk_id'),
+    )
+    op.create_index('ix_chunk_terms_chunk_id', 'chunk_terms', ['chunk_id'])
+    # Every chat's copy has the same frequencies, so any one will do. Blobs only
+    # archived chats use have no postings left and are indexed again on restore.
+    op.execute(
+        f"INSERT INTO chunk_terms (blob_id, term, chunk_id, term_frequency) "
+        f"SELECT file_chunks.blob_id, previous.term, previous.chunk_id, MIN(previous.term_frequency) "
+        f"FROM {PREVIOUS_TABLE} AS previous JOIN file_chunks ON file_chunks.id = previous.chunk_id "
+        f"GROUP BY file_chunks.blob_id, previous.term, previous.chunk_id"
+    )
+    op.drop_table(PREVIOUS_TABLE)
+
+
+def downgrade() -> None:
+    _set_aside('chunk_terms')
+    op.create_table(
+        'chunk_terms',
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('term', sa.String(), nullable=False),
+        sa.Column('chunk_id', sa.Integer(), nullable=False),
+        sa.Column('term_frequency', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], name='fk_chunk_terms_chat_id', ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['chunk_id'], ['file_chunks.id'], name='fk_chunk_terms_chunk_id', ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('chat_id', 'term', 'chunk_id'),
+    )
+    op.create_index('ix_chunk_terms_chunk_id', 'chunk_terms', ['chunk_id'])
+    op.execute(
+        f"INSERT INTO chunk_terms (chat_id, term, chunk_id, term_frequency) "
+        f"SELECT DISTINCT file_uploads.chat_id, previous.term, previous.chunk_id, previous.term_frequency "
+        f"FROM {PREVIOUS_TABLE} AS previous JOIN file_uploads ON file_uploads.blob_id = previous.blob_id"
+    )
+    op.drop_table(PREVIOUS_TABLE)
@@ -0,0 +1,198 @@
+"""archived search
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-10-18 14:40:00
+
+"""
+import json
+import os
+import zlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0017'
+down_revision = '0016'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# Archiving a chat (revision 0012) deleted its messages and files, and with them
+# their search index entries. Their text and file metadata now move to
+# archived_messages and archived_files, indexed like messages (revisions 0010
+# and 0011), and the archive payload keeps the rest of the message rows. File
+# text was never removed: the blobs and their chunks stay indexed. A later
+# batch_alter_table on archived_messages must recreate its view and triggers.
+
+# The stored format of app/core/compression.py, as frozen in revision 0011
+ZLIB_CODEC = b'\x01'
+MIN_BYTES = int(os.getenv('TEXT_COMPRESSION_MIN_BYTES', '1024'))
+LEVEL = int(os.getenv('TEXT_COMPRESSION_LEVEL', '6'))
+
+archives = sa.table(
+    'chat_archives',
+    sa.column('chat_id', sa.Integer),
+    sa.column('data', sa.LargeBinary),
+)
+archived_messages = sa.table(
+    'archived_messages',
+    sa.column('id', sa.Integer),
+    sa.column('chat_id', sa.Integer),
+    sa.column('role', sa.String),
+    sa.column('content'),
+    sa.column('created_at', sa.String),
+)
+archived_files = sa.table(
+    'archived_files',
+    sa.column('id', sa.Integer),
+    sa.column('chat_id', sa.Integer),
+    sa.column('blob_id', sa.Integer),
+    sa.column('original_filename', sa.String),
+    sa.column('created_at', sa.String),
+)
+
+
+def _compress_text(value):
+    if not isinstance(value, str) or MIN_BYTES <= 0:
+        return value
+    encoded = value.encode('utf-8')
+    if len(encoded) < MIN_BYTES:
+        return value
+    compressed = zlib.compress(encoded, LEVEL)
+    if len(compressed) + 1 >= len(encoded):
+        return value
+    return ZLIB_CODEC + compressed
+
+
+def _decompress_text(value):
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    if value[:1] != ZLIB_CODEC:
+        raise ValueError(f"Unknown text compression codec {value[:1]!r}")
+    return zlib.decompress(value[1:]).decode('utf-8')
+
+
+def _encode_payload(payload: dict) -> bytes:
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode(), 6)
+
+
+def _timestamp(value):
+    # Payloads hold ISO timestamps; the drivers want the column's own format
+    return value.replace('T', ' ') if isinstance(value, str) else value
+
+
+def _create_sqlite_index() -> None:
+    op.execute(
+        "CREATE VIEW archived_messages_search AS "
+        "SELECT id, decompress_text(content) AS content FROM archived_messages"
+    )
+    op.execute(
+        "CREATE VIRTUAL TABLE archived_messages_fts USING fts5("
+        "content, content='archived_messages_search', content_rowid='id', tokenize='porter unicode61')"
+    )
+    op.execute(
+        "CREATE TRIGGER archived_messages_fts_insert AFTER INSERT ON archived_messages BEGIN "
+        "INSERT INTO archived_messages_fts(rowid, content) VALUES (new.id, decompress_text(new.content)); END"
+    )
+    op.execute(
+        "CREATE TRIGGER archived_messages_fts_delete AFTER DELETE ON archived_messages BEGIN "
+        "INSERT INTO archived_messages_fts(archived_messages_fts, rowid, content) "
+        "VALUES ('delete', old.id, decompress_text(old.content)); END"
+    )
+
+
+def _move_text_out_of_archives(connection) -> None:
+    sqlite = connection.dialect.name == 'sqlite'
+    for chat_id, data in connection.execute(sa.select(archives.c.chat_id, archives.c.data)).all():
+        payload = json.loads(zlib.decompress(data))
+        messages = [
+            {
+                'id': row['id'],
+                'chat_id': chat_id,
+                'role': row['role'],
+                'content': _compress_text(row.pop('content')) if sqlite else row.pop('content'),
+                'created_at': _timestamp(row.get('created_at')),
+            } for row in payload['messages']
+        ]
+        files = [
+            {
+                'id': row['id'],
+                'chat_id': chat_id,
+                'blob_id': row['blob_id'],
+                'original_filename': row['original_filename'],
+                'created_at': _timestamp(row.get('created_at')),
+            } for row in payload['files']
+        ]
+        for table, rows in ((archived_messages, messages), (archived_files, files)):
+            for start in range(0, len(rows), BATCH_SIZE):
+                connection.execute(table.insert(), rows[start:start + BATCH_SIZE])
+        connection.execute(
+            archives.update().where(archives.c.chat_id == chat_id).values(data=_encode_payload(payload))
+        )
+
+
+def _move_text_into_archives(connection) -> None:
+    for chat_id, data in connection.execute(sa.select(archives.c.chat_id, archives.c.data)).all():
+        payload = json.loads(zlib.decompress(data))
+        texts = dict(connection.execute(
+            sa.select(archived_messages.c.id, archived_messages.c.content)
+            .where(archived_messages.c.chat_id == chat_id)
+        ).all())
+        for row in payload['messages']:
+            row['content'] = _decompress_text(texts.get(row['id'], row.get('content', '')))
+        connection.execute(
+            archives.update().where(archives.c.chat_id == chat_id).values(data=_encode_payload(payload))
+        )
+
+
+def upgrade() -> None:
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    op.create_table(
+        'archived_messages',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_archived_messages_chat_id', 'archived_messages', ['chat_id'])
+    op.create_table(
+        'archived_files',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('chat_id', sa.Integer(), nullable=False),
+        sa.Column('blob_id', sa.Integer(), nullable=False),
+        sa.Column('original_filename', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['blob_id'], ['content_blobs.id']),
+        sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_archived_files_chat_id', 'archived_files', ['chat_id'])
+    op.create_index('ix_archived_files_blob_id', 'archived_files', ['blob_id'])
+    
+    if sqlite:
+        _create_sqlite_index()
+    else:
+        op.execute(
+            "ALTER TABLE archived_messages ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED"
+        )
+        op.execute("CREATE INDEX ix_archived_messages_search_vector ON archived_messages USING gin (search_vector)")
+    _move_text_out_of_archives(op.get_bind())
+
+
+def downgrade() -> None:
+    _move_text_into_archives(op.get_bind())
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('insert', 'delete'):
+            op.execute(f"DROP TRIGGER IF EXISTS archived_messages_fts_{trigger}")
+        op.execute("DROP TABLE IF EXISTS archived_messages_fts")
+        op.execute("DROP VIEW IF EXISTS archived_messages_search")
+    op.drop_table('archived_files')
+    op.drop_table('archived_messages')
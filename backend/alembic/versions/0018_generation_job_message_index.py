@@ -0,0 +1,25 @@
+"""generation job message index
+
+Revision ID: 0018
+Revises: 0017
+Create Date: 2026-10-18 15:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0018'
+down_revision = '0017'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Deleting a message sets generation_jobs.message_id to NULL; without an index
+    # every deleted message (e.g. each one of a deleted chat) scanned the jobs table
+    op.create_index('ix_generation_jobs_message_id', 'generation_jobs', ['message_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generation_jobs_message_id', table_name='generation_jobs')
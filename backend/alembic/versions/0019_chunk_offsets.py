@@ -0,0 +1,202 @@
+"""chunk offsets
+
+Revision ID: 0019
+Revises: 0018
+Create Date: 2026-10-18 16:20:00
+
+"""
+import os
+import zlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0019'
+down_revision = '0018'
+branch_labels = None
+depends_on = None
+
+# File chunks stored a second copy of their blob's text (most of it twice, as
+# chunks overlap). They now keep only (start_offset, end_offset) into it, and
+# the text is sliced from the blob where it is needed.
+#
+# The search index can no longer be kept by triggers: one chunk's text means
+# slicing its whole blob, once per chunk. The app indexes a blob's chunks when
+# it creates them and unindexes them before deleting the blob
+# (SearchService.index_chunks and unindex_blobs). On SQLite, file_chunks_fts
+# keeps its entries and now reads snippets through a view slicing the blob, so
+# an FTS5 'rebuild' of it is slow on large files. On PostgreSQL
+# file_chunks.search_vector keeps its values but is no longer generated, which
+# needs PostgreSQL 13.
+
+# The stored format of app/core/compression.py, as frozen in revision 0011
+ZLIB_CODEC = b'\x01'
+MIN_BYTES = int(os.getenv('TEXT_COMPRESSION_MIN_BYTES', '1024'))
+LEVEL = int(os.getenv('TEXT_COMPRESSION_LEVEL', '6'))
+
+content_blobs = sa.table(
+    'content_blobs',
+    sa.column('id', sa.Integer),
+    sa.column('content'),
+)
+file_chunks = sa.table(
+    'file_chunks',
+    sa.column('id', sa.Integer),
+    sa.column('blob_id', sa.Integer),
+    sa.column('chunk_index', sa.Integer),
+    sa.column('content'),
+    sa.column('start_offset', sa.Integer),
+    sa.column('end_offset', sa.Integer),
+)
+
+
+def _compress_text(value):
+    if not isinstance(value, str) or MIN_BYTES <= 0:
+        return value
+    encoded = value.encode('utf-8')
+    if len(encoded) < MIN_BYTES:
+        return value
+    compressed = zlib.compress(encoded, LEVEL)
+    if len(compressed) + 1 >= len(encoded):
+        return value
+    return ZLIB_CODEC + compressed
+
+
+def _decompress_text(value):
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    if value[:1] != ZLIB_CODEC:
+        raise ValueError(f"Unknown text compression codec {value[:1]!r}")
+    return zlib.decompress(value[1:]).decode('utf-8')
+
+
+def _chunked_blobs(connection):
+    """(blob id, blob text) of every blob with chunks, one at a time"""
+    blob_ids = connection.execute(sa.select(file_chunks.c.blob_id).distinct()).scalars().all()
+    for blob_id in blob_ids:
+        text = connection.execute(
+            sa.select(content_blobs.c.content).where(content_blobs.c.id == blob_id)
+        ).scalar()
+        yield blob_id, _decompress_text(text) or ''
+
+
+def _find_offsets(connection) -> None:
+    for blob_id, text in _chunked_blobs(connection):
+        chunks = connection.execute(
+            sa.select(file_chunks.c.id, file_chunks.c.content)
+            .where(file_chunks.c.blob_id == blob_id)
+            .order_by(file_chunks.c.chunk_index)
+        ).all()
+        offsets = []
+        position = 0
+        for chunk_id, content in chunks:
+            content = _decompress_text(content)
+            # Chunks follow each other through the text, so each is found from the last
+            start = text.find(content, position)
+            if start == -1:
+                start = text.find(content)
+            if start == -1:
+                raise ValueError(f"Text of file chunk {chunk_id} is not in its blob {blob_id}")
+            offsets.append({'chunk_id': chunk_id, 'start_offset': start, 'end_offset': start + len(content)})
+            position = start
+        connection.execute(
+            file_chunks.update()
+            .where(file_chunks.c.id == sa.bindparam('chunk_id'))
+            .values(start_offset=sa.bindparam('start_offset'), end_offset=sa.bindparam('end_offset')),
+            offsets
+        )
+
+
+def _copy_text(connection) -> None:
+    sqlite = connection.dialect.name == 'sqlite'
+    for blob_id, text in _chunked_blobs(connection):
+        chunks = connection.execute(
+            sa.select(file_chunks.c.id, file_chunks.c.start_offset, file_chunks.c.end_offset)
+            .where(file_chunks.c.blob_id == blob_id)
+        ).all()
+        connection.execute(
+            file_chunks.update()
+            .where(file_chunks.c.id == sa.bindparam('chunk_id'))
+            .values(content=sa.bindparam('chunk_content')),
+            [
+                {
+                    'chunk_id': chunk_id,
+                    'chunk_content': _compress_text(text[start:end]) if sqlite else text[start:end],
+                } for chunk_id, start, end in chunks
+            ]
+        )
+
+
+def _drop_sqlite_view() -> None:
+    for trigger in ('insert', 'delete', 'update'):
+        op.execute(f"DROP TRIGGER IF EXISTS file_chunks_fts_{trigger}")
+    op.execute("DROP VIEW IF EXISTS file_chunks_search")
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    sqlite = connection.dialect.name == 'sqlite'
+    op.add_column('file_chunks', sa.Column('start_offset', sa.Integer(), nullable=True))
+    op.add_column('file_chunks', sa.Column('end_offset', sa.Integer(), nullable=True))
+    if sqlite:
+        _drop_sqlite_view()
+    else:
+        op.execute("ALTER TABLE file_chunks ALTER COLUMN search_vector DROP EXPRESSION")
+    
+    _find_offsets(connection)
+    with op.batch_alter_table('file_chunks') as batch_op:
+        batch_op.alter_column('start_offset', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('end_offset', existing_type=sa.Integer(), nullable=False)
+        batch_op.drop_column('content')
+    
+    if sqlite:
+        op.execute(
+            "CREATE VIEW file_chunks_search AS "
+            "SELECT file_chunks.id AS id, substr(decompress_text(content_blobs.content), "
+            "file_chunks.start_offset + 1, file_chunks.end_offset - file_chunks.start_offset) AS content "
+            "FROM file_chunks JOIN content_blobs ON content_blobs.id = file_chunks.blob_id"
+        )
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    sqlite = connection.dialect.name == 'sqlite'
+    op.add_column('file_chunks', sa.Column('content', sa.Text(), nullable=True))
+    if sqlite:
+        _drop_sqlite_view()
+    
+    _copy_text(connection)
+    with op.batch_alter_table('file_chunks') as batch_op:
+        batch_op.alter_column('content', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('end_offset')
+        batch_op.drop_column('start_offset')
+    
+    if sqlite:
+        # As in revision 0011; the FTS entries already hold this text
+        op.execute("CREATE VIEW file_chunks_search AS SELECT id, decompress_text(content) AS content FROM file_chunks")
+        op.execute(
+            "CREATE TRIGGER file_chunks_fts_insert AFTER INSERT ON file_chunks BEGIN "
+            "INSERT INTO file_chunks_fts(rowid, content) VALUES (new.id, decompress_text(new.content)); END"
+        )
+        op.execute(
+            "CREATE TRIGGER file_chunks_fts_delete AFTER DELETE ON file_chunks BEGIN "
+            "INSERT INTO file_chunks_fts(file_chunks_fts, rowid, content) "
+            "VALUES ('delete', old.id, decompress_text(old.content)); END"
+        )
+        op.execute(
+            "CREATE TRIGGER file_chunks_fts_update AFTER UPDATE OF content ON file_chunks BEGIN "
+            "INSERT INTO file_chunks_fts(file_chunks_fts, rowid, content) "
+            "VALUES ('delete', old.id, decompress_text(old.content)); "
+            "INSERT INTO file_chunks_fts(rowid, content) VALUES (new.id, decompress_text(new.content)); END"
+        )
+        return
+    
+    op.execute("DROP INDEX IF EXISTS ix_file_chunks_search_vector")
+    op.execute("ALTER TABLE file_chunks DROP COLUMN IF EXISTS search_vector")
+    op.execute(
+        "ALTER TABLE file_chunks ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED"
+    )
+    op.execute("CREATE INDEX ix_file_chunks_search_vector ON file_chunks USING gin (search_vector)")
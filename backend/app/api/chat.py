@@ -1,13 +1,29 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from ..core.database import get_db
-from ..models.chat import Chat, Message, FileUpload
-from ..schemas.chat import ChatCreate, ChatResponse, MessageCreate, MessageResponse, ChatList
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from sqlalchemy import delete, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional, Tuple
+from datetime import datetime
+from ..core.database import AsyncSessionLocal, get_async_db
+from ..models.chat import Chat, ChatArchive, Message, FileUpload, GenerationJob
+from ..schemas.chat import ChatCreate, ChatResponse, MessageCreate, MessageResponse, ChatList, GenerationJobResponse
 from ..services.ai_service import ai_service
-from ..services.file_service import FileService
+from ..services.chat_archive import ChatArchiver
+from ..services.chat_summary import chat_summary_scheduler
+from ..services.provider_scheduler import ProviderBusyError
+from ..services.retrieval_service import RetrievalService
+from ..services.content_store import ContentStore
+from ..services.file_context_cache import file_context_cache
+from ..services.stream_generation import ReplayExpiredError, StreamGeneration, stream_metrics, stream_registry
+from ..services.context_builder import ContextBuilder
+from ..services.generation_jobs import GenerationJobQueue, generation_worker, job_stream_id
+from ..core.config import settings
+from ..core.pagination import decode_cursor, encode_cursor
 from .files import router as files_router
+import asyncio
 import json
+import math
 
 router = APIRouter()
 
@@ -15,7 +31,7 @@ router = APIRouter()
 router.include_router(files_router, prefix="/api")
 
 @router.post("/chats", response_model=ChatResponse)
-def create_chat(chat: ChatCreate, db: Session = Depends(get_db)):
+async def create_chat(chat: ChatCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new chat"""
     db_chat = Chat(
         title=chat.title,
@@ -23,111 +39,211 @@ def create_chat(chat: ChatCreate, db: Session = Depends(get_db)):
         model_name=chat.model_name
     )
     db.add(db_chat)
-    db.commit()
-    db.refresh(db_chat)
+    await db.commit()
+    await db.refresh(db_chat)
     return db_chat
 
 @router.get("/chats", response_model=ChatList)
-def get_chats(
+async def get_chats(
     skip: int = 0, 
-    limit: int = 50,  # Increased from 20 to 50
-    db: Session = Depends(get_db)
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all chats with pagination"""
-    total = db.query(Chat).count()
-    # Use updated_at if available, otherwise use created_at for sorting
-    chats = db.query(Chat).order_by(
-        Chat.updated_at.desc().nullslast(),
-        Chat.created_at.desc()
-    ).offset(skip).limit(limit).all()
+    """Get chats, most recently updated first.
     
-    # Add message count to each chat
-    chats_with_counts = []
-    for chat in chats:
-        message_count = db.query(Message).filter(Message.chat_id == chat.id).count()
-        chat_dict = ChatResponse.model_validate(chat).model_dump()
-        chat_dict['message_count'] = message_count
-        chats_with_counts.append(chat_dict)
+    Pass the returned ``next_cursor`` as ``cursor`` to fetch the next page in
+    constant time; ``skip`` is only honoured when no cursor is given.
+    """
+    total = (await db.execute(select(func.count(Chat.id)))).scalar()
+    
+    ordering = (Chat.updated_at.desc(), Chat.id.desc())
+    page_query = select(Chat.id, Chat.updated_at)
+    if cursor:
+        updated_at, chat_id = decode_cursor(cursor)
+        page_query = page_query.filter(tuple_(Chat.updated_at, Chat.id) < tuple_(updated_at, chat_id))
+        skip = 0
+    # Fetch one extra row to know whether another page follows
+    page = page_query.order_by(*ordering).offset(skip).limit(limit + 1).subquery()
+    # Ordering by the page's columns makes it the outer loop, so only its chats are read
+    page_ordering = (page.c.updated_at.desc(), page.c.id.desc())
+    
+    # Count messages for the chats on this page in one grouped aggregate
+    message_counts = (
+        select(Message.chat_id, func.count(Message.id).label("message_count"))
+        .filter(Message.chat_id.in_(select(page.c.id)))
+        .group_by(Message.chat_id)
+        .subquery()
+    )
+    rows = (await db.execute(
+        select(
+            Chat,
+            func.coalesce(message_counts.c.message_count, 0) + func.coalesce(ChatArchive.message_count, 0)
+        ).join(
+            page, page.c.id == Chat.id
+        ).outerjoin(
+            message_counts, message_counts.c.chat_id == Chat.id
+        ).outerjoin(
+            ChatArchive, ChatArchive.chat_id == Chat.id
+        ).order_by(*page_ordering)
+    )).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_chat = rows[-1][0]
+        next_cursor = encode_cursor(last_chat.updated_at, last_chat.id)
+    
+    chats_with_counts = [
+        ChatResponse(
+            id=chat.id,
+            title=chat.title,
+            model_provider=chat.model_provider,
+            model_name=chat.model_name,
+            created_at=chat.created_at,
+            updated_at=chat.updated_at,
+            message_count=message_count
+        ) for chat, message_count in rows
+    ]
     
     return ChatList(
         chats=chats_with_counts,
         total=total,
         skip=skip,
-        limit=limit
+        limit=limit,
+        next_cursor=next_cursor
     )
 
-@router.get("/chats/{chat_id}", response_model=ChatResponse)
-def get_chat(chat_id: int, db: Session = Depends(get_db)):
-    """Get a specific chat"""
-    chat = db.query(Chat).filter(Chat.id == chat_id).first()
+async def _get_chat(db: AsyncSession, chat_id: int) -> Chat:
+    """Load a chat for a handler, restoring its messages and files if it is archived"""
+    chat = await db.get(Chat, chat_id)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
+    if chat.archived_at is not None:
+        await ChatArchiver.restore(db, chat_id)
+        await db.refresh(chat)
     return chat
 
+@router.get("/chats/{chat_id}", response_model=ChatResponse)
+async def get_chat(chat_id: int, db: AsyncSession = Depends(get_async_db)):
+    """Get a specific chat"""
+    return await _get_chat(db, chat_id)
+
 @router.delete("/chats/{chat_id}")
-def delete_chat(chat_id: int, db: Session = Depends(get_db)):
+async def delete_chat(chat_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a chat"""
-    chat = db.query(Chat).filter(Chat.id == chat_id).first()
-    if not chat:
+    blob_ids = (await db.execute(
+        select(FileUpload.blob_id).filter(FileUpload.chat_id == chat_id)
+    )).scalars().all()
+    # Archived files still hold their references; the archive itself cascades
+    blob_ids = list(blob_ids) + await ChatArchiver.archived_blob_ids(db, chat_id)
+    
+    # Messages, files and index entries are removed by ON DELETE CASCADE
+    deleted = (await db.execute(
+        delete(Chat).where(Chat.id == chat_id).returning(Chat.id)
+    )).scalar()
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Chat not found")
     
-    db.delete(chat)
-    db.commit()
+    # Drop the chat's references to stored file text once its files are gone
+    await ContentStore.release(db, blob_ids)
+    await db.commit()
+    file_context_cache.invalidate(chat_id)
     return {"message": "Chat deleted successfully"}
 
 @router.get("/chats/{chat_id}/messages", response_model=List[MessageResponse])
-def get_messages(chat_id: int, db: Session = Depends(get_db)):
-    """Get all messages for a chat"""
-    messages = db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.created_at).all()
-    return [MessageResponse.model_validate(msg) for msg in messages]
-
-@router.post("/chats/{chat_id}/messages", response_model=MessageResponse)
-def send_message(
-    chat_id: int, 
-    message: MessageCreate, 
-    db: Session = Depends(get_db)
+async def get_messages(
+    chat_id: int,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Send a message to the AI and get a response"""
-    # Get chat and validate
-    chat = db.query(Chat).filter(Chat.id == chat_id).first()
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
+    """Get the newest page of messages for a chat, in the order they were sent.
     
-    # Get uploaded files for context
-    files = db.query(FileUpload).filter(FileUpload.chat_id == chat_id).all()
-    file_context = ""
-    if files:
-        file_data = [
-            {
-                'original_filename': file.original_filename,
-                'file_type': file.file_type,
-                'content': file.content
-            } for file in files
-        ]
-        file_context = FileService.format_file_context(file_data)
+    When older messages exist, the cursor for them is returned in the
+    ``X-Next-Cursor`` response header; pass it as ``before`` to fetch the
+    page that precedes this one.
+    """
+    query = select(Message).options(undefer(Message.content)).filter(Message.chat_id == chat_id)
+    if before:
+        created_at, message_id = decode_cursor(before)
+        query = query.filter(tuple_(Message.created_at, Message.id) < tuple_(created_at, message_id))
+    else:
+        await ChatArchiver.restore_if_archived(db, chat_id)
+    # Fetch one extra row to know whether an older page exists
+    messages = (await db.execute(
+        query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+    )).scalars().all()
     
-    # Add file context to user message if files exist
-    user_content = message.content
-    if file_context:
-        user_content = f"{file_context}User Question: {message.content}"
+    if len(messages) > limit:
+        messages = messages[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(messages[-1].created_at, messages[-1].id)
+    
+    return [MessageResponse.model_validate(msg) for msg in reversed(messages)]
+
+async def _prepare_message(db: AsyncSession, chat: Chat, message: MessageCreate) -> Tuple[str, List[dict]]:
+    """Build the prompt for a new user message, store the message and update the chat.
+    
+    Returns the file context and the conversation history to send along
+    with the message.
+    """
+    # Get the uploaded file content relevant to this message
+    file_context = await RetrievalService.build_file_context(db, chat.id, message.content)
+    
+    # Recent conversation history that fits the model's token budget
+    history = await ContextBuilder.build_history(
+        db,
+        chat.id,
+        message.model_name,
+        file_context + message.content,
+        ai_service.max_tokens(message.deep_research_mode)
+    )
     
     # Save user message
     user_message = Message(
-        chat_id=chat_id,
+        chat_id=chat.id,
         role="user",
         content=message.content  # Save original message without context
     )
     db.add(user_message)
-    db.commit()
     
-    # Get AI response
+    # Update chat title if it's the first message
+    if not chat.title or chat.title == "New Chat":
+        chat.title = message.content[:50] + "..." if len(message.content) > 50 else message.content
+    
+    # Update chat's model provider and name if this is the first message
+    if not chat.model_provider or chat.model_provider == "openai":
+        chat.model_provider = message.model_provider
+        chat.model_name = message.model_name
+    
+    # Update chat's updated_at timestamp
+    chat.updated_at = datetime.utcnow()
+    await db.commit()
+    
+    return file_context, history
+
+@router.post("/chats/{chat_id}/messages", response_model=MessageResponse)
+async def send_message(
+    chat_id: int, 
+    message: MessageCreate, 
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Send a message to the AI and get a response"""
+    chat = await _get_chat(db, chat_id)
+    
+    file_context, history = await _prepare_message(db, chat, message)
+    
+    # Get AI response; the session holds no connection while waiting
     try:
-        ai_response = ai_service.get_response(
-            user_content,
+        ai_response = await ai_service.get_response(
+            message.content,
             message.model_provider,
             message.model_name,
             message.think_mode,
-            message.deep_research_mode
+            message.deep_research_mode,
+            history,
+            file_context
         )
         
         # Save AI response
@@ -137,113 +253,103 @@ def send_message(
             content=ai_response
         )
         db.add(ai_message)
-        
-        # Update chat title if it's the first message
-        if not chat.title or chat.title == "New Chat":
-            chat.title = message.content[:50] + "..." if len(message.content) > 50 else message.content
-        
-        # Update chat's model provider and name if this is the first message
-        if not chat.model_provider or chat.model_provider == "openai":
-            chat.model_provider = message.model_provider
-            chat.model_name = message.model_name
-        
-        # Update chat's updated_at timestamp
-        from datetime import datetime
         chat.updated_at = datetime.utcnow()
         
-        db.commit()
-        db.refresh(ai_message)
+        # Not refreshed: that would expire the deferred content just set
+        await db.commit()
+        chat_summary_scheduler.schedule(chat_id)
         
         return ai_message
-        
+    
+    except ProviderBusyError as e:
+        # Throttling is temporary; tell the client when to come back
+        await db.rollback()
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/chats/{chat_id}/messages/stream")
 async def stream_message(
     chat_id: int,
     message: MessageCreate,
-    request: Request,
-    db: Session = Depends(get_db)
+    request: Request
 ):
     """Stream a message response from the AI"""
-    from fastapi.responses import StreamingResponse
-    import asyncio
-    
-    # Get chat and validate
-    chat = db.query(Chat).filter(Chat.id == chat_id).first()
-    if not chat:
-        raise HTTPException(status_code=404, detail="Chat not found")
+    # Short-lived session for the writes before generation, so no connection
+    # is held while the response streams
+    async with AsyncSessionLocal() as db:
+        chat = await _get_chat(db, chat_id)
+        file_context, history = await _prepare_message(db, chat, message)
     
-    # Get uploaded files for context
-    files = db.query(FileUpload).filter(FileUpload.chat_id == chat_id).all()
-    file_context = ""
-    if files:
-        file_data = [
-            {
-                'original_filename': file.original_filename,
-                'file_type': file.file_type,
-                'content': file.content
-            } for file in files
-        ]
-        file_context = FileService.format_file_context(file_data)
-    
-    # Add file context to user message if files exist
-    user_content = message.content
-    if file_context:
-        user_content = f"{file_context}User Question: {message.content}"
-    
-    # Save user message
-    user_message = Message(
-        chat_id=chat_id,
-        role="user",
-        content=message.content  # Save original message without context
+    # Generation runs in its own task, which saves the answer and is
+    # cancelled once no client has been reading for the resume grace period
+    generation = StreamGeneration(
+        chat_id,
+        ai_service.get_streaming_response(
+            message.content,
+            message.model_provider,
+            message.model_name,
+            message.think_mode,
+            message.deep_research_mode,
+            history,
+            file_context
+        ),
+        message.model_name,
+        ai_service.max_tokens(message.deep_research_mode)
     )
-    db.add(user_message)
-    db.commit()
+    generation.start()
     
-    # Update chat title if it's the first message
-    if not chat.title or chat.title == "New Chat":
-        chat.title = message.content[:50] + "..." if len(message.content) > 50 else message.content
+    return _event_stream_response(_generation_events(generation, request), generation.id)
 
-    # Update chat's model provider and name if this is the first message
-    if not chat.model_provider or chat.model_provider == "openai":
-        chat.model_provider = message.model_provider
-        chat.model_name = message.model_name
+@router.get("/chats/{chat_id}/messages/stream/{stream_id}")
+async def resume_stream(
+    chat_id: int,
+    stream_id: str,
+    request: Request,
+    last_event_id: int = Header(0, alias="Last-Event-ID")
+):
+    """Resume a dropped message stream after the last event the client received"""
+    generation = stream_registry.get(stream_id)
+    if generation is None or generation.chat_id != chat_id:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    try:
+        generation.check_replay(last_event_id)
+    except ReplayExpiredError as e:
+        raise HTTPException(status_code=410, detail=str(e))
     
-    # Update chat's updated_at timestamp
-    from datetime import datetime
-    chat.updated_at = datetime.utcnow()
-    db.commit()
+    stream_metrics.resumed += 1
+    stream_metrics.replayed_events += len(generation.events_after(last_event_id))
+    return _event_stream_response(_generation_events(generation, request, last_event_id), generation.id)
+
+async def _generation_events(
+    generation: StreamGeneration,
+    request: Request,
+    after: int = 0
+) -> AsyncIterator[Tuple[int, dict]]:
+    """A generation's events for one reader, who keeps it alive while connected"""
+    generation.attach()
+    cursor = after
+    try:
+        async for event_id, event in generation.events(request.is_disconnected, after):
+            yield event_id, event
+            cursor = event_id
+    finally:
+        generation.detach(cursor)
+
+def _event_stream_response(events: AsyncIterator[Tuple[int, dict]], stream_id: str):
+    """Server-sent events, numbered so the client can resume"""
+    from fastapi.responses import StreamingResponse
     
     async def generate_stream():
-        try:
-            # Get streaming response from AI and accumulate content
-            accumulated_content = ""
-            async for chunk in ai_service.get_streaming_response(
-                user_content,
-                message.model_provider,
-                message.model_name,
-                message.think_mode,
-                message.deep_research_mode
-            ):
-                accumulated_content += chunk
-                yield f"data: {json.dumps({'content': chunk})}\n\n"
-            
-            # Save the accumulated AI response
-            ai_message = Message(
-                chat_id=chat_id,
-                role="assistant",
-                content=accumulated_content
-            )
-            db.add(ai_message)
-            db.commit()
-            
-            yield f"data: {json.dumps({'done': True})}\n\n"
-            
-        except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        # Closed explicitly so a reader detaches as soon as the response ends
+        async with aclosing(events):
+            async for event_id, event in events:
+                yield f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
     
     return StreamingResponse(
         generate_stream(),
@@ -252,5 +358,106 @@ async def stream_message(
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "Content-Type": "text/event-stream",
+            "X-Stream-Id": stream_id,
         }
-    ) 
\ No newline at end of file
+    )
+
+@router.post("/chats/{chat_id}/jobs", response_model=GenerationJobResponse, status_code=202)
+async def create_generation_job(
+    chat_id: int,
+    message: MessageCreate,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Queue a message for a generation worker; poll or stream the job for the answer"""
+    chat = await _get_chat(db, chat_id)
+    file_context, history = await _prepare_message(db, chat, message)
+    job = await GenerationJobQueue.enqueue(db, chat_id, message, history, file_context)
+    await db.commit()
+    generation_worker.notify()
+    
+    response.headers["Location"] = f"/api/chats/{chat_id}/jobs/{job.id}"
+    return GenerationJobResponse.model_validate(job)
+
+@router.get("/chats/{chat_id}/jobs/{job_id}", response_model=GenerationJobResponse)
+async def get_generation_job(
+    chat_id: int,
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a job's status and its answer so far"""
+    job = await db.get(GenerationJob, job_id)
+    if not job or job.chat_id != chat_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    result = GenerationJobResponse.model_validate(job)
+    if job.message_id is not None:
+        message = (await db.execute(
+            select(Message).options(undefer(Message.content)).filter(Message.id == job.message_id)
+        )).scalar()
+        if message:
+            result.message = MessageResponse.model_validate(message)
+            # A worker in this process has more than the last checkpoint
+            generation = stream_registry.get(job_stream_id(job.id))
+            if generation is not None and generation.generating:
+                result.message.content = "".join(generation.chunks)
+    return result
+
+@router.get("/chats/{chat_id}/jobs/{job_id}/stream")
+async def stream_generation_job(
+    chat_id: int,
+    job_id: int,
+    request: Request,
+    last_event_id: int = Header(0, alias="Last-Event-ID")
+):
+    """Stream a job's answer, resuming after Last-Event-ID"""
+    async with AsyncSessionLocal() as db:
+        job = await db.get(GenerationJob, job_id)
+    if not job or job.chat_id != chat_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return _event_stream_response(_job_events(job_id, request, last_event_id), job_stream_id(job_id))
+
+async def _job_events(job_id: int, request: Request, after: int) -> AsyncIterator[Tuple[int, dict]]:
+    """A job's events, live while a worker in this process runs it and from its checkpoints otherwise.
+    
+    Both use character offsets as event ids, so a client can move between them.
+    """
+    cursor = after
+    while True:
+        generation = stream_registry.get(job_stream_id(job_id))
+        if generation is not None:
+            try:
+                generation.check_replay(cursor)
+            except ReplayExpiredError:
+                generation = None
+        if generation is not None:
+            async with aclosing(_generation_events(generation, request, cursor)) as events:
+                async for event_id, event in events:
+                    yield event_id, event
+            return
+        
+        async with AsyncSessionLocal() as db:
+            job = await db.get(GenerationJob, job_id)
+            content = ""
+            if job is not None and job.message_id is not None:
+                content = (await db.execute(
+                    select(Message.content).filter(Message.id == job.message_id)
+                )).scalar() or ""
+        if job is None:
+            yield cursor, {"error": "Job not found"}
+            return
+        
+        if len(content) > cursor:
+            yield len(content), {"content": content[cursor:]}
+            cursor = len(content)
+        if job.status == "completed":
+            yield cursor + 1, {"done": True}
+            return
+        if job.status == "failed":
+            yield cursor + 1, {"error": job.error}
+            return
+        
+        await asyncio.sleep(settings.generation_job_poll_seconds)
+        if await request.is_disconnected():
+            return 
\ No newline at end of file
@@ -1,11 +1,17 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import uuid
 import os
-from ..core.database import get_db
+from ..core.database import get_async_db
 from ..models.chat import FileUpload as FileUploadModel
+from ..services.chat_archive import ChatArchiver
 from ..services.file_service import FileService
+from ..services.retrieval_service import RetrievalService
+from ..services.content_store import ContentStore
+from ..services.file_context_cache import file_context_cache
 from ..schemas.file import FileUploadResponse, FileUploadList
 
 router = APIRouter()
@@ -14,12 +20,30 @@ router = APIRouter()
 async def upload_file(
     chat_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload a file to a chat for context"""
     try:
-        # Extract text content from file
-        content = await FileService.extract_text_from_file(file)
+        # Before any extraction or blob work
+        if not await ChatArchiver.restore_if_archived(db, chat_id):
+            raise HTTPException(status_code=404, detail="Chat not found")
+        await FileService.validate_file(file)
+        file_type = FileService.get_file_type(file.filename)
+        
+        # Stream the upload to disk, hashing it on the way
+        temp_file_path, sha256 = await FileService.save_upload_to_temp_file(file)
+        try:
+            # Identical uploads reuse the stored text and skip extraction
+            content = None
+            blob = await ContentStore.get_by_hash(db, sha256)
+            if blob is None:
+                content = await FileService.extract_text(temp_file_path, file_type)
+                blob = await ContentStore.create(db, sha256, content)
+        finally:
+            # Clean up temporary file
+            os.unlink(temp_file_path)
+        
+        await ContentStore.add_reference(db, blob.id)
         
         # Generate unique filename
         file_extension = os.path.splitext(file.filename)[1]
@@ -30,14 +54,18 @@ async def upload_file(
             chat_id=chat_id,
             filename=unique_filename,
             original_filename=file.filename,
-            file_type=FileService.get_file_type(file.filename),
-            file_size=len(content),
-            content=content
+            file_type=file_type,
+            file_size=blob.size,
+            blob_id=blob.id
         )
         
         db.add(file_upload)
-        db.commit()
-        db.refresh(file_upload)
+        await db.flush()
+        
+        # Chunk and index the text for retrieval
+        await RetrievalService.index_file(db, blob.id, content)
+        await db.commit()
+        file_context_cache.invalidate(chat_id)
         
         return FileUploadResponse(
             id=file_upload.id,
@@ -47,18 +75,37 @@ async def upload_file(
             file_size=file_upload.file_size,
             created_at=file_upload.created_at
         )
-        
+    
+    except HTTPException:
+        await db.rollback()
+        raise
+    except IntegrityError:
+        # The chat was deleted while the file was processed
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Chat not found")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/chats/{chat_id}/files", response_model=FileUploadList)
 async def get_chat_files(
     chat_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all files uploaded to a chat"""
-    files = db.query(FileUploadModel).filter(FileUploadModel.chat_id == chat_id).all()
+    await ChatArchiver.restore_if_archived(db, chat_id)
+    
+    # Metadata columns only; the file text stays in the database
+    files = (await db.execute(
+        select(
+            FileUploadModel.id,
+            FileUploadModel.filename,
+            FileUploadModel.original_filename,
+            FileUploadModel.file_type,
+            FileUploadModel.file_size,
+            FileUploadModel.created_at
+        ).filter(FileUploadModel.chat_id == chat_id)
+    )).all()
     
     return FileUploadList(
         files=[
@@ -77,18 +124,22 @@ async def get_chat_files(
 async def delete_file(
     chat_id: int,
     file_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a file from a chat"""
-    file = db.query(FileUploadModel).filter(
-        FileUploadModel.id == file_id,
-        FileUploadModel.chat_id == chat_id
-    ).first()
+    await ChatArchiver.restore_if_archived(db, chat_id)
+    
+    blob_id = (await db.execute(
+        delete(FileUploadModel)
+        .where(FileUploadModel.id == file_id, FileUploadModel.chat_id == chat_id)
+        .returning(FileUploadModel.blob_id)
+    )).scalar()
     
-    if not file:
+    if blob_id is None:
         raise HTTPException(status_code=404, detail="File not found")
     
-    db.delete(file)
-    db.commit()
+    await ContentStore.release(db, [blob_id])
+    await db.commit()
+    file_context_cache.invalidate(chat_id)
     
     return {"message": "File deleted successfully"} 
\ No newline at end of file
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from ..core.database import get_async_db
+from ..schemas.search import SearchResults
+from ..services.search_service import SearchService
+
+router = APIRouter()
+
+@router.get("/search", response_model=SearchResults)
+async def search(
+    q: str = Query(..., min_length=1, max_length=500),
+    chat_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Search messages and uploaded file text, best matches first.
+    
+    Restrict to one chat with ``chat_id``; pass ``next_skip`` as ``skip`` for
+    the next page.
+    """
+    results, has_more = await SearchService.search(db, q, chat_id, skip, limit)
+    return SearchResults(
+        results=results,
+        query=q,
+        skip=skip,
+        limit=limit,
+        next_skip=skip + limit if has_more else None
+    )
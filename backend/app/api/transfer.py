@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional
+from ..core.database import AsyncSessionLocal
+from ..services.chat_transfer import ChatTransfer
+
+router = APIRouter()
+
+async def _export_stream(chat_ids: Optional[List[int]], compress: bool) -> AsyncIterator[bytes]:
+    # Own session: the response body is produced after the endpoint has returned
+    async with AsyncSessionLocal() as db:
+        async for data in ChatTransfer.encode_ndjson(ChatTransfer.export_records(db, chat_ids), compress):
+            yield data
+
+@router.get("/export")
+async def export_chats(
+    chat_id: Optional[List[int]] = Query(None),
+    compress: bool = False
+):
+    """Stream all chats (or the given ``chat_id`` values) as NDJSON, gzipped with ``compress``"""
+    filename = "chats.ndjson.gz" if compress else "chats.ndjson"
+    return StreamingResponse(
+        _export_stream(chat_id, compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/import")
+async def import_chats(request: Request):
+    """Import an NDJSON export from the request body, plain or gzipped, as new chats.
+    
+    Batches are committed as they are written; after an error the batches
+    before it stay imported.
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            return await ChatTransfer.import_records(db, ChatTransfer.decode_ndjson(request.stream()))
+        except ValueError as e:  # ImportFormatError, or a malformed value
+            await db.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,67 @@
+"""Archive inactive chats or restore archived ones against DATABASE_URL.
+
+    python -m app.archive run [--inactive-for SECONDS]
+    python -m app.archive restore (--all | --chat-id ID ...)
+
+The API process archives chats by itself every CHAT_ARCHIVE_INTERVAL; "run"
+does the same once, e.g. from cron when CHAT_ARCHIVE_AFTER=0 turns the
+in-process archiver off. Restore every chat before downgrading past the
+revision that added archives.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from sqlalchemy import select
+from .core.config import settings
+from .core.database import AsyncSessionLocal, async_engine
+from .core.migrations import run_migrations
+from .models.chat import Chat
+from .services.chat_archive import ChatArchiver
+
+async def restore(chat_ids) -> int:
+    restored = 0
+    async with AsyncSessionLocal() as db:
+        if not chat_ids:
+            chat_ids = (await db.execute(
+                select(Chat.id).filter(Chat.archived_at.is_not(None))
+            )).scalars().all()
+    for chat_id in chat_ids:
+        async with AsyncSessionLocal() as db:
+            restored += await ChatArchiver.restore(db, chat_id)
+    return restored
+
+async def run(args) -> int:
+    try:
+        started = time.perf_counter()
+        if args.command == "run":
+            inactive_for = args.inactive_for if args.inactive_for is not None else settings.chat_archive_after
+            if inactive_for <= 0:
+                print("Set --inactive-for or CHAT_ARCHIVE_AFTER to a positive age", file=sys.stderr)
+                return 1
+            count = await ChatArchiver.archive_inactive(inactive_for)
+            action = "Archived"
+        else:
+            count = await restore(args.chat_id)
+            action = "Restored"
+        print(f"{action} {count} chats in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        return 0
+    finally:
+        await async_engine.dispose()
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="archive chats that have been inactive long enough")
+    run_parser.add_argument("--inactive-for", type=float, help="seconds; defaults to CHAT_ARCHIVE_AFTER")
+    restore_parser = commands.add_parser("restore", help="move archived chats back into the primary tables")
+    targets = restore_parser.add_mutually_exclusive_group(required=True)
+    targets.add_argument("--all", action="store_true")
+    targets.add_argument("--chat-id", type=int, action="append", help="repeatable")
+    args = parser.parse_args()
+    
+    run_migrations()
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+import zlib
+from typing import Union
+from .config import settings
+
+# First byte of a stored compressed value, naming its codec
+ZLIB_CODEC = b"\x01"
+
+def compress_text(value: str, min_bytes: int = None, level: int = None) -> Union[str, bytes]:
+    """The stored form of ``value``: compressed bytes when that is worth it, else the text itself"""
+    min_bytes = settings.text_compression_min_bytes if min_bytes is None else min_bytes
+    # A character is at most four bytes, so most short text is passed over without encoding it
+    if min_bytes <= 0 or len(value) * 4 < min_bytes:
+        return value
+    encoded = value.encode("utf-8")
+    if len(encoded) < min_bytes:
+        return value
+    compressed = zlib.compress(encoded, settings.text_compression_level if level is None else level)
+    if len(compressed) + 1 >= len(encoded):
+        return value
+    return ZLIB_CODEC + compressed
+
+def decompress_text(value: Union[str, bytes, None]) -> Union[str, None]:
+    """Text from its stored form; plain text passes through unchanged"""
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    if value[:1] != ZLIB_CODEC:
+        raise ValueError(f"Unknown text compression codec {value[:1]!r}")
+    return zlib.decompress(value[1:]).decode("utf-8")
@@ -4,10 +4,110 @@ import os
 class Settings(BaseSettings):
     # Database configuration
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./chat.db")
+    # Async driver URL for request handlers; derived from database_url when empty
+    async_database_url: str = os.getenv("ASYNC_DATABASE_URL", "")
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    # "true", "false", or "sqlite" to migrate only SQLite databases at startup, for
+    # deployments that migrate PostgreSQL in a release step (see fly.toml)
+    run_migrations_on_startup: str = os.getenv("RUN_MIGRATIONS_ON_STARTUP", "true").lower()
+    # Large message and file text is stored zlib-compressed on SQLite (0 disables)
+    text_compression_min_bytes: int = int(os.getenv("TEXT_COMPRESSION_MIN_BYTES", "1024"))
+    text_compression_level: int = int(os.getenv("TEXT_COMPRESSION_LEVEL", "6"))
     
     # API Keys
     openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
     
+    # AI provider client configuration
+    openai_base_url: str = os.getenv("OPENAI_BASE_URL", "")
+    xai_base_url: str = os.getenv("XAI_BASE_URL", "")
+    ai_max_connections: int = int(os.getenv("AI_MAX_CONNECTIONS", "500"))
+    ai_max_keepalive_connections: int = int(os.getenv("AI_MAX_KEEPALIVE_CONNECTIONS", "100"))
+    ai_request_timeout: float = float(os.getenv("AI_REQUEST_TIMEOUT", "120"))
+    
+    # Admission control per provider and model (0 disables a rate limit).
+    # AI_LANE_LIMITS overrides them per "provider" or "provider:model" as JSON, e.g.
+    # {"openai:gpt-4o": {"max_in_flight": 8, "requests_per_minute": 500, "tokens_per_minute": 30000}}
+    ai_max_in_flight: int = int(os.getenv("AI_MAX_IN_FLIGHT", "32"))
+    ai_requests_per_minute: float = float(os.getenv("AI_REQUESTS_PER_MINUTE", "0"))
+    ai_tokens_per_minute: float = float(os.getenv("AI_TOKENS_PER_MINUTE", "0"))
+    ai_lane_limits: str = os.getenv("AI_LANE_LIMITS", "")
+    ai_queue_timeout: float = float(os.getenv("AI_QUEUE_TIMEOUT", "30"))
+    # Retries of throttled or failed provider calls, with jittered exponential backoff
+    ai_max_retries: int = int(os.getenv("AI_MAX_RETRIES", "3"))
+    ai_retry_base_delay: float = float(os.getenv("AI_RETRY_BASE_DELAY", "1"))
+    ai_retry_max_delay: float = float(os.getenv("AI_RETRY_MAX_DELAY", "30"))
+    
+    # Failover between providers. AI_FALLBACK_ROUTES maps "provider:model" (or
+    # "provider") to a fallback "provider:model" as JSON, e.g.
+    # {"openai:gpt-4o": "xai:grok-2", "xai": "openai:gpt-4o-mini"}.
+    # With AI_HEDGE_AFTER > 0, a hedge request goes to the fallback when the
+    # primary has produced no first token after that many seconds.
+    ai_fallback_routes: str = os.getenv("AI_FALLBACK_ROUTES", "")
+    ai_hedge_after: float = float(os.getenv("AI_HEDGE_AFTER", "0"))
+    ai_breaker_failure_threshold: int = int(os.getenv("AI_BREAKER_FAILURE_THRESHOLD", "5"))
+    ai_breaker_reset_timeout: float = float(os.getenv("AI_BREAKER_RESET_TIMEOUT", "30"))
+    
+    # SSE coalescing: flush buffered deltas by size or time window
+    stream_flush_chars: int = int(os.getenv("STREAM_FLUSH_CHARS", "256"))
+    stream_flush_interval_ms: int = int(os.getenv("STREAM_FLUSH_INTERVAL_MS", "50"))
+    # How often an idle stream checks whether its client is still connected
+    stream_disconnect_poll_ms: int = int(os.getenv("STREAM_DISCONNECT_POLL_MS", "250"))
+    # Resumable streams: events kept for replay, how long a generation keeps
+    # running without a reader, and how often the partial answer is saved
+    stream_replay_buffer_events: int = int(os.getenv("STREAM_REPLAY_BUFFER_EVENTS", "1024"))
+    stream_resume_grace_seconds: float = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "15"))
+    stream_checkpoint_interval_seconds: float = float(os.getenv("STREAM_CHECKPOINT_INTERVAL_SECONDS", "5"))
+    
+    # Background generation jobs: worker loops in this process (0 to leave
+    # jobs to `python -m app.worker`), how often idle workers look for jobs
+    # from other processes and clean up finished ones, and how long a job may
+    # run before it is retried
+    generation_workers: int = int(os.getenv("GENERATION_WORKERS", "2"))
+    generation_job_poll_seconds: float = float(os.getenv("GENERATION_JOB_POLL_SECONDS", "2"))
+    generation_job_sweep_seconds: float = float(os.getenv("GENERATION_JOB_SWEEP_SECONDS", "300"))
+    generation_job_timeout: float = float(os.getenv("GENERATION_JOB_TIMEOUT", "600"))
+    generation_job_max_attempts: int = int(os.getenv("GENERATION_JOB_MAX_ATTEMPTS", "3"))
+    generation_job_retention: float = float(os.getenv("GENERATION_JOB_RETENTION", "86400"))
+    
+    # Chats not updated for this many seconds have their messages and files moved
+    # to compact archives, restored when the chat is next opened (0 disables)
+    chat_archive_after: float = float(os.getenv("CHAT_ARCHIVE_AFTER", str(7 * 86400)))
+    chat_archive_interval: float = float(os.getenv("CHAT_ARCHIVE_INTERVAL", "3600"))
+    chat_archive_batch_size: int = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", "100"))
+    
+    # Conversation history sent with each message
+    history_token_budget: int = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+    history_batch_size: int = int(os.getenv("HISTORY_BATCH_SIZE", "20"))
+    # Older messages are sent as a rolling summary, extended in the background once
+    # CHAT_SUMMARY_EVERY assistant messages are unsummarized (0 disables). The newest
+    # CHAT_SUMMARY_KEEP_MESSAGES are always sent verbatim. CHAT_SUMMARY_MODEL is a
+    # "provider:model" to write summaries with; empty uses the chat's own model.
+    chat_summary_every: int = int(os.getenv("CHAT_SUMMARY_EVERY", "10"))
+    chat_summary_keep_messages: int = int(os.getenv("CHAT_SUMMARY_KEEP_MESSAGES", "6"))
+    chat_summary_max_tokens: int = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "600"))
+    chat_summary_model: str = os.getenv("CHAT_SUMMARY_MODEL", "")
+    chat_summary_concurrency: int = int(os.getenv("CHAT_SUMMARY_CONCURRENCY", "2"))
+    
+    # Retrieval over uploaded files
+    retrieval_chunk_chars: int = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1500"))
+    retrieval_chunk_overlap: int = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "200"))
+    retrieval_top_k: int = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+    retrieval_full_context_chars: int = int(os.getenv("RETRIEVAL_FULL_CONTEXT_CHARS", "12000"))
+    # Memory bound of the in-process cache of formatted file context
+    file_context_cache_bytes: int = int(os.getenv("FILE_CONTEXT_CACHE_BYTES", str(32 * 1024 * 1024)))
+    
+    # Opt-in completion cache for identical requests: "" (off), "memory" or "database"
+    completion_cache_backend: str = os.getenv("COMPLETION_CACHE_BACKEND", "")
+    completion_cache_ttl: float = float(os.getenv("COMPLETION_CACHE_TTL", "3600"))
+    completion_cache_max_entries: int = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "1000"))
+    
+    # Document text extraction process pool
+    extraction_workers: int = int(os.getenv("EXTRACTION_WORKERS", "2"))
+    extraction_max_pending: int = int(os.getenv("EXTRACTION_MAX_PENDING", "8"))
+    extraction_timeout: float = float(os.getenv("EXTRACTION_TIMEOUT", "120"))
+    extraction_queue_timeout: float = float(os.getenv("EXTRACTION_QUEUE_TIMEOUT", "30"))
+    
     # Server configuration
     host: str = "0.0.0.0"
     port: int = int(os.getenv("PORT", "8000"))
@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from .compression import decompress_text
 from .config import settings
+from .metrics import instrument_engine
 import os
 
 # Handle PostgreSQL URL format for Fly.io
@@ -9,12 +12,37 @@ database_url = settings.database_url
 if database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
 
+
+def get_async_database_url(url: str) -> str:
+    """Map a sync database URL onto its async driver (aiosqlite / asyncpg)"""
+    scheme, _, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    if dialect == "postgresql":
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
+async_database_url = settings.async_database_url or get_async_database_url(database_url)
+
 # Create engine with appropriate settings
 if "sqlite" in database_url:
     engine = create_engine(
         database_url,
         connect_args={"check_same_thread": False}
     )
+    async_engine = create_async_engine(async_database_url)
+    
+    # SQLite only enforces foreign keys (and ON DELETE CASCADE) when asked to, per connection
+    @event.listens_for(engine, "connect")
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+        # Compressed text columns are read back in SQL by the full-text index (revision 0011)
+        dbapi_connection.create_function("decompress_text", 1, decompress_text, deterministic=True)
 else:
     # PostgreSQL configuration
     engine = create_engine(
@@ -22,9 +50,27 @@ else:
         pool_pre_ping=True,
         pool_recycle=300,
     )
+    async_engine = create_async_engine(
+        async_database_url,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+    )
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
 
+# Sync sessions for migrations and scripts; request handlers use AsyncSessionLocal
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
@@ -33,4 +79,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+# Default latency buckets in seconds, from 5ms to 60s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+class Counter:
+    """Monotonically increasing value per label set"""
+    type = "counter"
+    
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[LabelValues, float] = {}
+    
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+    
+    def set(self, value: float, *labels: str) -> None:
+        """Copy in a total that is counted elsewhere"""
+        self.values[labels] = value
+    
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Gauge:
+    """Value per label set that can go up and down"""
+    type = "gauge"
+    
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[LabelValues, float] = {}
+    
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+    
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set.
+    
+    Observing is a bisect and two additions, so it is cheap enough for
+    every request and query.
+    """
+    type = "histogram"
+    
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last one is +Inf), sum]
+        self.values: Dict[LabelValues, list] = {}
+    
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+    
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+class MetricsRegistry:
+    """In-process metrics rendered in the Prometheus text format.
+    
+    Collectors are called at scrape time to refresh gauges from state
+    that is already tracked elsewhere, such as queue depths.
+    """
+    
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: List[Callable[[], None]] = []
+    
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+    
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+    
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+    
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+    
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self.collectors.append(collector)
+    
+    def render(self) -> str:
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+# Global instance
+metrics = MetricsRegistry()
+
+class EventLoopLagMonitor:
+    """Measures how late the event loop wakes a task that sleeps ``interval``"""
+    
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.lag = metrics.histogram(
+            "event_loop_lag_seconds",
+            "Delay of the event loop in waking a sleeping task",
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+        )
+    
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+    
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag.observe(max(time.perf_counter() - started - self.interval, 0.0))
+
+REQUEST_DURATION = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, including streaming its body",
+    ("method", "route", "status")
+)
+REQUEST_QUERIES = metrics.histogram(
+    "http_request_db_queries",
+    "Database statements executed per request",
+    ("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+DB_QUERY_DURATION = metrics.histogram(
+    "db_query_duration_seconds",
+    "Database statement execution time",
+    ("operation",)
+)
+
+# Statement counter of the request being handled, if any
+current_request_queries: ContextVar[Optional[list]] = ContextVar("current_request_queries", default=None)
+
+class MetricsMiddleware:
+    """Records latency and database statements per route template"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        started = time.perf_counter()
+        queries = [0]
+        token = current_request_queries.set(queries)
+        status = 500
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_request_queries.reset(token)
+            # The matched route's template, so ids in paths don't multiply the series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], route, str(status))
+            REQUEST_QUERIES.observe(queries[0], scope["method"], route)
+
+def instrument_engine(engine) -> None:
+    """Time every statement an engine executes and count it against the current request"""
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started_at = time.perf_counter()
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def record_query(conn, cursor, statement, parameters, context, executemany):
+        started_at = getattr(context, "_metrics_started_at", None)
+        if started_at is not None:
+            operation = statement.lstrip(" (\n").split(None, 1)[0].lower() if statement.strip() else "unknown"
+            DB_QUERY_DURATION.observe(time.perf_counter() - started_at, operation)
+        queries = current_request_queries.get()
+        if queries is not None:
+            queries[0] += 1
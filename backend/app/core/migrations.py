@@ -0,0 +1,71 @@
+import os
+import argparse
+import logging
+from sqlalchemy import inspect
+from .config import settings
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(__file__), "..", "..", "alembic.ini")
+
+
+def get_alembic_config():
+    """Alembic configuration that works regardless of the working directory"""
+    # Imported here: the API process only needs alembic when it migrates itself
+    from alembic.config import Config
+    
+    config = Config(ALEMBIC_INI)
+    config.set_main_option(
+        "script_location",
+        os.path.join(os.path.dirname(ALEMBIC_INI), "alembic")
+    )
+    return config
+
+
+def _legacy_revision(inspector) -> str:
+    """Revision matching a database created by create_all before migrations existed"""
+    if not inspector.has_table("file_chunks"):
+        return "0001"
+    chat_indexes = {index["name"] for index in inspector.get_indexes("chats")}
+    if "ix_chats_updated_at_id" not in chat_indexes:
+        return "0002"
+    return "0003"
+
+
+def run_migrations() -> None:
+    """Upgrade the database schema to the latest revision"""
+    from alembic import command
+    
+    config = get_alembic_config()
+    
+    inspector = inspect(engine)
+    if inspector.has_table("chats") and not inspector.has_table("alembic_version"):
+        revision = _legacy_revision(inspector)
+        logger.info(f"Stamping existing database at revision {revision}")
+        command.stamp(config, revision)
+    
+    command.upgrade(config, "head")
+
+
+def migrate_on_startup() -> bool:
+    """Whether the API process applies pending migrations when it starts"""
+    if settings.run_migrations_on_startup == "sqlite":
+        return engine.dialect.name == "sqlite"
+    return settings.run_migrations_on_startup == "true"
+
+
+if __name__ == "__main__":
+    # Release step: python -m app.core.migrations --skip-sqlite
+    parser = argparse.ArgumentParser(description="Upgrade the database schema to the latest revision")
+    parser.add_argument(
+        "--skip-sqlite",
+        action="store_true",
+        help="do nothing for SQLite, whose file is only on the app machines and migrated at startup"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.skip_sqlite and engine.dialect.name == "sqlite":
+        logger.info("SQLite database: migrations are left to the app's startup")
+    else:
+        run_migrations()
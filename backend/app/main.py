@@ -1,24 +1,33 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import text
+from typing import Optional
 from .api.chat import router as chat_router
 from .api.files import router as files_router
-from .core.database import engine, Base
+from .api.search import router as search_router
+from .api.transfer import router as transfer_router
 from .core.config import settings
-from .models import chat as chat_models  # Import models to register them
+from .core.database import async_engine
+from .core.metrics import EventLoopLagMonitor, MetricsMiddleware, metrics
+from .core.migrations import migrate_on_startup, run_migrations
+from .services.ai_service import ai_service
+from .services.completion_cache import completion_cache
+from .services.provider_router import provider_router
+from .services.provider_scheduler import provider_scheduler
+from .services.stream_generation import stream_metrics
+from .services.generation_jobs import generation_worker
+from .services.chat_archive import chat_archive_worker
+from .services.chat_summary import chat_summary_scheduler
+from .services.file_service import FileService
+from .services.context_builder import get_token_counter
+import asyncio
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create database tables with error handling
-try:
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created successfully")
-except Exception as e:
-    logger.error(f"Failed to create database tables: {e}")
-    # Don't fail the app startup, let it continue
-
 app = FastAPI(title="AI Chat API", version="1.0.0")
 
 # Configure CORS
@@ -28,11 +37,84 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After", "X-Stream-Id"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(chat_router, prefix="/api")
 app.include_router(files_router, prefix="/api")
+app.include_router(search_router, prefix="/api")
+app.include_router(transfer_router, prefix="/api")
+
+@app.on_event("startup")
+def startup():
+    # Apply database migrations with error handling
+    if migrate_on_startup():
+        try:
+            run_migrations()
+            logger.info("Database migrations applied successfully")
+        except Exception as e:
+            logger.error(f"Failed to apply database migrations: {e}")
+            # Don't fail the app startup, let it continue
+
+# Gauges and totals that are already tracked by the services, refreshed on scrape
+PROVIDER_IN_FLIGHT = metrics.gauge("ai_provider_in_flight", "Provider requests holding a slot", ("lane",))
+PROVIDER_QUEUE_DEPTH = metrics.gauge("ai_provider_queue_depth", "Provider requests waiting for a slot", ("lane",))
+STREAMS_TOTAL = metrics.counter("streams_total", "Streamed generations by outcome", ("outcome",))
+STREAM_TOKENS_SAVED = metrics.counter(
+    "stream_tokens_saved_total",
+    "Estimated completion tokens not generated because the client left"
+)
+JOBS_BUSY = metrics.gauge("generation_jobs_running", "Generation jobs running in this process")
+JOBS_TOTAL = metrics.counter("generation_jobs_total", "Generation jobs finished in this process", ("outcome",))
+CACHE_LOOKUPS = metrics.counter("completion_cache_lookups_total", "Completion cache lookups", ("result",))
+
+def collect_service_metrics() -> None:
+    for lane in provider_scheduler.lanes.values():
+        PROVIDER_IN_FLIGHT.set(lane.in_flight, lane.name)
+        PROVIDER_QUEUE_DEPTH.set(len(lane.queue), lane.name)
+    for outcome in ("started", "completed", "failed", "abandoned", "resumed"):
+        STREAMS_TOTAL.set(getattr(stream_metrics, outcome), outcome)
+    STREAM_TOKENS_SAVED.set(stream_metrics.tokens_saved)
+    JOBS_BUSY.set(generation_worker.busy)
+    JOBS_TOTAL.set(generation_worker.completed, "completed")
+    JOBS_TOTAL.set(generation_worker.failed, "failed")
+    CACHE_LOOKUPS.set(completion_cache.hits, "hit")
+    CACHE_LOOKUPS.set(completion_cache.misses, "miss")
+
+metrics.add_collector(collect_service_metrics)
+event_loop_lag_monitor = EventLoopLagMonitor()
+
+# Background warm-up; /ready reports ready once it has finished
+warmup_task: Optional[asyncio.Task] = None
+
+async def warm_up() -> None:
+    """Do the slow first-use work before the first request pays for it"""
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+    # Off the event loop, so the server answers while modules load
+    await asyncio.to_thread(ai_service.load_clients)
+    await asyncio.to_thread(get_token_counter, "gpt-3.5-turbo")
+    logger.info("Warm-up finished")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    global warmup_task
+    warmup_task = asyncio.create_task(warm_up())
+    generation_worker.start()
+    chat_archive_worker.start()
+    event_loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await event_loop_lag_monitor.stop()
+    await chat_archive_worker.stop()
+    await chat_summary_scheduler.stop()
+    await generation_worker.stop()
+    await ai_service.aclose()
+    FileService.shutdown_executor()
 
 @app.get("/")
 def read_root():
@@ -40,4 +122,36 @@ def read_root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "ai-chat-api"} 
\ No newline at end of file
+    return {"status": "healthy", "service": "ai-chat-api"}
+
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """Ready once the database answered and slow imports are loaded"""
+    global warmup_task
+    if warmup_task is None or not warmup_task.done():
+        response.status_code = 503
+        return {"status": "starting"}
+    
+    error = warmup_task.exception() if not warmup_task.cancelled() else "cancelled"
+    if error:
+        # Try again, e.g. once the database is reachable
+        warmup_task = asyncio.create_task(warm_up())
+        response.status_code = 503
+        return {"status": "unavailable", "error": str(error)}
+    return {"status": "ready"}
+
+@app.get("/stats")
+async def stats():
+    """Cache counters, provider queue depths and wait times, routing, stream and job outcomes"""
+    return {
+        "completion_cache": await completion_cache.stats(),
+        "providers": provider_scheduler.stats(),
+        "routing": provider_router.stats(),
+        "streams": stream_metrics.stats(),
+        "jobs": generation_worker.stats()
+    } 
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint for this process"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index, LargeBinary
+from sqlalchemy.orm import deferred, relationship
+from sqlalchemy.sql import false
 from datetime import datetime
 from ..core.database import Base
+from .types import CompressedText
 
 class Chat(Base):
     __tablename__ = "chats"
@@ -12,31 +14,168 @@ class Chat(Base):
     model_name = Column(String, default="gpt-3.5-turbo")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Set while the chat's messages and files are moved out to chat_archives
+    archived_at = Column(DateTime, nullable=True)
+    # When the chat was last restored from its archive; counts as activity for the archiver
+    restored_at = Column(DateTime, nullable=True)
     
-    messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan")
-    files = relationship("FileUpload", back_populates="chat", cascade="all, delete-orphan")
+    # Rows are removed by ON DELETE CASCADE rather than loaded and deleted one by one
+    messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan", passive_deletes=True)
+    files = relationship("FileUpload", back_populates="chat", cascade="all, delete-orphan", passive_deletes=True)
+    
+    __table_args__ = (
+        Index("ix_chats_updated_at_id", "updated_at", "id"),  # Keyset pagination
+    )
 
 class Message(Base):
     __tablename__ = "messages"
     
     id = Column(Integer, primary_key=True, index=True)
-    chat_id = Column(Integer, ForeignKey("chats.id"))
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"))
     role = Column(String, nullable=False)  # "user" or "assistant"
-    content = Column(Text, nullable=False)
+    content = deferred(Column(CompressedText, nullable=False))  # Loaded with undefer() where needed
+    truncated = Column(Boolean, nullable=False, default=False, server_default=false())  # Generation stopped early
     created_at = Column(DateTime, default=datetime.utcnow)
     
     chat = relationship("Chat", back_populates="messages")
+    
+    __table_args__ = (
+        # Serves chat_id lookups, (chat_id, created_at) ordering and keyset pagination
+        Index("ix_messages_chat_id_created_at_id", "chat_id", "created_at", "id"),
+        # Ids are never handed out again, so archived rows get theirs back on restore
+        {"sqlite_autoincrement": True},
+    )
 
 class FileUpload(Base):
     __tablename__ = "file_uploads"
     
     id = Column(Integer, primary_key=True, index=True)
-    chat_id = Column(Integer, ForeignKey("chats.id"))
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), index=True)
     filename = Column(String, nullable=False)
     original_filename = Column(String, nullable=False)
     file_type = Column(String, nullable=False)  # "pdf", "docx", "txt", etc.
     file_size = Column(Integer, nullable=False)
-    content = Column(Text, nullable=False)  # Extracted text content
+    blob_id = Column(Integer, ForeignKey("content_blobs.id"), nullable=False, index=True)  # Extracted text, shared by identical uploads
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    chat = relationship("Chat", back_populates="files")
+    blob = relationship("ContentBlob")
+    
+    __table_args__ = (
+        # Ids are never handed out again, so archived rows get theirs back on restore
+        {"sqlite_autoincrement": True},
+    )
+
+class ContentBlob(Base):
+    """Extracted text stored once per distinct upload and shared by reference"""
+    __tablename__ = "content_blobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True)  # Hash of the uploaded bytes; NULL for pre-dedup uploads
+    content = deferred(Column(CompressedText, nullable=False))
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+class FileChunk(Base):
+    """A span of a blob's text, the unit of retrieval and file search"""
+    __tablename__ = "file_chunks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    blob_id = Column(Integer, ForeignKey("content_blobs.id", ondelete="CASCADE"), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    # Character offsets into the blob's content; the text is sliced from there
+    start_offset = Column(Integer, nullable=False)
+    end_offset = Column(Integer, nullable=False)
+    term_count = Column(Integer, nullable=False)  # Indexed terms, used as BM25 document length
+    
+    __table_args__ = (
+        Index("ix_file_chunks_blob_id_chunk_index", "blob_id", "chunk_index", unique=True),
+    )
+
+class ChatArchive(Base):
+    """An inactive chat's messages and files, moved out of the primary tables"""
+    __tablename__ = "chat_archives"
+    
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True)
+    data = deferred(Column(LargeBinary, nullable=False))  # zlib-compressed JSON of the rows
+    message_count = Column(Integer, nullable=False)
+    file_count = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class ArchivedMessage(Base):
+    """Text of an archived message, kept in the search index; the rest of the row is in its chat's archive"""
+    __tablename__ = "archived_messages"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # The message's own id
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False, index=True)
+    role = Column(String, nullable=False)
+    content = deferred(Column(CompressedText, nullable=False))
+    created_at = Column(DateTime)
+
+class ArchivedFile(Base):
+    """An archived file, so search can still reach it through its blob's chunks"""
+    __tablename__ = "archived_files"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # The file's own id
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False, index=True)
+    blob_id = Column(Integer, ForeignKey("content_blobs.id"), nullable=False, index=True)
+    original_filename = Column(String, nullable=False)
+    created_at = Column(DateTime)
+
+class ChatSummary(Base):
+    """Rolling summary of a chat's earlier messages, extended as the chat grows"""
+    __tablename__ = "chat_summaries"
+    
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True)
+    content = Column(Text, nullable=False)
+    # Newest message the summary covers; messages are ordered by (created_at, id)
+    through_created_at = Column(DateTime, nullable=False)
+    through_message_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)  # Messages summarized so far
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class ChunkTerm(Base):
+    """Inverted index entry: how often a term occurs in a chunk of a blob, shared by the chats using it"""
+    __tablename__ = "chunk_terms"
+    
+    blob_id = Column(Integer, ForeignKey("content_blobs.id", ondelete="CASCADE"), primary_key=True)
+    term = Column(String, primary_key=True)
+    chunk_id = Column(Integer, ForeignKey("file_chunks.id", ondelete="CASCADE"), primary_key=True)
+    term_frequency = Column(Integer, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_chunk_terms_chunk_id", "chunk_id"),
+    )
+
+class CompletionCacheEntry(Base):
+    """Cached completion for a request, keyed by a hash of everything that determines it"""
+    __tablename__ = "completion_cache"
+    
+    key = Column(String(64), primary_key=True)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class GenerationJob(Base):
+    """A queued completion, run by a generation worker apart from the request that created it"""
+    __tablename__ = "generation_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False, index=True)
+    # The assistant message the answer is written to, created when the job starts
+    message_id = Column(Integer, ForeignKey("messages.id", ondelete="SET NULL"), nullable=True, index=True)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, completed or failed
+    payload = Column(Text, nullable=False)  # JSON: the message request, history and file context
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(64), nullable=True)
+    # A running job whose lock has expired is assumed lost and may be claimed again
+    locked_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
     
-    chat = relationship("Chat", back_populates="files") 
\ No newline at end of file
+    __table_args__ = (
+        Index("ix_generation_jobs_status_id", "status", "id"),  # Claiming the oldest queued job
+    )
@@ -0,0 +1,21 @@
+from sqlalchemy.types import Text, TypeDecorator
+from ..core.compression import compress_text, decompress_text
+
+class CompressedText(TypeDecorator):
+    """Text column whose large values are stored compressed on SQLite.
+    
+    Reads accept plain and compressed values alike, so rows written before
+    compression was enabled (or below the size threshold) stay readable.
+    PostgreSQL already compresses large values itself (TOAST) and indexes
+    the text in generated tsvector columns, so values pass through as-is.
+    """
+    impl = Text
+    cache_ok = True
+    
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "sqlite":
+            return value
+        return compress_text(value)
+    
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
@@ -36,10 +36,27 @@ class MessageResponse(BaseModel):
     chat_id: int
     role: str
     content: str
+    truncated: bool = False
     created_at: datetime
 
+class GenerationJobResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    chat_id: int
+    status: str
+    message_id: Optional[int] = None
+    error: Optional[str] = None
+    attempts: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # The answer so far; complete once the job has completed
+    message: Optional[MessageResponse] = None
+
 class ChatList(BaseModel):
     chats: List[ChatResponse]
     total: int
     skip: int
-    limit: int 
\ No newline at end of file
+    limit: int
+    next_cursor: Optional[str] = None 
\ No newline at end of file
@@ -0,0 +1,22 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+class SearchResult(BaseModel):
+    type: str  # "message" or "file"
+    chat_id: int
+    chat_title: str
+    message_id: Optional[int] = None
+    role: Optional[str] = None
+    file_id: Optional[int] = None
+    filename: Optional[str] = None
+    snippet: str  # HTML-escaped, matches wrapped in <mark>
+    score: float
+    created_at: Optional[datetime] = None
+
+class SearchResults(BaseModel):
+    results: List[SearchResult]
+    query: str
+    skip: int
+    limit: int
+    next_skip: Optional[int] = None
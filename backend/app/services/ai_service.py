@@ -1,167 +1,415 @@
 import os
 import asyncio
-from typing import AsyncGenerator
-import openai
+import random
+import time
+from functools import lru_cache
+from typing import AsyncGenerator, List, Optional, Tuple
+from ..core.config import settings
+from ..core.metrics import metrics
+from .completion_cache import completion_cache
+from .provider_router import Route, provider_router
+from .provider_scheduler import ProviderBusyError, ProviderLane, provider_scheduler
+
+XAI_BASE_URL = "https://api.x.ai/v1"  # xAI OpenAI-compatible endpoint
+
+def _openai():
+    """The openai package, imported on first use since it dominates startup time"""
+    import openai
+    return openai
+
+@lru_cache(maxsize=None)
+def _retryable_errors() -> tuple:
+    """Provider errors worth retrying; rate limits also pause the provider's lane"""
+    openai = _openai()
+    return (
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.APIConnectionError,
+    )
+
+# Random extra delay added to each retry, as a fraction of the delay
+RETRY_JITTER = 0.25
+
+# Streams are measured per delta; providers send about one token per delta
+TIME_TO_FIRST_TOKEN = metrics.histogram(
+    "ai_time_to_first_token_seconds",
+    "Time from sending a provider request to its first streamed token",
+    ("provider", "model")
+)
+TOKENS_PER_SECOND = metrics.histogram(
+    "ai_stream_tokens_per_second",
+    "Streamed tokens per second after the first token",
+    ("provider", "model"),
+    buckets=(1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+)
+COMPLETION_TOKENS = metrics.counter(
+    "ai_completion_tokens_total",
+    "Streamed completion tokens",
+    ("provider", "model")
+)
 
 class AIService:
     def __init__(self):
+        # Created on first use: importing openai and httpx and loading TLS
+        # certificates is most of the API's startup time
+        self.http_client = None
+        self.openai_client = None
+        self.xai_client = None
+        self.clients_loaded = False
+    
+    def load_clients(self) -> None:
+        """Create the HTTP and provider clients"""
+        if self.clients_loaded:
+            return
+        import httpx
+        openai = _openai()
+        
+        # One pooled HTTP client shared by both providers so every request and
+        # stream reuses keep-alive connections instead of opening its own
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.ai_max_connections,
+                max_keepalive_connections=settings.ai_max_keepalive_connections
+            ),
+            timeout=httpx.Timeout(settings.ai_request_timeout, connect=10.0)
+        )
+        
         # Initialize OpenAI client
         openai_api_key = os.getenv("OPENAI_API_KEY")
         if openai_api_key:
-            self.openai_client = openai.OpenAI(api_key=openai_api_key)
+            self.openai_client = openai.AsyncOpenAI(
+                api_key=openai_api_key,
+                base_url=settings.openai_base_url or None,
+                http_client=self.http_client,
+                max_retries=0  # Retries go through _create_completion
+            )
         else:
             self.openai_client = None
         
         # Initialize xAI client using OpenAI-compatible interface
         xai_api_key = os.getenv("XAI_API_KEY")
         if xai_api_key:
-            self.xai_client = openai.OpenAI(
+            self.xai_client = openai.AsyncOpenAI(
                 api_key=xai_api_key,
-                base_url="https://api.x.ai/v1"  # xAI OpenAI-compatible endpoint
+                base_url=settings.xai_base_url or XAI_BASE_URL,
+                http_client=self.http_client,
+                max_retries=0
             )
         else:
             self.xai_client = None
+        self.clients_loaded = True
     
-    def get_response(self, message: str, provider: str = "openai", model: str = "gpt-3.5-turbo", think_mode: bool = False, deep_research_mode: bool = False) -> str:
-        """Get a response from the AI service"""
+    async def aclose(self) -> None:
+        """Close the shared HTTP connection pool"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+    
+    def _get_client(self, provider: str):
+        """Get the configured client and display name for a provider"""
+        self.load_clients()
         if provider.lower() == "openai":
-            return self._get_openai_response(message, model, think_mode, deep_research_mode)
+            if not self.openai_client:
+                raise ValueError("OpenAI API key not configured")
+            return self.openai_client, "OpenAI"
         elif provider.lower() == "xai":
-            return self._get_xai_response(message, model, think_mode, deep_research_mode)
+            if not self.xai_client:
+                raise ValueError("xAI API key not configured")
+            return self.xai_client, "xAI"
         else:
             raise ValueError(f"Unsupported provider: {provider}")
     
-    def _get_openai_response(self, message: str, model: str, think_mode: bool, deep_research_mode: bool) -> str:
-        """Get response from OpenAI"""
-        if not os.getenv("OPENAI_API_KEY"):
-            raise ValueError("OpenAI API key not configured")
-        
-        # Enhance prompt based on modes
-        enhanced_message = message
-        if think_mode:
-            enhanced_message = f"Please think through this step by step: {message}"
-        
+    @staticmethod
+    def _enhance_message(message: str, think_mode: bool, deep_research_mode: bool) -> str:
+        """Enhance prompt based on modes"""
+        if think_mode and deep_research_mode:
+            return f"Please think through this step by step and provide a comprehensive, well-researched response with detailed analysis: {message}"
         if deep_research_mode:
-            enhanced_message = f"Please provide a comprehensive, well-researched response with detailed analysis: {message}"
+            return f"Please provide a comprehensive, well-researched response with detailed analysis: {message}"
+        if think_mode:
+            return f"Please think through this step by step: {message}"
+        return message
+    
+    @staticmethod
+    def max_tokens(deep_research_mode: bool) -> int:
+        """Completion token limit for a request"""
+        return 4000 if deep_research_mode else 2000
+    
+    def _build_messages(self, message: str, think_mode: bool, deep_research_mode: bool, history: Optional[List[dict]] = None, file_context: str = "") -> List[dict]:
+        """Build the chat completion messages for a request.
         
-        if think_mode and deep_research_mode:
-            enhanced_message = f"Please think through this step by step and provide a comprehensive, well-researched response with detailed analysis: {message}"
+        File context goes first so it forms a prompt prefix that stays the
+        same across turns, which lets provider-side prompt caching reuse it.
+        """
+        messages = []
+        if file_context:
+            messages.append({"role": "user", "content": file_context})
+        messages.extend(history or [])
+        messages.append({"role": "user", "content": self._enhance_message(message, think_mode, deep_research_mode)})
+        return messages
+    
+    @staticmethod
+    def _estimate_tokens(messages: List[dict], max_tokens: int) -> int:
+        """Rough token cost of a request for rate limiting"""
+        return sum(len(message["content"]) for message in messages) // 4 + max_tokens
+    
+    @staticmethod
+    def _retry_delay(error: Exception, attempt: int) -> float:
+        """Backoff before a retry: the provider's Retry-After if given, else exponential"""
+        delay = min(settings.ai_retry_base_delay * 2 ** attempt, settings.ai_retry_max_delay)
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                delay = float(response.headers.get("retry-after", delay))
+            except ValueError:
+                pass  # HTTP-date form; keep the exponential delay
+        return delay + random.uniform(0, delay * RETRY_JITTER)
+    
+    async def _create_completion(self, client, name: str, lane: ProviderLane, **kwargs):
+        """Call the provider, retrying throttled and transient failures"""
+        for attempt in range(settings.ai_max_retries + 1):
+            try:
+                return await client.chat.completions.create(**kwargs)
+            except _retryable_errors() as e:
+                delay = self._retry_delay(e, attempt)
+                if isinstance(e, _openai().RateLimitError):
+                    # Hold back the rest of the queue too instead of piling on more 429s
+                    lane.pause(delay)
+                    if attempt == settings.ai_max_retries:
+                        raise ProviderBusyError(
+                            f"{name} is rate limiting requests, please try again shortly",
+                            retry_after=delay
+                        )
+                elif attempt == settings.ai_max_retries:
+                    raise
+                await asyncio.sleep(delay)
+    
+    def _fallback_route(self, provider: str, model: str) -> Optional[Route]:
+        """The fallback for a request, if one is mapped to a configured provider"""
+        route = provider_router.fallback_for(provider, model)
+        if route is None:
+            return None
+        try:
+            self._get_client(route[0])
+        except ValueError:
+            return None
+        return route
+    
+    async def _stream_completion(self, provider: str, model: str, messages: List[dict], max_tokens: int) -> AsyncGenerator[str, None]:
+        """Stream the deltas of one provider call, holding an admission slot until it ends"""
+        client, name = self._get_client(provider)
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": enhanced_message}],
-                max_tokens=4000 if deep_research_mode else 2000,
-                temperature=0.7
-            )
-            return response.choices[0].message.content
+            async with provider_scheduler.slot(provider, model, self._estimate_tokens(messages, max_tokens)) as lane:
+                started = time.perf_counter()
+                response = await self._create_completion(
+                    client,
+                    name,
+                    lane,
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.7,
+                    stream=True
+                )
+                
+                first_token_at = None
+                tokens = 0
+                try:
+                    async for chunk in response:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                                TIME_TO_FIRST_TOKEN.observe(first_token_at - started, provider.lower(), model)
+                            tokens += 1
+                            yield chunk.choices[0].delta.content
+                    if tokens > 1:
+                        elapsed = time.perf_counter() - first_token_at
+                        TOKENS_PER_SECOND.observe((tokens - 1) / max(elapsed, 1e-6), provider.lower(), model)
+                finally:
+                    COMPLETION_TOKENS.inc(provider.lower(), model, amount=tokens)
+                    # Release the pooled connection even if the consumer stops early
+                    await response.close()
+        
+        except ProviderBusyError:
+            raise
         except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+            raise Exception(f"{name} API error: {str(e)}") from e
     
-    def _get_xai_response(self, message: str, model: str, think_mode: bool, deep_research_mode: bool) -> str:
-        """Get response from xAI"""
-        if not os.getenv("XAI_API_KEY"):
-            raise ValueError("xAI API key not configured")
+    @staticmethod
+    def _is_provider_failure(error: Exception) -> bool:
+        """Whether an error says the provider is unhealthy, not that the request was bad"""
+        return isinstance(error, ProviderBusyError) or isinstance(error.__cause__, _retryable_errors())
+    
+    async def _open_routed_stream(self, primary: Route, fallback: Route, messages: List[dict], max_tokens: int) -> Tuple[Route, AsyncGenerator[str, None], Optional[str]]:
+        """Start a stream on the primary route, hedging or failing over to the fallback.
         
-        # Enhance prompt based on modes
-        enhanced_message = message
-        if think_mode:
-            enhanced_message = f"Please think through this step by step: {message}"
+        The first route to produce a token wins and the other is cancelled.
+        Returns the winning route, its stream and its first chunk (None if the
+        stream ended without any content).
+        """
+        attempts = {}
         
-        if deep_research_mode:
-            enhanced_message = f"Please provide a comprehensive, well-researched response with detailed analysis: {message}"
+        def start(route: Route) -> None:
+            stream = self._stream_completion(*route, messages, max_tokens)
+            attempts[asyncio.ensure_future(stream.__anext__())] = (route, stream)
         
-        if think_mode and deep_research_mode:
-            enhanced_message = f"Please think through this step by step and provide a comprehensive, well-researched response with detailed analysis: {message}"
+        spare = fallback
+        if provider_router.breaker(primary[0]).allow() or not provider_router.breaker(fallback[0]).allow():
+            start(primary)
+        else:
+            # The primary keeps failing; go straight to the fallback
+            provider_router.failovers += 1
+            start(fallback)
+            spare = None
         
+        hedged = False
+        error = None
         try:
-            response = self.xai_client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": enhanced_message}],
-                max_tokens=4000 if deep_research_mode else 2000,
-                temperature=0.7
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            raise Exception(f"xAI API error: {str(e)}")
+            while attempts:
+                hedge_after = settings.ai_hedge_after if spare and settings.ai_hedge_after > 0 else None
+                done, _ = await asyncio.wait(attempts, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # No first token yet: race a hedge request against the primary
+                    provider_router.hedges += 1
+                    hedged = True
+                    start(spare)
+                    spare = None
+                    continue
+                
+                for task in done:
+                    route, stream = attempts.pop(task)
+                    try:
+                        chunk = task.result()
+                    except StopAsyncIteration:
+                        chunk = None
+                    except Exception as e:
+                        if self._is_provider_failure(e):
+                            provider_router.breaker(route[0]).record_failure()
+                        error = e
+                        continue
+                    
+                    provider_router.breaker(route[0]).record_success()
+                    if hedged and route != primary:
+                        provider_router.hedge_wins += 1
+                    return route, stream, chunk
+                
+                if spare and not attempts:
+                    # The primary failed before producing anything
+                    provider_router.failovers += 1
+                    start(spare)
+                    spare = None
+            
+            raise error
+        finally:
+            # Cancel whichever attempts lost, releasing their slots and connections
+            for task in attempts:
+                task.cancel()
+            if attempts:
+                await asyncio.gather(*attempts, return_exceptions=True)
+                for _, stream in attempts.values():
+                    await stream.aclose()
     
-    async def get_streaming_response(self, message: str, provider: str = "openai", model: str = "gpt-3.5-turbo", think_mode: bool = False, deep_research_mode: bool = False) -> AsyncGenerator[str, None]:
-        """Get a streaming response from the AI service"""
-        if provider.lower() == "openai":
-            async for chunk in self._get_openai_streaming_response(message, model, think_mode, deep_research_mode):
-                yield chunk
-        elif provider.lower() == "xai":
-            async for chunk in self._get_xai_streaming_response(message, model, think_mode, deep_research_mode):
-                yield chunk
-        else:
-            raise ValueError(f"Unsupported provider: {provider}")
+    async def _routed_response(self, primary: Route, fallback: Route, messages: List[dict], max_tokens: int) -> Tuple[Route, str]:
+        """Collect the full response of a routed stream"""
+        route, stream, first_chunk = await self._open_routed_stream(primary, fallback, messages, max_tokens)
+        chunks = [first_chunk] if first_chunk is not None else []
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
+        finally:
+            await stream.aclose()
+        return route, "".join(chunks)
     
-    async def _get_openai_streaming_response(self, message: str, model: str, think_mode: bool, deep_research_mode: bool) -> AsyncGenerator[str, None]:
-        """Get streaming response from OpenAI"""
-        if not os.getenv("OPENAI_API_KEY"):
-            raise ValueError("OpenAI API key not configured")
-        
-        # Enhance prompt based on modes
-        enhanced_message = message
-        if think_mode:
-            enhanced_message = f"Please think through this step by step: {message}"
+    async def get_response(self, message: str, provider: str = "openai", model: str = "gpt-3.5-turbo", think_mode: bool = False, deep_research_mode: bool = False, history: Optional[List[dict]] = None, file_context: str = "") -> str:
+        """Get a response from the AI service"""
+        client, name = self._get_client(provider)
+        messages = self._build_messages(message, think_mode, deep_research_mode, history, file_context)
+        max_tokens = self.max_tokens(deep_research_mode)
         
-        if deep_research_mode:
-            enhanced_message = f"Please provide a comprehensive, well-researched response with detailed analysis: {message}"
+        cache_key = None
+        if completion_cache.enabled:
+            cache_key = completion_cache.make_key(provider, model, think_mode, deep_research_mode, messages)
+            cached = await completion_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
-        if think_mode and deep_research_mode:
-            enhanced_message = f"Please think through this step by step and provide a comprehensive, well-researched response with detailed analysis: {message}"
+        route, content = await self._complete(client, name, provider, model, messages, max_tokens)
+        if route != (provider.lower(), model):
+            # Don't cache another model's answer under this request
+            cache_key = None
         
+        if cache_key and content:
+            await completion_cache.put(cache_key, content)
+        return content
+    
+    async def _complete(self, client, name: str, provider: str, model: str, messages: List[dict], max_tokens: int) -> Tuple[Route, str]:
+        """A complete answer to prepared messages and the route that gave it"""
+        primary = (provider.lower(), model)
+        fallback = self._fallback_route(provider, model)
+        if fallback is not None:
+            # Routed requests stream underneath so hedging can act on the first token
+            return await self._routed_response(primary, fallback, messages, max_tokens)
         try:
-            response = self.openai_client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": enhanced_message}],
-                max_tokens=4000 if deep_research_mode else 2000,
-                temperature=0.7,
-                stream=True
-            )
-            
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-                    # Add a small delay for realistic typing effect
-                    await asyncio.sleep(0.05)
-                    
+            async with provider_scheduler.slot(provider, model, self._estimate_tokens(messages, max_tokens)) as lane:
+                response = await self._create_completion(
+                    client,
+                    name,
+                    lane,
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=0.7
+                )
+            return primary, response.choices[0].message.content
+        except ProviderBusyError:
+            raise
         except Exception as e:
-            raise Exception(f"OpenAI API error: {str(e)}")
+            raise Exception(f"{name} API error: {str(e)}")
     
-    async def _get_xai_streaming_response(self, message: str, model: str, think_mode: bool, deep_research_mode: bool) -> AsyncGenerator[str, None]:
-        """Get streaming response from xAI"""
-        if not os.getenv("XAI_API_KEY"):
-            raise ValueError("xAI API key not configured")
-        
-        # Enhance prompt based on modes
-        enhanced_message = message
-        if think_mode:
-            enhanced_message = f"Please think through this step by step: {message}"
+    async def get_completion(self, messages: List[dict], provider: str, model: str, max_tokens: int) -> str:
+        """Answer prepared messages without the completion cache, for background work such as summaries"""
+        client, name = self._get_client(provider)
+        _, content = await self._complete(client, name, provider, model, messages, max_tokens)
+        return content
+    
+    async def get_streaming_response(self, message: str, provider: str = "openai", model: str = "gpt-3.5-turbo", think_mode: bool = False, deep_research_mode: bool = False, history: Optional[List[dict]] = None, file_context: str = "") -> AsyncGenerator[str, None]:
+        """Get a streaming response from the AI service"""
+        self._get_client(provider)
+        messages = self._build_messages(message, think_mode, deep_research_mode, history, file_context)
+        max_tokens = self.max_tokens(deep_research_mode)
         
-        if deep_research_mode:
-            enhanced_message = f"Please provide a comprehensive, well-researched response with detailed analysis: {message}"
+        cache_key = None
+        if completion_cache.enabled:
+            cache_key = completion_cache.make_key(provider, model, think_mode, deep_research_mode, messages)
+            cached = await completion_cache.get(cache_key)
+            if cached is not None:
+                # Replay the cached completion in stream-sized pieces
+                step = max(settings.stream_flush_chars, 1)
+                for start in range(0, len(cached), step):
+                    yield cached[start:start + step]
+                return
         
-        if think_mode and deep_research_mode:
-            enhanced_message = f"Please think through this step by step and provide a comprehensive, well-researched response with detailed analysis: {message}"
+        primary = (provider.lower(), model)
+        fallback = self._fallback_route(provider, model)
+        if fallback is not None:
+            route, stream, first_chunk = await self._open_routed_stream(primary, fallback, messages, max_tokens)
+        else:
+            route, stream, first_chunk = primary, self._stream_completion(provider, model, messages, max_tokens), None
         
+        chunks = []
         try:
-            response = self.xai_client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": enhanced_message}],
-                max_tokens=4000 if deep_research_mode else 2000,
-                temperature=0.7,
-                stream=True
-            )
-            
-            for chunk in response:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-                    await asyncio.sleep(0.05)
-                    
-        except Exception as e:
-            raise Exception(f"xAI API error: {str(e)}")
+            if first_chunk is not None:
+                chunks.append(first_chunk)
+                yield first_chunk
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            await stream.aclose()
+        
+        # Only completed streams from the requested model are cached
+        if cache_key and chunks and route == primary:
+            await completion_cache.put(cache_key, "".join(chunks))
 
 # Global instance
-ai_service = AIService() 
\ No newline at end of file
+ai_service = AIService()
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.metrics import metrics
+from ..models.chat import ArchivedFile, ArchivedMessage, Chat, ChatArchive, FileUpload, GenerationJob, Message
+from .file_context_cache import file_context_cache
+from .retrieval_service import RetrievalService
+
+logger = logging.getLogger(__name__)
+
+# Rows per statement when deleting archived rows and when restoring them
+ARCHIVE_BATCH_SIZE = 500
+
+ARCHIVE_COMPRESSION_LEVEL = 6
+
+CHATS_ARCHIVED = metrics.counter("chats_archived_total", "Chats moved to archives by this process")
+CHATS_RESTORED = metrics.counter("chats_restored_total", "Chats restored from archives by this process")
+
+def _encode_rows(rows, exclude: Tuple[str, ...] = ()) -> List[dict]:
+    return [
+        {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in row._mapping.items() if key not in exclude
+        } for row in rows
+    ]
+
+def _decode_rows(rows: List[dict]) -> List[dict]:
+    for row in rows:
+        if isinstance(row.get("created_at"), str):
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return rows
+
+class ChatArchiver:
+    """Moves the messages and files of inactive chats out of the primary tables.
+    
+    A chat's rows are serialized into one compressed chat_archives row and
+    deleted. Message text goes to archived_messages instead, and the file
+    names to archived_files, so search still finds them. The chat row
+    stays, marked by ``archived_at``, so chat listings are unaffected. The
+    first request that needs the rows restores them with their ids, which
+    are never handed out again (AUTOINCREMENT on SQLite). File text stays in
+    content_blobs, still referenced, with its chunks and postings, so
+    restoring a file only puts its row back.
+    """
+    
+    @classmethod
+    def _inactive_since(cls, cutoff: datetime):
+        active_jobs = select(GenerationJob.id).filter(
+            GenerationJob.chat_id == Chat.id,
+            GenerationJob.status.in_(["queued", "running"])
+        ).exists()
+        return (
+            Chat.updated_at < cutoff,
+            or_(Chat.restored_at.is_(None), Chat.restored_at < cutoff),
+            ~active_jobs
+        )
+    
+    @classmethod
+    async def archive(cls, db: AsyncSession, chat_id: int, cutoff: datetime) -> bool:
+        """Archive a chat if it is still inactive since ``cutoff``; commits"""
+        now = datetime.utcnow()
+        # Claim the chat first: the write serializes concurrent archivers and restores
+        claimed = (await db.execute(
+            update(Chat)
+            .where(Chat.id == chat_id, Chat.archived_at.is_(None), *cls._inactive_since(cutoff))
+            .values(archived_at=now, updated_at=Chat.updated_at)
+            .returning(Chat.id)
+        )).scalar()
+        if claimed is None:
+            await db.rollback()
+            return False
+        
+        messages = (await db.execute(
+            select(Message.__table__).filter(Message.chat_id == chat_id).order_by(Message.id)
+        )).all()
+        files = (await db.execute(
+            select(FileUpload.__table__).filter(FileUpload.chat_id == chat_id).order_by(FileUpload.id)
+        )).all()
+        await cls._insert_rows(db, ArchivedMessage, [
+            {"id": row.id, "chat_id": chat_id, "role": row.role, "content": row.content, "created_at": row.created_at}
+            for row in messages
+        ])
+        await cls._insert_rows(db, ArchivedFile, [
+            {
+                "id": row.id,
+                "chat_id": chat_id,
+                "blob_id": row.blob_id,
+                "original_filename": row.original_filename,
+                "created_at": row.created_at
+            } for row in files
+        ])
+        # Message text is kept once, in archived_messages
+        payload = json.dumps(
+            {"messages": _encode_rows(messages, exclude=("content",)), "files": _encode_rows(files)},
+            ensure_ascii=False,
+            separators=(",", ":")
+        ).encode()
+        db.add(ChatArchive(
+            chat_id=chat_id,
+            data=zlib.compress(payload, ARCHIVE_COMPRESSION_LEVEL),
+            message_count=len(messages),
+            file_count=len(files),
+            archived_at=now
+        ))
+        
+        # By id, so a message sent while this ran is kept rather than lost
+        for model, rows in ((Message, messages), (FileUpload, files)):
+            ids = [row.id for row in rows]
+            for start in range(0, len(ids), ARCHIVE_BATCH_SIZE):
+                await db.execute(delete(model).where(model.id.in_(ids[start:start + ARCHIVE_BATCH_SIZE])))
+        # The blobs keep their references, so their text and postings are there when the files come back
+        await db.commit()
+        file_context_cache.invalidate(chat_id)
+        CHATS_ARCHIVED.inc()
+        return True
+    
+    @classmethod
+    async def _insert_rows(cls, db: AsyncSession, model, rows: List[dict]) -> None:
+        for start in range(0, len(rows), ARCHIVE_BATCH_SIZE):
+            await db.execute(model.__table__.insert(), _decode_rows(rows[start:start + ARCHIVE_BATCH_SIZE]))
+    
+    @classmethod
+    async def _archived_texts(cls, db: AsyncSession, chat_id: int) -> Dict[int, str]:
+        return dict((await db.execute(
+            select(ArchivedMessage.id, ArchivedMessage.content).filter(ArchivedMessage.chat_id == chat_id)
+        )).all())
+    
+    @classmethod
+    def _with_texts(cls, messages: List[dict], texts: Dict[int, str]) -> List[dict]:
+        for row in messages:
+            row["content"] = texts.get(row["id"], row.get("content", ""))
+        return messages
+    
+    @classmethod
+    async def restore(cls, db: AsyncSession, chat_id: int) -> bool:
+        """Put an archived chat's messages and files back; commits"""
+        claimed = (await db.execute(
+            update(Chat)
+            .where(Chat.id == chat_id, Chat.archived_at.is_not(None))
+            .values(archived_at=None, restored_at=datetime.utcnow(), updated_at=Chat.updated_at)
+            .returning(Chat.id)
+        )).scalar()
+        if claimed is None:
+            await db.rollback()
+            return False
+        
+        data = (await db.execute(
+            delete(ChatArchive).where(ChatArchive.chat_id == chat_id).returning(ChatArchive.data)
+        )).scalar()
+        if data is not None:
+            payload = json.loads(zlib.decompress(data))
+            messages = cls._with_texts(payload["messages"], await cls._archived_texts(db, chat_id))
+            await db.execute(delete(ArchivedMessage).where(ArchivedMessage.chat_id == chat_id))
+            await db.execute(delete(ArchivedFile).where(ArchivedFile.chat_id == chat_id))
+            await cls._insert_rows(db, Message, messages)
+            await cls._insert_rows(db, FileUpload, payload["files"])
+            # Normally already indexed; blobs from before per-blob postings may not be
+            for blob_id in {row["blob_id"] for row in payload["files"]}:
+                await RetrievalService.index_file(db, blob_id)
+        await db.commit()
+        file_context_cache.invalidate(chat_id)
+        CHATS_RESTORED.inc()
+        return True
+    
+    @classmethod
+    async def restore_if_archived(cls, db: AsyncSession, chat_id: int) -> bool:
+        """Restore the chat if it is archived, for handlers that don't load the chat; False if it doesn't exist"""
+        chat = (await db.execute(select(Chat.archived_at).filter(Chat.id == chat_id))).first()
+        if chat is None:
+            return False
+        if chat.archived_at is not None:
+            await cls.restore(db, chat_id)
+        return True
+    
+    @classmethod
+    async def archived_rows(cls, db: AsyncSession, chat_id: int) -> Tuple[List[dict], List[dict]]:
+        """The archived message and file rows of a chat, datetimes as ISO strings"""
+        data = (await db.execute(
+            select(ChatArchive.data).filter(ChatArchive.chat_id == chat_id)
+        )).scalar()
+        if data is None:
+            return [], []
+        payload = json.loads(zlib.decompress(data))
+        return cls._with_texts(payload["messages"], await cls._archived_texts(db, chat_id)), payload["files"]
+    
+    @classmethod
+    async def archived_blob_ids(cls, db: AsyncSession, chat_id: int) -> List[int]:
+        """Blobs referenced by a chat's archived files"""
+        return list((await db.execute(
+            select(ArchivedFile.blob_id).filter(ArchivedFile.chat_id == chat_id)
+        )).scalars().all())
+    
+    @classmethod
+    async def archive_inactive(cls, inactive_for: Optional[float] = None) -> int:
+        """Archive every chat inactive for ``inactive_for`` seconds; returns how many were archived"""
+        inactive_for = settings.chat_archive_after if inactive_for is None else inactive_for
+        cutoff = datetime.utcnow() - timedelta(seconds=inactive_for)
+        batch_size = settings.chat_archive_batch_size
+        archived = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                chat_ids = (await db.execute(
+                    select(Chat.id)
+                    .filter(Chat.archived_at.is_(None), *cls._inactive_since(cutoff))
+                    .order_by(Chat.updated_at)
+                    .limit(batch_size)
+                )).scalars().all()
+            
+            progress = 0
+            for chat_id in chat_ids:
+                # One transaction per chat keeps write locks short
+                async with AsyncSessionLocal() as db:
+                    progress += await cls.archive(db, chat_id, cutoff)
+            archived += progress
+            if len(chat_ids) < batch_size or not progress:
+                return archived
+
+class ChatArchiveWorker:
+    """Runs the archiver every CHAT_ARCHIVE_INTERVAL seconds in the API process"""
+    
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        if settings.chat_archive_after > 0:
+            self.task = asyncio.create_task(self._loop())
+    
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+    
+    async def _loop(self) -> None:
+        while True:
+            try:
+                archived = await ChatArchiver.archive_inactive()
+                if archived:
+                    logger.info(f"Archived {archived} inactive chats")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Chat archiver error: {e}")
+            await asyncio.sleep(settings.chat_archive_interval)
+
+# Global instance
+chat_archive_worker = ChatArchiveWorker()
@@ -0,0 +1,271 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.metrics import metrics
+from ..models.chat import Chat, ChatSummary, Message
+from .ai_service import ai_service
+from .context_builder import ContextBuilder
+
+logger = logging.getLogger(__name__)
+
+# Most message tokens folded into a summary per provider call; a longer backlog takes several
+MAX_SUMMARY_INPUT_TOKENS = 12000
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a conversation between a user and an AI assistant. "
+    "Rewrite the summary so it also covers the new messages. Keep facts, decisions, names, "
+    "numbers, code identifiers, open questions and the user's stated preferences; leave out "
+    "pleasantries. Write plain prose of at most {words} words and reply with the summary only."
+)
+
+SUMMARY_UPDATES = metrics.counter("chat_summary_updates_total", "Rolling summary updates by outcome", ("outcome",))
+
+def _summary_route(chat: Chat) -> Tuple[str, str]:
+    """Provider and model that write a chat's summary"""
+    if settings.chat_summary_model:
+        provider, _, model = settings.chat_summary_model.partition(":")
+        if model:
+            return provider, model
+    return chat.model_provider or "openai", chat.model_name or "gpt-3.5-turbo"
+
+class ChatSummarizer:
+    """Incremental summaries of the older part of long chats.
+    
+    A summary covers a chat's messages up to ``(through_created_at,
+    through_message_id)``, in the (created_at, id) order the chat is shown
+    and sent in. Once CHAT_SUMMARY_EVERY assistant messages beyond it (not
+    counting the newest CHAT_SUMMARY_KEEP_MESSAGES) have accumulated, only
+    those are folded into the existing summary, so a chat is never
+    summarized from scratch. The prompt for a new message is the summary
+    followed by the messages after it (see ContextBuilder.build_history).
+    """
+    
+    @classmethod
+    def _pending_filter(
+        cls,
+        chat_id: int,
+        through: Optional[Tuple[datetime, int]],
+        keep_before: Optional[Tuple[datetime, int]]
+    ):
+        position = tuple_(Message.created_at, Message.id)
+        criteria = [Message.chat_id == chat_id]
+        if through is not None:
+            criteria.append(position > tuple_(*through))
+        if keep_before is not None:
+            criteria.append(position < tuple_(*keep_before))
+        return criteria
+    
+    @classmethod
+    async def _next_step(
+        cls,
+        chat_id: int,
+        through: Optional[Tuple[datetime, int]],
+        budget: int,
+        model: str
+    ) -> List[Tuple[datetime, int, str, str]]:
+        """The oldest pending messages that fit ``budget`` tokens, if enough are pending"""
+        async with AsyncSessionLocal() as db:
+            keep_before = None
+            keep = settings.chat_summary_keep_messages
+            if keep > 0:
+                keep_before = (await db.execute(
+                    select(Message.created_at, Message.id)
+                    .filter(Message.chat_id == chat_id)
+                    .order_by(Message.created_at.desc(), Message.id.desc())
+                    .offset(keep - 1)
+                    .limit(1)
+                )).first()
+                if keep_before is None:
+                    return []
+            criteria = cls._pending_filter(chat_id, through, keep_before)
+            
+            pending_answers = (await db.execute(
+                select(func.count(Message.id)).filter(*criteria, Message.role == "assistant")
+            )).scalar()
+            if pending_answers < settings.chat_summary_every:
+                return []
+            
+            step = []
+            used = 0
+            result = await db.stream(
+                select(Message.created_at, Message.id, Message.role, Message.content)
+                .filter(*criteria)
+                .order_by(Message.created_at, Message.id)
+                .execution_options(yield_per=settings.history_batch_size)
+            )
+            try:
+                async for created_at, message_id, role, content in result:
+                    tokens = ContextBuilder.count_tokens(content, model)
+                    if used + tokens > budget:
+                        if not step:
+                            # A single message over the budget is cut to fit
+                            step.append((created_at, message_id, role, content[:len(content) * budget // tokens]))
+                        break
+                    step.append((created_at, message_id, role, content))
+                    used += tokens
+            finally:
+                await result.close()
+            return step
+    
+    @classmethod
+    async def _save(
+        cls,
+        chat_id: int,
+        previous: Optional[ChatSummary],
+        content: str,
+        through: Tuple[datetime, int],
+        count: int
+    ) -> bool:
+        """Store the new summary unless another process got there first"""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            if previous is None:
+                try:
+                    db.add(ChatSummary(
+                        chat_id=chat_id,
+                        content=content,
+                        through_created_at=through[0],
+                        through_message_id=through[1],
+                        message_count=count,
+                        updated_at=now
+                    ))
+                    await db.commit()
+                except IntegrityError:
+                    # Summarized concurrently, or the chat was deleted
+                    await db.rollback()
+                    return False
+                return True
+            
+            saved = (await db.execute(
+                update(ChatSummary)
+                .where(
+                    ChatSummary.chat_id == chat_id,
+                    ChatSummary.through_message_id == previous.through_message_id
+                )
+                .values(
+                    content=content,
+                    through_created_at=through[0],
+                    through_message_id=through[1],
+                    message_count=previous.message_count + count,
+                    updated_at=now
+                )
+                .returning(ChatSummary.chat_id)
+            )).scalar()
+            await db.commit()
+            return saved is not None
+    
+    @classmethod
+    async def update(cls, chat_id: int) -> int:
+        """Fold the chat's pending messages into its summary; returns how many were added"""
+        async with AsyncSessionLocal() as db:
+            chat = await db.get(Chat, chat_id)
+            summary = await db.get(ChatSummary, chat_id)
+        if chat is None:
+            return 0
+        provider, model = _summary_route(chat)
+        max_tokens = settings.chat_summary_max_tokens
+        instructions = SUMMARY_INSTRUCTIONS.format(words=max(max_tokens * 3 // 4, 50))
+        
+        summarized = 0
+        while True:
+            previous_text = summary.content if summary else ""
+            budget = min(
+                MAX_SUMMARY_INPUT_TOKENS,
+                ContextBuilder.get_context_window(model)
+                - max_tokens
+                - ContextBuilder.count_tokens(instructions + previous_text, model)
+                - 2 * ContextBuilder.count_tokens("", model)
+            )
+            through = (summary.through_created_at, summary.through_message_id) if summary else None
+            step = await cls._next_step(chat_id, through, budget, model)
+            if not step:
+                return summarized
+            
+            transcript = "\n\n".join(
+                f"{'User' if role == 'user' else 'Assistant'}: {content}" for _, _, role, content in step
+            )
+            content = await ai_service.get_completion(
+                [
+                    {"role": "system", "content": instructions},
+                    {
+                        "role": "user",
+                        "content": f"Current summary:\n{previous_text or '(none yet)'}\n\nNew messages:\n{transcript}"
+                    },
+                ],
+                provider,
+                model,
+                max_tokens
+            )
+            content = (content or "").strip()
+            if not content:
+                raise ValueError("The provider returned an empty summary")
+            
+            through = step[-1][:2]
+            if not await cls._save(chat_id, summary, content, through, len(step)):
+                return summarized
+            summarized += len(step)
+            summary = ChatSummary(
+                chat_id=chat_id,
+                content=content,
+                through_created_at=through[0],
+                through_message_id=through[1],
+                message_count=(summary.message_count if summary else 0) + len(step)
+            )
+
+class ChatSummaryScheduler:
+    """Runs summary updates in the background, one at a time per chat.
+    
+    Updates wait for CHAT_SUMMARY_CONCURRENCY slots so they don't crowd out
+    interactive requests to the providers. A chat scheduled again while its
+    update runs is checked once more afterwards.
+    """
+    
+    def __init__(self):
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self.rerun: Set[int] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+    
+    def schedule(self, chat_id: int) -> None:
+        """Check the chat's summary after a new assistant message"""
+        if settings.chat_summary_every <= 0:
+            return
+        if chat_id in self.tasks:
+            self.rerun.add(chat_id)
+            return
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(max(settings.chat_summary_concurrency, 1))
+        self.tasks[chat_id] = asyncio.create_task(self._run(chat_id))
+    
+    async def _run(self, chat_id: int) -> None:
+        try:
+            while True:
+                self.rerun.discard(chat_id)
+                async with self._slots:
+                    try:
+                        if await ChatSummarizer.update(chat_id):
+                            SUMMARY_UPDATES.inc("updated")
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        # Retried after the chat's next answer
+                        SUMMARY_UPDATES.inc("failed")
+                        logger.warning(f"Failed to update the summary of chat {chat_id}: {e}")
+                        return
+                if chat_id not in self.rerun:
+                    return
+        finally:
+            self.tasks.pop(chat_id, None)
+    
+    async def stop(self) -> None:
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# Global instance
+chat_summary_scheduler = ChatSummaryScheduler()
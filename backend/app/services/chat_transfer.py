@@ -0,0 +1,367 @@
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.chat import Chat, ContentBlob, FileUpload, Message
+from .chat_archive import ChatArchiver
+
+FORMAT_NAME = "ai-chat-export"
+FORMAT_VERSION = 1
+
+# Rows fetched per round trip by the export cursors
+EXPORT_YIELD_PER = 1000
+
+# Encoded output is yielded in pieces of about this many bytes
+EXPORT_WRITE_SIZE = 64 * 1024
+
+# Rows buffered per table, and bytes of file text, before an import batch is written and committed
+IMPORT_BATCH_SIZE = 2000
+IMPORT_BATCH_BYTES = 16 * 1024 * 1024
+
+CHAT_FIELDS = ("id", "title", "model_provider", "model_name", "created_at", "updated_at")
+MESSAGE_FIELDS = ("id", "chat_id", "role", "content", "truncated", "created_at")
+FILE_FIELDS = ("id", "chat_id", "filename", "original_filename", "file_type", "file_size", "blob_id", "created_at")
+DATETIME_FIELDS = ("created_at", "updated_at")
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+class ImportFormatError(ValueError):
+    """The import stream is not a valid chat export"""
+
+class _Cursor:
+    """One-row lookahead over a streamed result, for merging streams ordered by chat id"""
+    
+    def __init__(self, result):
+        self.rows = result.__aiter__()
+        self.row = None
+        self.done = False
+    
+    async def peek(self):
+        if self.row is None and not self.done:
+            try:
+                self.row = await self.rows.__anext__()
+            except StopAsyncIteration:
+                self.done = True
+        return self.row
+    
+    async def take_for_chat(self, chat_id: int) -> AsyncIterator:
+        """Rows of ``chat_id``, skipping rows of chats that are not exported"""
+        while (row := await self.peek()) is not None and row.chat_id <= chat_id:
+            self.row = None
+            if row.chat_id == chat_id:
+                yield row
+
+def _record(record_type: str, row, fields) -> dict:
+    record = {"type": record_type}
+    for field in fields:
+        value = getattr(row, field)
+        record[field] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+class ChatTransfer:
+    """Bulk export and import of chats as NDJSON.
+    
+    An export is a header line followed by each chat and then its messages
+    and files; a file's extracted text is written once per blob, before
+    the first file that uses it. Exports read three ordered server-side
+    cursors and merge them by chat id, so memory stays flat however large
+    the history is. Imports write batched multi-row inserts and commit per
+    batch. Ids are reassigned on import. Archived chats are exported from
+    their archives, without restoring them.
+    """
+    
+    @classmethod
+    async def export_records(cls, db: AsyncSession, chat_ids: Optional[List[int]] = None) -> AsyncIterator[dict]:
+        chat_query = select(*(getattr(Chat, field) for field in CHAT_FIELDS), Chat.archived_at).order_by(Chat.id)
+        message_query = (
+            select(*(getattr(Message, field) for field in MESSAGE_FIELDS))
+            .filter(Message.chat_id.is_not(None))
+            .order_by(Message.chat_id, Message.id)
+        )
+        file_query = (
+            select(
+                *(getattr(FileUpload, field) for field in FILE_FIELDS),
+                ContentBlob.sha256,
+                ContentBlob.content
+            )
+            .join(ContentBlob, ContentBlob.id == FileUpload.blob_id)
+            .order_by(FileUpload.chat_id, FileUpload.id)
+        )
+        if chat_ids:
+            chat_query = chat_query.filter(Chat.id.in_(chat_ids))
+            message_query = message_query.filter(Message.chat_id.in_(chat_ids))
+            file_query = file_query.filter(FileUpload.chat_id.in_(chat_ids))
+        
+        options = {"yield_per": EXPORT_YIELD_PER}
+        chats = await db.stream(chat_query.execution_options(**options))
+        messages = _Cursor(await db.stream(message_query.execution_options(**options)))
+        files = _Cursor(await db.stream(file_query.execution_options(**options)))
+        
+        yield {"type": "header", "format": FORMAT_NAME, "version": FORMAT_VERSION}
+        exported_blobs = set()
+        async for chat in chats:
+            yield _record("chat", chat, CHAT_FIELDS)
+            if chat.archived_at is not None:
+                async for record in cls._archived_records(db, chat.id, exported_blobs):
+                    yield record
+            async for message in messages.take_for_chat(chat.id):
+                yield _record("message", message, MESSAGE_FIELDS)
+            async for file in files.take_for_chat(chat.id):
+                if file.blob_id not in exported_blobs:
+                    exported_blobs.add(file.blob_id)
+                    yield {"type": "blob", "id": file.blob_id, "sha256": file.sha256, "content": file.content}
+                yield _record("file", file, FILE_FIELDS)
+    
+    @classmethod
+    async def _archived_records(cls, db: AsyncSession, chat_id: int, exported_blobs: set) -> AsyncIterator[dict]:
+        """Records of an archived chat's messages and files, read from its archive"""
+        messages, files = await ChatArchiver.archived_rows(db, chat_id)
+        for message in messages:
+            yield {"type": "message", **{field: message.get(field) for field in MESSAGE_FIELDS}}
+        
+        blob_ids = {file["blob_id"] for file in files} - exported_blobs
+        blobs = {}
+        if blob_ids:
+            blobs = {
+                blob.id: blob for blob in (await db.execute(
+                    select(ContentBlob.id, ContentBlob.sha256, ContentBlob.content).filter(ContentBlob.id.in_(blob_ids))
+                )).all()
+            }
+        for file in files:
+            blob = blobs.get(file["blob_id"])
+            if blob is not None and blob.id not in exported_blobs:
+                exported_blobs.add(blob.id)
+                yield {"type": "blob", "id": blob.id, "sha256": blob.sha256, "content": blob.content}
+            yield {"type": "file", **{field: file.get(field) for field in FILE_FIELDS}}
+    
+    @classmethod
+    async def encode_ndjson(cls, records: AsyncIterable[dict], compress: bool = False) -> AsyncIterator[bytes]:
+        """Serialize records one per line, optionally gzip-compressed"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        pending: List[bytes] = []
+        pending_size = 0
+        async for record in records:
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+            pending.append(line)
+            pending_size += len(line)
+            if pending_size >= EXPORT_WRITE_SIZE:
+                data = b"".join(pending)
+                pending, pending_size = [], 0
+                data = compressor.compress(data) if compressor else data
+                if data:
+                    yield data
+        data = b"".join(pending)
+        if compressor:
+            data = compressor.compress(data) + compressor.flush()
+        if data:
+            yield data
+    
+    @classmethod
+    async def decode_ndjson(cls, chunks: AsyncIterable[bytes]) -> AsyncIterator[dict]:
+        """Parse NDJSON from byte chunks, decompressing gzip input automatically"""
+        decompressor = None
+        first = True
+        pending: List[bytes] = []  # Pieces of a line that spans chunks
+        line_number = 0
+        async for chunk in chunks:
+            if first and chunk:
+                first = False
+                if chunk.startswith(GZIP_MAGIC):
+                    decompressor = zlib.decompressobj(31)
+            if decompressor:
+                chunk = decompressor.decompress(chunk)
+            if b"\n" not in chunk:
+                pending.append(chunk)
+                continue
+            lines = chunk.split(b"\n")
+            lines[0] = b"".join(pending) + lines[0]
+            pending = [lines.pop()]
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    yield cls._parse_line(line, line_number)
+        if decompressor:
+            pending.append(decompressor.flush())
+        for line in b"".join(pending).split(b"\n"):
+            line_number += 1
+            if line.strip():
+                yield cls._parse_line(line, line_number)
+    
+    @staticmethod
+    def _parse_line(line: bytes, line_number: int) -> dict:
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ImportFormatError(f"Line {line_number}: invalid JSON ({e})")
+        if not isinstance(record, dict) or "type" not in record:
+            raise ImportFormatError(f"Line {line_number}: expected an object with a type")
+        return record
+    
+    @classmethod
+    async def import_records(cls, db: AsyncSession, records: AsyncIterable[dict]) -> Dict[str, int]:
+        """Insert exported chats as new chats; returns counts per record type"""
+        importer = _Importer(db)
+        header_seen = False
+        async for record in records:
+            if not header_seen:
+                if record.get("type") != "header" or record.get("format") != FORMAT_NAME:
+                    raise ImportFormatError("Not a chat export: the header line is missing")
+                if record.get("version") != FORMAT_VERSION:
+                    raise ImportFormatError(f"Unsupported export version {record.get('version')}")
+                header_seen = True
+                continue
+            await importer.add(record)
+        await importer.flush()
+        return importer.counts
+
+class _Importer:
+    """Buffers imported rows and writes them in batches.
+    
+    Messages and files always belong to the chat line before them, so only
+    the current chat's new id needs to be known. Blob ids are remembered for
+    the whole import because files in later chats can share a blob.
+    """
+    
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.chats: List[dict] = []
+        self.messages: List[dict] = []
+        self.files: List[dict] = []
+        self.blobs: List[dict] = []
+        self.blob_bytes = 0
+        # Buffered children point at a chat by its position in self.chats, or at an already written chat
+        self.current_chat: Optional[int] = None
+        self.current_chat_id: Optional[int] = None
+        # Exported blob id to new blob id
+        self.blob_ids: Dict[int, int] = {}
+        self.counts = {"chats": 0, "messages": 0, "files": 0, "blobs": 0}
+    
+    @staticmethod
+    def _fields(record: dict, fields) -> dict:
+        try:
+            row = {field: record[field] for field in fields if field != "id"}
+        except KeyError as e:
+            raise ImportFormatError(f"{record['type']} record is missing {e}")
+        for field in DATETIME_FIELDS:
+            if row.get(field):
+                row[field] = datetime.fromisoformat(row[field])
+        return row
+    
+    def _chat_ref(self, record: dict):
+        if self.current_chat is None or record.get("chat_id") != self.current_chat:
+            raise ImportFormatError(f"{record['type']} {record.get('id')} does not follow its chat")
+        # Index into the buffered chats until they are written, then the new id
+        return self.current_chat_id if self.current_chat_id is not None else ("pending", len(self.chats) - 1)
+    
+    async def add(self, record: dict) -> None:
+        record_type = record["type"]
+        if record_type == "chat":
+            self.chats.append(self._fields(record, CHAT_FIELDS))
+            self.current_chat = record.get("id")
+            self.current_chat_id = None
+        elif record_type == "message":
+            row = self._fields(record, MESSAGE_FIELDS)
+            row["chat_id"] = self._chat_ref(record)
+            self.messages.append(row)
+        elif record_type == "blob":
+            content = record.get("content") or ""
+            self.blobs.append({"id": record.get("id"), "sha256": record.get("sha256"), "content": content})
+            self.blob_bytes += len(content)
+        elif record_type == "file":
+            row = self._fields(record, FILE_FIELDS)
+            row["chat_id"] = self._chat_ref(record)
+            if row["blob_id"] not in self.blob_ids and not any(blob["id"] == row["blob_id"] for blob in self.blobs):
+                raise ImportFormatError(f"file {record.get('id')} refers to blob {row['blob_id']} before it")
+            self.files.append(row)
+        else:
+            raise ImportFormatError(f"Unknown record type {record_type!r}")
+        
+        if (
+            max(len(self.chats), len(self.messages), len(self.files), len(self.blobs)) >= IMPORT_BATCH_SIZE
+            or self.blob_bytes >= IMPORT_BATCH_BYTES
+        ):
+            await self.flush()
+    
+    @staticmethod
+    def _resolve(rows: List[dict], chat_ids: List[int]) -> None:
+        for row in rows:
+            if isinstance(row["chat_id"], tuple):
+                row["chat_id"] = chat_ids[row["chat_id"][1]]
+    
+    async def _flush_blobs(self) -> None:
+        """Store buffered blob text, reusing identical text already in the database"""
+        hashes = [blob["sha256"] for blob in self.blobs if blob["sha256"]]
+        existing = {}
+        if hashes:
+            existing = dict((await self.db.execute(
+                select(ContentBlob.sha256, ContentBlob.id).filter(ContentBlob.sha256.in_(hashes))
+            )).all())
+        
+        new_blobs = []
+        for blob in self.blobs:
+            if blob["sha256"] in existing:
+                self.blob_ids[blob["id"]] = existing[blob["sha256"]]
+            else:
+                new_blobs.append(blob)
+        if new_blobs:
+            now = datetime.utcnow()
+            blob_ids = (await self.db.execute(
+                ContentBlob.__table__.insert().returning(ContentBlob.__table__.c.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "sha256": blob["sha256"],
+                        "content": blob["content"],
+                        "size": len(blob["content"]),
+                        "ref_count": 0,
+                        "created_at": now
+                    } for blob in new_blobs
+                ]
+            )).scalars().all()
+            for blob, blob_id in zip(new_blobs, blob_ids):
+                self.blob_ids[blob["id"]] = blob_id
+            self.counts["blobs"] += len(new_blobs)
+        self.blobs = []
+        self.blob_bytes = 0
+    
+    async def flush(self) -> None:
+        # Core inserts: ORM bulk inserts spend more time than the database on these batches
+        if self.chats:
+            chat_ids = (await self.db.execute(
+                Chat.__table__.insert().returning(Chat.__table__.c.id, sort_by_parameter_order=True),
+                self.chats
+            )).scalars().all()
+            self._resolve(self.messages, chat_ids)
+            self._resolve(self.files, chat_ids)
+            if self.current_chat is not None:
+                # Later children of the last chat refer to it by its new id
+                self.current_chat_id = chat_ids[-1]
+            self.counts["chats"] += len(self.chats)
+            self.chats = []
+        
+        if self.blobs:
+            await self._flush_blobs()
+        
+        if self.messages:
+            await self.db.execute(Message.__table__.insert(), self.messages)
+            self.counts["messages"] += len(self.messages)
+            self.messages = []
+        
+        if self.files:
+            references: Dict[int, int] = {}
+            for row in self.files:
+                row["blob_id"] = self.blob_ids[row["blob_id"]]
+                references[row["blob_id"]] = references.get(row["blob_id"], 0) + 1
+            await self.db.execute(FileUpload.__table__.insert(), self.files)
+            blobs = ContentBlob.__table__
+            await self.db.execute(
+                blobs.update()
+                .where(blobs.c.id == bindparam("blob_id"))
+                .values(ref_count=blobs.c.ref_count + bindparam("references")),
+                [{"blob_id": blob_id, "references": count} for blob_id, count in references.items()]
+            )
+            self.counts["files"] += len(self.files)
+            self.files = []
+        
+        await self.db.commit()
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import delete, func, select
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.chat import CompletionCacheEntry
+
+logger = logging.getLogger(__name__)
+
+class MemoryCompletionStore:
+    """Completions kept in process memory, evicting the least recently used"""
+    
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+    
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+    
+    async def put(self, key: str, response: str) -> None:
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, response)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    async def size(self) -> int:
+        return len(self._entries)
+
+class DatabaseCompletionStore:
+    """Completions kept in the completion_cache table so they survive restarts"""
+    
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+    
+    async def get(self, key: str) -> Optional[str]:
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(
+                select(CompletionCacheEntry.response).filter(
+                    CompletionCacheEntry.key == key,
+                    CompletionCacheEntry.expires_at > datetime.utcnow()
+                )
+            )).scalar()
+    
+    async def put(self, key: str, response: str) -> None:
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            await db.merge(CompletionCacheEntry(
+                key=key,
+                response=response,
+                created_at=now,
+                expires_at=now + timedelta(seconds=self.ttl)
+            ))
+            await db.flush()
+            # Drop expired entries and the oldest ones beyond the size limit
+            overflow = (
+                select(CompletionCacheEntry.key)
+                .order_by(CompletionCacheEntry.created_at.desc())
+                .offset(self.max_entries)
+            )
+            await db.execute(
+                delete(CompletionCacheEntry).where(
+                    (CompletionCacheEntry.expires_at <= now)
+                    | CompletionCacheEntry.key.in_(overflow)
+                )
+            )
+            await db.commit()
+    
+    async def size(self) -> int:
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(func.count(CompletionCacheEntry.key)))).scalar()
+
+class CompletionCache:
+    """Opt-in cache of completions for byte-identical requests.
+    
+    Requests are keyed by provider, model, mode flags and a hash of the
+    full prompt (file context, history and message), so any change to the
+    conversation misses. Hit and miss counts are kept per process.
+    """
+    
+    BACKENDS = {
+        "memory": MemoryCompletionStore,
+        "database": DatabaseCompletionStore,
+    }
+    
+    def __init__(self, backend: str, max_entries: int, ttl: float):
+        self.backend = backend.lower()
+        store_class = self.BACKENDS.get(self.backend)
+        if self.backend and store_class is None:
+            logger.warning(f"Unknown completion cache backend {backend!r}; caching disabled")
+        self.store = store_class(max_entries, ttl) if store_class else None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+    
+    @staticmethod
+    def make_key(provider: str, model: str, think_mode: bool, deep_research_mode: bool, messages: List[dict]) -> str:
+        """Hash everything that determines a completion"""
+        payload = json.dumps(
+            [provider.lower(), model, think_mode, deep_research_mode, messages],
+            ensure_ascii=False,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a completion, counting the hit or miss"""
+        try:
+            response = await self.store.get(key)
+        except Exception as e:
+            # A broken cache must never fail the request
+            self.errors += 1
+            logger.warning(f"Completion cache lookup failed: {e}")
+            response = None
+        
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+    
+    async def put(self, key: str, response: str) -> None:
+        """Store a completion"""
+        try:
+            await self.store.put(key, response)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Completion cache store failed: {e}")
+    
+    async def stats(self) -> dict:
+        """Counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend if self.enabled else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": await self.store.size() if self.enabled else 0,
+        }
+
+# Global instance
+completion_cache = CompletionCache(
+    settings.completion_cache_backend,
+    settings.completion_cache_max_entries,
+    settings.completion_cache_ttl
+)
@@ -0,0 +1,82 @@
+import importlib
+from typing import List, Optional
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.chat import ContentBlob
+from .search_service import SearchService
+
+def _upsert_insert(dialect: str):
+    """The dialect's insert(), which has ON CONFLICT DO NOTHING.
+    
+    Imported on first use: the PostgreSQL dialect module alone adds about
+    50ms to every cold start on SQLite.
+    """
+    return importlib.import_module(f"sqlalchemy.dialects.{dialect}").insert
+
+class ContentStore:
+    """Content-addressed storage for extracted file text.
+    
+    Each distinct upload (by hash of its type and bytes) is extracted and
+    stored once; FileUpload rows reference the blob and ``ref_count`` tracks
+    how many do.
+    """
+    
+    @classmethod
+    async def get_by_hash(cls, db: AsyncSession, sha256: str) -> Optional[ContentBlob]:
+        """Find the stored text for an upload hash"""
+        return (await db.execute(
+            select(ContentBlob).filter(ContentBlob.sha256 == sha256)
+        )).scalars().first()
+    
+    @classmethod
+    async def create(cls, db: AsyncSession, sha256: str, content: str) -> ContentBlob:
+        """Store extracted text, reusing the blob if a concurrent upload stored it first.
+        
+        The blob is written in the caller's transaction, so it is only kept
+        if the file referencing it is. (A SAVEPOINT would not do: with no
+        write before it, pysqlite commits the blob on RELEASE.)
+        """
+        insert = _upsert_insert(db.bind.dialect.name)
+        blob_id = (await db.execute(
+            insert(ContentBlob)
+            .values(sha256=sha256, content=content, size=len(content), ref_count=0)
+            .on_conflict_do_nothing(index_elements=["sha256"])
+            .returning(ContentBlob.id)
+        )).scalar()
+        if blob_id is None:
+            return await cls.get_by_hash(db, sha256)
+        return await db.get(ContentBlob, blob_id)
+    
+    @classmethod
+    async def add_reference(cls, db: AsyncSession, blob_id: int) -> None:
+        """Record one more file referencing a blob"""
+        await db.execute(
+            update(ContentBlob)
+            .where(ContentBlob.id == blob_id)
+            .values(ref_count=ContentBlob.ref_count + 1)
+        )
+    
+    @classmethod
+    async def release(cls, db: AsyncSession, blob_ids: List[int]) -> None:
+        """Drop one reference per id in ``blob_ids`` and delete unreferenced blobs"""
+        if not blob_ids:
+            return
+        
+        counts = {}
+        for blob_id in blob_ids:
+            counts[blob_id] = counts.get(blob_id, 0) + 1
+        for blob_id, count in counts.items():
+            await db.execute(
+                update(ContentBlob)
+                .where(ContentBlob.id == blob_id)
+                .values(ref_count=ContentBlob.ref_count - count)
+            )
+        
+        unreferenced = (await db.execute(
+            select(ContentBlob.id).filter(ContentBlob.id.in_(counts), ContentBlob.ref_count <= 0)
+        )).scalars().all()
+        if unreferenced:
+            # Chunks and their postings follow through ON DELETE CASCADE; their
+            # search index entries need the blob's text to be removed
+            await SearchService.unindex_blobs(db, unreferenced)
+            await db.execute(delete(ContentBlob).filter(ContentBlob.id.in_(unreferenced)))
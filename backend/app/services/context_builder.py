@@ -0,0 +1,118 @@
+from functools import lru_cache
+from typing import Callable, List
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..models.chat import ChatSummary, Message
+
+# Context window sizes (prompt + completion) for known models
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "grok-beta": 131072,
+    "grok-2": 131072,
+    "grok-3": 131072,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens added by the chat format for every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+@lru_cache(maxsize=32)
+def get_token_counter(model: str) -> Callable[[str], int]:
+    """Get a cached token counting function for a model"""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Rough estimate when tiktoken or its encoding files are unavailable
+        return lambda text: len(text) // 4 + 1
+    
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+class ContextBuilder:
+    @classmethod
+    def get_context_window(cls, model: str) -> int:
+        """Get the context window for a model, matching on name prefix"""
+        if model in MODEL_CONTEXT_WINDOWS:
+            return MODEL_CONTEXT_WINDOWS[model]
+        for name in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+            if model.startswith(name):
+                return MODEL_CONTEXT_WINDOWS[name]
+        return DEFAULT_CONTEXT_WINDOW
+    
+    @classmethod
+    def count_tokens(cls, text: str, model: str) -> int:
+        """Count tokens in a message including chat format overhead"""
+        return get_token_counter(model)(text) + MESSAGE_OVERHEAD_TOKENS
+    
+    @classmethod
+    def get_history_budget(cls, model: str, prompt: str, max_tokens: int) -> int:
+        """Tokens left for history after the prompt and completion reserve"""
+        available = cls.get_context_window(model) - max_tokens - cls.count_tokens(prompt, model)
+        return max(0, min(available, settings.history_token_budget))
+    
+    @classmethod
+    async def build_history(
+        cls,
+        db: AsyncSession,
+        chat_id: int,
+        model: str,
+        prompt: str,
+        max_tokens: int
+    ) -> List[dict]:
+        """Build the most recent chat history that fits the model's token budget.
+        
+        Messages are streamed newest-first in small batches and counting stops
+        as soon as the budget is exhausted, so long chats are never fully loaded.
+        When the chat has a rolling summary, it stands in for the messages it
+        covers and only the ones after it are sent.
+        """
+        budget = cls.get_history_budget(model, prompt, max_tokens)
+        if budget <= 0:
+            return []
+        
+        query = select(Message.role, Message.content).filter(Message.chat_id == chat_id)
+        
+        summary = None
+        row = (await db.execute(
+            select(ChatSummary.content, ChatSummary.through_created_at, ChatSummary.through_message_id)
+            .filter(ChatSummary.chat_id == chat_id)
+        )).first()
+        if row is not None:
+            summary = {"role": "system", "content": SUMMARY_PREFIX + row.content}
+            summary_tokens = cls.count_tokens(summary["content"], model)
+            if summary_tokens <= budget:
+                budget -= summary_tokens
+                query = query.filter(
+                    tuple_(Message.created_at, Message.id) > tuple_(row.through_created_at, row.through_message_id)
+                )
+            else:
+                summary = None
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+        
+        history = []
+        used = 0
+        result = await db.stream(query.execution_options(yield_per=settings.history_batch_size))
+        try:
+            async for role, content in result:
+                tokens = cls.count_tokens(content, model)
+                if used + tokens > budget:
+                    break
+                history.append({"role": role, "content": content})
+                used += tokens
+        finally:
+            await result.close()
+        
+        history.reverse()
+        if summary is not None:
+            history.insert(0, summary)
+        return history
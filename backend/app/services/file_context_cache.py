@@ -0,0 +1,59 @@
+import sys
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+from ..core.config import settings
+
+class FileContextCache:
+    """In-process LRU cache of formatted file context, bounded by memory size.
+    
+    Entries are keyed by chat and by which content was selected (the whole
+    document set, or a particular set of retrieved chunks). Uploads and
+    deletes invalidate every entry of their chat.
+    """
+    
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[int, Hashable], str]" = OrderedDict()
+        self._size = 0
+        # Bumped by every invalidation; fills that started before one are dropped
+        self._generation = 0
+    
+    @property
+    def generation(self) -> int:
+        return self._generation
+    
+    def get(self, chat_id: int, key: Hashable) -> Optional[str]:
+        """Look up a chat's cached context, marking it recently used"""
+        entry_key = (chat_id, key)
+        context = self._entries.get(entry_key)
+        if context is not None:
+            self._entries.move_to_end(entry_key)
+        return context
+    
+    def put(self, chat_id: int, key: Hashable, context: str, generation: int) -> None:
+        """Cache context built from data read while ``generation`` was current"""
+        if generation != self._generation:
+            return
+        size = sys.getsizeof(context)
+        if size > self.max_bytes:
+            return
+        
+        entry_key = (chat_id, key)
+        previous = self._entries.pop(entry_key, None)
+        if previous is not None:
+            self._size -= sys.getsizeof(previous)
+        self._entries[entry_key] = context
+        self._size += size
+        
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= sys.getsizeof(evicted)
+    
+    def invalidate(self, chat_id: int) -> None:
+        """Drop all cached context of a chat"""
+        self._generation += 1
+        for entry_key in [entry_key for entry_key in self._entries if entry_key[0] == chat_id]:
+            self._size -= sys.getsizeof(self._entries.pop(entry_key))
+
+# Global instance
+file_context_cache = FileContextCache(settings.file_context_cache_bytes)
@@ -1,10 +1,40 @@
 import os
+import asyncio
+import hashlib
+import time
+import multiprocessing
 import aiofiles
-from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
 from fastapi import UploadFile, HTTPException
-import pypdf
-from docx import Document
 import tempfile
+from ..core.config import settings
+from ..core.metrics import metrics
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Runs of an extraction interrupted by other jobs' timeouts before it gives up
+EXTRACTION_ATTEMPTS = 3
+
+EXTRACTION_SECONDS = metrics.histogram(
+    "file_extraction_seconds",
+    "Time to extract the text of an upload",
+    ("file_type",)
+)
+
+def _extract_document_text(file_path: str, file_type: str) -> str:
+    """Parse a PDF or DOCX file. Runs in an extraction worker process."""
+    if file_type == 'pdf':
+        import pypdf
+        with open(file_path, 'rb') as file:
+            pdf_reader = pypdf.PdfReader(file)
+            return "\n".join(page.extract_text() for page in pdf_reader.pages).strip()
+    elif file_type == 'docx':
+        from docx import Document
+        doc = Document(file_path)
+        return "\n".join(paragraph.text for paragraph in doc.paragraphs).strip()
+    raise ValueError(f"Unsupported document type: {file_type}")
 
 class FileService:
     ALLOWED_EXTENSIONS = {
@@ -53,16 +83,78 @@ class FileService:
                 detail=f"File too large. Maximum size: {cls.MAX_FILE_SIZE // (1024*1024)}MB"
             )
     
+    _executor: Optional[ProcessPoolExecutor] = None
+    _slots: Optional[asyncio.Semaphore] = None
+    
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        """Get the extraction process pool, starting it on first use"""
+        if cls._executor is None:
+            cls._executor = ProcessPoolExecutor(
+                max_workers=settings.extraction_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return cls._executor
+    
+    @classmethod
+    def _discard_executor(cls, executor: ProcessPoolExecutor, kill: bool = False) -> None:
+        """Stop a pool and stop handing it out, unless it was already replaced"""
+        if cls._executor is executor:
+            cls._executor = None
+        if kill:
+            # A timed-out job can't be cancelled once running; stop the pool's workers.
+            # Its other jobs fail with BrokenProcessPool and are run again on a new pool.
+            for process in list((executor._processes or {}).values()):
+                process.kill()
+            executor.shutdown(wait=False)
+        else:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    @classmethod
+    def shutdown_executor(cls) -> None:
+        """Stop the extraction process pool"""
+        if cls._executor is not None:
+            cls._discard_executor(cls._executor)
+    
+    @classmethod
+    async def _run_extraction(cls, file_path: str, file_type: str) -> str:
+        """Run document parsing in the process pool with backpressure and a timeout"""
+        if cls._slots is None:
+            cls._slots = asyncio.Semaphore(settings.extraction_max_pending)
+        
+        try:
+            await asyncio.wait_for(cls._slots.acquire(), timeout=settings.extraction_queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Too many files are being processed, please retry shortly")
+        
+        try:
+            loop = asyncio.get_running_loop()
+            for attempt in range(EXTRACTION_ATTEMPTS):
+                executor = cls._get_executor()
+                future = loop.run_in_executor(executor, _extract_document_text, file_path, file_type)
+                try:
+                    return await asyncio.wait_for(future, timeout=settings.extraction_timeout)
+                except asyncio.TimeoutError:
+                    cls._discard_executor(executor, kill=True)
+                    raise HTTPException(status_code=500, detail=f"Timed out extracting text from {file_type.upper()}")
+                except BrokenProcessPool:
+                    if executor is cls._executor:
+                        # A worker died on its own, maybe on this file; later uploads get a new pool
+                        cls._discard_executor(executor)
+                        raise
+                    # Interrupted because another job timed out; run it again on the new pool
+                    if attempt == EXTRACTION_ATTEMPTS - 1:
+                        raise
+        finally:
+            cls._slots.release()
+    
     @classmethod
     async def extract_text_from_pdf(cls, file_path: str) -> str:
         """Extract text from PDF file"""
         try:
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = pypdf.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text.strip()
+            return await cls._run_extraction(file_path, 'pdf')
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error extracting text from PDF: {str(e)}")
     
@@ -70,11 +162,9 @@ class FileService:
     async def extract_text_from_docx(cls, file_path: str) -> str:
         """Extract text from DOCX file"""
         try:
-            doc = Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text.strip()
+            return await cls._run_extraction(file_path, 'docx')
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error extracting text from DOCX: {str(e)}")
     
@@ -97,33 +187,48 @@ class FileService:
             raise HTTPException(status_code=500, detail=f"Error reading text file: {str(e)}")
     
     @classmethod
-    async def extract_text_from_file(cls, file: UploadFile) -> str:
-        """Extract text content from uploaded file"""
-        await cls.validate_file(file)
+    async def save_upload_to_temp_file(cls, file: UploadFile) -> Tuple[str, str]:
+        """Stream an upload to a temporary file in chunks, enforcing the size limit.
         
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            # Write uploaded file to temp file
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
+        Returns the temp file path and a SHA-256 content address of the upload.
+        The hash covers the file type too, since extraction depends on it.
+        """
+        fd, temp_file_path = tempfile.mkstemp()
+        os.close(fd)
         
+        digest = hashlib.sha256(f"{cls.get_file_type(file.filename)}\0".encode())
         try:
-            file_type = cls.get_file_type(file.filename)
-            
-            if file_type == 'pdf':
-                return await cls.extract_text_from_pdf(temp_file_path)
-            elif file_type == 'docx':
-                return await cls.extract_text_from_docx(temp_file_path)
-            elif file_type in ['txt', 'md']:
-                return await cls.extract_text_from_txt(temp_file_path)
-            else:
-                raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_type}")
+            size = 0
+            async with aiofiles.open(temp_file_path, 'wb') as temp_file:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > cls.MAX_FILE_SIZE:
+                        raise HTTPException(
+                            status_code=400, 
+                            detail=f"File too large. Maximum size: {cls.MAX_FILE_SIZE // (1024*1024)}MB"
+                        )
+                    digest.update(chunk)
+                    await temp_file.write(chunk)
+        except BaseException:
+            os.unlink(temp_file_path)
+            raise
         
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
+        return temp_file_path, digest.hexdigest()
+    
+    @classmethod
+    async def extract_text(cls, file_path: str, file_type: str) -> str:
+        """Extract text content from a saved upload"""
+        started = time.perf_counter()
+        if file_type == 'pdf':
+            text = await cls.extract_text_from_pdf(file_path)
+        elif file_type == 'docx':
+            text = await cls.extract_text_from_docx(file_path)
+        elif file_type in ['txt', 'md']:
+            text = await cls.extract_text_from_txt(file_path)
+        else:
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_type}")
+        EXTRACTION_SECONDS.observe(time.perf_counter() - started, file_type)
+        return text
     
     @classmethod
     def format_file_context(cls, files: List[dict]) -> str:
@@ -131,12 +236,12 @@ class FileService:
         if not files:
             return ""
         
-        context = "\n\n--- CONTEXT FILES ---\n"
+        parts = ["\n\n--- CONTEXT FILES ---\n"]
         for file in files:
-            context += f"\nFile: {file['original_filename']}\n"
-            context += f"Type: {file['file_type']}\n"
-            context += f"Content:\n{file['content']}\n"
-            context += "-" * 50 + "\n"
+            parts.append(f"\nFile: {file['original_filename']}\n")
+            parts.append(f"Type: {file['file_type']}\n")
+            parts.append(f"Content:\n{file['content']}\n")
+            parts.append("-" * 50 + "\n")
         
-        context += "\n--- END CONTEXT FILES ---\n\n"
-        return context 
\ No newline at end of file
+        parts.append("\n--- END CONTEXT FILES ---\n\n")
+        return "".join(parts) 
\ No newline at end of file
@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.chat import GenerationJob, Message
+from ..schemas.chat import MessageCreate
+from .ai_service import ai_service
+from .stream_generation import StreamGeneration
+
+logger = logging.getLogger(__name__)
+
+class GenerationJobQueue:
+    """The generation_jobs table as a work queue.
+    
+    Workers claim the oldest queued job with a single UPDATE; on PostgreSQL
+    the candidate row is picked with FOR UPDATE SKIP LOCKED so concurrent
+    workers never wait on each other, while SQLite serializes the writes.
+    A claimed job holds a lock until ``locked_until``; if its worker dies
+    another one picks it up once the lock expires. Idle workers poll with
+    a plain SELECT (``has_work``) and only claim once it finds a job, so an
+    empty queue costs no writes.
+    """
+    
+    @classmethod
+    def _runnable(cls, now: datetime):
+        """Jobs waiting for a worker: queued, or running with an expired lock"""
+        return or_(
+            GenerationJob.status == "queued",
+            and_(
+                GenerationJob.status == "running",
+                GenerationJob.locked_until < now,
+                GenerationJob.attempts < settings.generation_job_max_attempts
+            )
+        )
+    
+    @classmethod
+    async def enqueue(
+        cls,
+        db: AsyncSession,
+        chat_id: int,
+        message: MessageCreate,
+        history: List[dict],
+        file_context: str
+    ) -> GenerationJob:
+        """Add a job to the session; the caller commits"""
+        job = GenerationJob(
+            chat_id=chat_id,
+            status="queued",
+            payload=json.dumps({
+                "message": message.model_dump(),
+                "history": history,
+                "file_context": file_context,
+            }),
+            attempts=0
+        )
+        db.add(job)
+        return job
+    
+    @classmethod
+    async def has_work(cls) -> bool:
+        """Whether any job is waiting, without taking locks or writing"""
+        async with AsyncSessionLocal() as db:
+            job_id = (await db.execute(
+                select(GenerationJob.id).where(cls._runnable(datetime.utcnow())).limit(1)
+            )).scalar()
+            return job_id is not None
+    
+    @classmethod
+    async def claim(cls, worker_id: str) -> Optional[GenerationJob]:
+        """Take the oldest runnable job and create the message its answer goes to"""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            candidate = (
+                select(GenerationJob.id)
+                .where(cls._runnable(now))
+                .order_by(GenerationJob.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            job = (await db.execute(
+                update(GenerationJob)
+                .where(GenerationJob.id == candidate)
+                .values(
+                    status="running",
+                    attempts=GenerationJob.attempts + 1,
+                    worker_id=worker_id,
+                    locked_until=now + timedelta(seconds=settings.generation_job_timeout),
+                    started_at=now
+                )
+                .returning(GenerationJob)
+            )).scalar()
+            if job is None:
+                return None
+            
+            if job.message_id is None:
+                message = Message(chat_id=job.chat_id, role="assistant", content="", truncated=True)
+                db.add(message)
+                await db.flush()
+                job.message_id = message.id
+            await db.commit()
+            return job
+    
+    @classmethod
+    async def finish(cls, job_id: int, status: str, error: Optional[str] = None) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(GenerationJob)
+                .where(GenerationJob.id == job_id)
+                .values(status=status, error=error, locked_until=None, finished_at=datetime.utcnow())
+            )
+            await db.commit()
+    
+    @classmethod
+    async def release(cls, job_id: int) -> None:
+        """Put an interrupted job back in the queue"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(GenerationJob)
+                .where(GenerationJob.id == job_id)
+                .values(status="queued", locked_until=None)
+            )
+            await db.commit()
+    
+    @classmethod
+    async def sweep(cls) -> None:
+        """Fail jobs whose workers kept dying and delete old finished jobs"""
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(GenerationJob)
+                .where(
+                    GenerationJob.status == "running",
+                    GenerationJob.locked_until < now,
+                    GenerationJob.attempts >= settings.generation_job_max_attempts
+                )
+                .values(status="failed", error="Generation did not finish", locked_until=None, finished_at=now)
+            )
+            await db.execute(
+                delete(GenerationJob).where(
+                    GenerationJob.status.in_(["completed", "failed"]),
+                    GenerationJob.finished_at < now - timedelta(seconds=settings.generation_job_retention)
+                )
+            )
+            await db.commit()
+
+class GenerationWorker:
+    """A pool of async loops that run generation jobs.
+    
+    Runs inside the API process (GENERATION_WORKERS) or on its own with
+    ``python -m app.worker``. Jobs enqueued by this process wake the pool
+    at once; jobs from other processes are picked up by polling.
+    """
+    
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.tasks: List[asyncio.Task] = []
+        # Replaced on every notify; idle loops wait for it to be set
+        self._wakeup = asyncio.Event()
+        # Shared by the loops so the process sweeps once per interval
+        self._next_sweep = 0.0
+        
+        # Counters for stats
+        self.completed = 0
+        self.failed = 0
+        self.busy = 0
+    
+    def start(self) -> None:
+        for _ in range(self.concurrency):
+            self.tasks.append(asyncio.create_task(self._loop()))
+        if self.tasks:
+            logger.info(f"Started {len(self.tasks)} generation workers")
+    
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+    
+    def notify(self) -> None:
+        """Wake idle loops after a job was enqueued"""
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+    
+    async def _sweep_if_due(self) -> None:
+        now = asyncio.get_running_loop().time()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + settings.generation_job_sweep_seconds
+        await GenerationJobQueue.sweep()
+    
+    async def _loop(self) -> None:
+        while True:
+            try:
+                job = None
+                if await GenerationJobQueue.has_work():
+                    job = await GenerationJobQueue.claim(self.worker_id)
+                if job is None:
+                    await self._sweep_if_due()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), settings.generation_job_poll_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Generation worker error: {e}")
+                await asyncio.sleep(settings.generation_job_poll_seconds)
+    
+    async def _run(self, job: GenerationJob) -> None:
+        payload = json.loads(job.payload)
+        message = MessageCreate(**payload["message"])
+        generation = StreamGeneration(
+            job.chat_id,
+            ai_service.get_streaming_response(
+                message.content,
+                message.model_provider,
+                message.model_name,
+                message.think_mode,
+                message.deep_research_mode,
+                payload["history"],
+                payload["file_context"]
+            ),
+            message.model_name,
+            ai_service.max_tokens(message.deep_research_mode),
+            message_id=job.message_id,
+            stream_id=job_stream_id(job.id),
+            # The job runs to the end whether or not anyone is reading
+            cancel_when_abandoned=False
+        )
+        
+        self.busy += 1
+        generation.start()
+        try:
+            await asyncio.wait_for(asyncio.shield(generation.task), settings.generation_job_timeout)
+        except asyncio.TimeoutError:
+            generation.cancel()
+            await generation.task
+        except asyncio.CancelledError:
+            # Shutting down: keep what was generated and let another worker redo the job
+            generation.cancel()
+            await asyncio.gather(generation.task, return_exceptions=True)
+            await GenerationJobQueue.release(job.id)
+            raise
+        finally:
+            self.busy -= 1
+        
+        if generation.status == "completed":
+            self.completed += 1
+            await GenerationJobQueue.finish(job.id, "completed")
+        else:
+            self.failed += 1
+            error = generation.error or "Generation timed out"
+            await GenerationJobQueue.finish(job.id, "failed", error)
+    
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.tasks),
+            "busy": self.busy,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+def job_stream_id(job_id: int) -> str:
+    """Stream registry id of a job's generation"""
+    return f"job-{job_id}"
+
+# Global instance
+generation_worker = GenerationWorker(settings.generation_workers)
@@ -0,0 +1,102 @@
+import json
+import logging
+import time
+from typing import Dict, Optional, Tuple
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Route = Tuple[str, str]  # (provider, model)
+
+class CircuitBreaker:
+    """Stops routing to a provider after consecutive failures.
+    
+    Once open, the provider is skipped until ``reset_timeout`` has passed;
+    after that requests may probe it again and a success closes the breaker.
+    """
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+    
+    def allow(self) -> bool:
+        return self.state != "open"
+    
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+    
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.state == "half_open":
+                logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+class ProviderRouter:
+    """Fallback routes between providers and per-provider circuit breakers.
+    
+    Routes come from the AI_FALLBACK_ROUTES JSON setting, mapping
+    "provider:model" (or just "provider") to a fallback "provider:model".
+    """
+    
+    def __init__(self, routes: str = ""):
+        self.routes: Dict[str, Route] = {}
+        if routes:
+            try:
+                self.routes = {
+                    key.lower(): self._parse_route(value)
+                    for key, value in json.loads(routes).items()
+                }
+            except (ValueError, AttributeError) as e:
+                logger.error(f"Ignoring invalid AI_FALLBACK_ROUTES: {e}")
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        
+        # Counters for stats
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+    
+    @staticmethod
+    def _parse_route(value: str) -> Route:
+        provider, separator, model = value.partition(":")
+        if not separator or not model:
+            raise ValueError(f"fallback route {value!r} must be 'provider:model'")
+        return provider.lower(), model
+    
+    def fallback_for(self, provider: str, model: str) -> Optional[Route]:
+        """The mapped fallback of a provider and model, if any"""
+        provider = provider.lower()
+        return self.routes.get(f"{provider}:{model.lower()}") or self.routes.get(provider)
+    
+    def breaker(self, provider: str) -> CircuitBreaker:
+        provider = provider.lower()
+        breaker = self.breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(settings.ai_breaker_failure_threshold, settings.ai_breaker_reset_timeout)
+            self.breakers[provider] = breaker
+        return breaker
+    
+    def stats(self) -> dict:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "breakers": {
+                provider: {"state": breaker.state, "failures": breaker.failures}
+                for provider, breaker in self.breakers.items()
+            },
+        }
+
+# Global instance
+provider_router = ProviderRouter(settings.ai_fallback_routes)
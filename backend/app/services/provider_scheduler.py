@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class ProviderBusyError(Exception):
+    """A request could not be admitted or kept being throttled by the provider"""
+    
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Refills ``rate_per_minute`` units per minute up to one minute's worth"""
+    
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.level = float(rate_per_minute)
+        self.updated_at = time.monotonic()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def delay(self, amount: float) -> float:
+        """Seconds until ``amount`` units are available; 0 for unlimited buckets"""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+    
+    def consume(self, amount: float) -> None:
+        if self.rate:
+            self.level -= min(amount, self.capacity)
+
+class ProviderLane:
+    """Admission control for one provider/model pair.
+    
+    Requests wait in a FIFO queue until a concurrency slot is free and the
+    request and token buckets allow them, or until their deadline passes.
+    """
+    
+    def __init__(self, name: str, max_in_flight: int, requests_per_minute: float, tokens_per_minute: float):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.queue: deque = deque()
+        # Replaced on every state change; waiters re-check when it is set
+        self._changed = asyncio.Event()
+        
+        # Counters for stats
+        self.admitted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+    
+    def _admission_delay(self, tokens: int) -> Optional[float]:
+        """Seconds until the head of the queue may start; None while all slots are busy"""
+        if self.in_flight >= self.max_in_flight:
+            return None
+        return max(
+            self.paused_until - time.monotonic(),
+            self.requests.delay(1),
+            self.tokens.delay(tokens),
+            0.0
+        )
+    
+    async def acquire(self, tokens: int, timeout: float) -> None:
+        ticket = object()
+        started_at = time.monotonic()
+        deadline = started_at + timeout
+        
+        self.queue.append(ticket)
+        try:
+            while True:
+                delay = self._admission_delay(tokens) if self.queue[0] is ticket else None
+                if delay == 0:
+                    break
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise ProviderBusyError(
+                        f"{self.name} is busy, please try again shortly",
+                        retry_after=delay if delay is not None else timeout
+                    )
+                try:
+                    await asyncio.wait_for(
+                        self._changed.wait(),
+                        remaining if delay is None else min(delay, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.queue.remove(ticket)
+            # The next request in line may be able to start now
+            self._notify()
+        
+        self.requests.consume(1)
+        self.tokens.consume(tokens)
+        self.in_flight += 1
+        
+        waited = time.monotonic() - started_at
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+    
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._notify()
+    
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    def pause(self, seconds: float) -> None:
+        """Hold back new requests after the provider throttled us"""
+        self.throttled += 1
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+    
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": len(self.queue),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "throttled": self.throttled,
+            "average_wait_seconds": self.total_wait / self.admitted if self.admitted else 0.0,
+            "max_wait_seconds": self.max_wait,
+        }
+
+class ProviderScheduler:
+    """Lanes of admission control, one per provider and model.
+    
+    Limits default to the AI_MAX_IN_FLIGHT, AI_REQUESTS_PER_MINUTE and
+    AI_TOKENS_PER_MINUTE settings and can be overridden per "provider" or
+    "provider:model" through the AI_LANE_LIMITS JSON setting.
+    """
+    
+    def __init__(self, lane_limits: str = ""):
+        self.lanes: Dict[Tuple[str, str], ProviderLane] = {}
+        self.overrides: Dict[str, dict] = {}
+        if lane_limits:
+            try:
+                self.overrides = {key.lower(): value for key, value in json.loads(lane_limits).items()}
+            except (ValueError, AttributeError) as e:
+                logger.error(f"Ignoring invalid AI_LANE_LIMITS: {e}")
+    
+    def _limits(self, provider: str, model: str) -> dict:
+        limits = {
+            "max_in_flight": settings.ai_max_in_flight,
+            "requests_per_minute": settings.ai_requests_per_minute,
+            "tokens_per_minute": settings.ai_tokens_per_minute,
+        }
+        limits.update(self.overrides.get(provider, {}))
+        limits.update(self.overrides.get(f"{provider}:{model.lower()}", {}))
+        return limits
+    
+    def get_lane(self, provider: str, model: str) -> ProviderLane:
+        key = (provider.lower(), model)
+        lane = self.lanes.get(key)
+        if lane is None:
+            limits = self._limits(*key)
+            lane = ProviderLane(
+                f"{key[0]}:{model}",
+                int(limits["max_in_flight"]),
+                float(limits["requests_per_minute"]),
+                float(limits["tokens_per_minute"])
+            )
+            self.lanes[key] = lane
+        return lane
+    
+    @asynccontextmanager
+    async def slot(self, provider: str, model: str, tokens: int) -> AsyncIterator[ProviderLane]:
+        """Hold an admitted request slot for the duration of a provider call"""
+        lane = self.get_lane(provider, model)
+        await lane.acquire(tokens, settings.ai_queue_timeout)
+        try:
+            yield lane
+        finally:
+            lane.release()
+    
+    def stats(self) -> dict:
+        return {lane.name: lane.stats() for lane in self.lanes.values()}
+
+# Global instance
+provider_scheduler = ProviderScheduler(settings.ai_lane_limits)
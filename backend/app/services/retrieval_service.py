@@ -0,0 +1,288 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.config import settings
+from ..models.chat import ChunkTerm, ContentBlob, FileChunk, FileUpload
+from .file_service import FileService
+from .file_context_cache import file_context_cache
+from .search_service import SearchService
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being
+below between both but by can did do does doing down during each few for from further had has
+have having he her here hers herself him himself his how i if in into is it its itself just me
+more most my myself no nor not now of off on once only or other our ours ourselves out over own
+same she should so some such than that the their theirs them themselves then there these they
+this those through to too under until up very was we were what when where which while who whom
+why will with you your yours yourself yourselves
+""".split())
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Maximum number of distinct query terms looked up per message
+MAX_QUERY_TERMS = 32
+
+# File context cache keys for whole-document context and the no-match fallback
+FULL_CONTEXT_KEY = "full"
+OPENING_CHUNKS_KEY = "opening"
+
+class RetrievalService:
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        """Split text into lowercase index terms"""
+        return [
+            term for term in TOKEN_PATTERN.findall(text.lower())
+            if len(term) > 1 and term not in STOPWORDS
+        ]
+    
+    @classmethod
+    def chunk_spans(cls, text: str) -> List[Tuple[int, int]]:
+        """Split text into overlapping (start, end) chunks, breaking on whitespace where possible"""
+        size = settings.retrieval_chunk_chars
+        overlap = min(settings.retrieval_chunk_overlap, size // 2)
+        
+        chunks = []
+        start = 0
+        while start < len(text):
+            end = min(start + size, len(text))
+            if end < len(text):
+                # Prefer to cut at the last whitespace in the second half of the window
+                cut = text.rfind(" ", start + size // 2, end)
+                if cut == -1:
+                    cut = text.rfind("\n", start + size // 2, end)
+                if cut != -1:
+                    end = cut
+            chunk = text[start:end]
+            if chunk.strip():
+                # Without the surrounding whitespace
+                leading = len(chunk) - len(chunk.lstrip())
+                chunks.append((start + leading, start + leading + len(chunk.strip())))
+            if end >= len(text):
+                break
+            start = max(end - overlap, start + 1)
+        return chunks
+    
+    @classmethod
+    async def _create_chunks(cls, db: AsyncSession, blob_id: int, content: str) -> Dict[int, Counter]:
+        """Split a blob's text into chunks shared by every file using the blob.
+        
+        Chunks are searchable once this returns. Returns the term counts of
+        each new chunk by chunk id.
+        """
+        spans = cls.chunk_spans(content)
+        if not spans:
+            return {}
+        
+        chunk_terms = [Counter(cls.tokenize(content[start:end])) for start, end in spans]
+        chunk_ids = (await db.execute(
+            insert(FileChunk).returning(FileChunk.id, sort_by_parameter_order=True),
+            [
+                {
+                    "blob_id": blob_id,
+                    "chunk_index": chunk_index,
+                    "start_offset": start,
+                    "end_offset": end,
+                    "term_count": sum(terms.values())
+                } for chunk_index, ((start, end), terms) in enumerate(zip(spans, chunk_terms))
+            ]
+        )).scalars().all()
+        await SearchService.index_chunks(
+            db,
+            {chunk_id: content[start:end] for chunk_id, (start, end) in zip(chunk_ids, spans)}
+        )
+        return dict(zip(chunk_ids, chunk_terms))
+    
+    @classmethod
+    async def _insert_postings(cls, db: AsyncSession, blob_id: int, chunk_terms: Dict[int, Counter]) -> None:
+        """Insert inverted index entries for a blob's chunks"""
+        postings = [
+            {
+                "blob_id": blob_id,
+                "term": term,
+                "chunk_id": chunk_id,
+                "term_frequency": frequency
+            }
+            for chunk_id, terms in chunk_terms.items()
+            for term, frequency in terms.items()
+        ]
+        if postings:
+            # Core insert: postings run to hundreds of thousands of rows for large files
+            await db.execute(ChunkTerm.__table__.insert(), postings)
+    
+    @classmethod
+    async def index_file(cls, db: AsyncSession, blob_id: int, content: Optional[str] = None) -> None:
+        """Make a blob's text searchable in every chat with a file using it.
+        
+        Chunks and their postings are created once per blob (``content`` is
+        only needed for a blob that has none yet); chats reach them through
+        their file_uploads, so another upload of the same file writes nothing.
+        Postings go with the blob's chunks when the blob is deleted.
+        """
+        has_chunks = (await db.execute(
+            select(FileChunk.id).filter(FileChunk.blob_id == blob_id).limit(1)
+        )).scalar() is not None
+        if not has_chunks:
+            if content is None:
+                content = (await db.execute(
+                    select(ContentBlob.content).filter(ContentBlob.id == blob_id)
+                )).scalar()
+            await cls._insert_postings(db, blob_id, await cls._create_chunks(db, blob_id, content))
+            return
+        
+        has_postings = (await db.execute(
+            select(ChunkTerm.chunk_id).filter(ChunkTerm.blob_id == blob_id).limit(1)
+        )).scalar() is not None
+        if not has_postings:
+            # Chunked before postings were kept per blob, while only archived chats used it
+            if content is None:
+                content = (await db.execute(
+                    select(ContentBlob.content).filter(ContentBlob.id == blob_id)
+                )).scalar()
+            chunks = (await db.execute(
+                select(FileChunk.id, FileChunk.start_offset, FileChunk.end_offset).filter(FileChunk.blob_id == blob_id)
+            )).all()
+            await cls._insert_postings(
+                db,
+                blob_id,
+                {chunk_id: Counter(cls.tokenize(content[start:end])) for chunk_id, start, end in chunks}
+            )
+    
+    @classmethod
+    async def _index_missing_files(cls, db: AsyncSession, chat_id: int) -> None:
+        """Index files whose text was stored before chunking was introduced"""
+        has_chunks = select(FileChunk.id).filter(FileChunk.blob_id == FileUpload.blob_id).exists()
+        unindexed = (await db.execute(
+            select(FileUpload.blob_id)
+            .filter(FileUpload.chat_id == chat_id, ~has_chunks)
+            .distinct()
+        )).scalars().all()
+        for blob_id in unindexed:
+            await cls.index_file(db, blob_id)
+        if unindexed:
+            await db.commit()
+    
+    @classmethod
+    async def search(cls, db: AsyncSession, chat_id: int, query: str, top_k: int) -> List[int]:
+        """Rank the chat's file chunks against a query with BM25"""
+        terms = list(dict.fromkeys(cls.tokenize(query)))[:MAX_QUERY_TERMS]
+        if not terms:
+            return []
+        
+        chat_blobs = select(FileUpload.blob_id).filter(FileUpload.chat_id == chat_id)
+        postings = (await db.execute(
+            select(ChunkTerm.chunk_id, ChunkTerm.term, ChunkTerm.term_frequency)
+            .filter(ChunkTerm.blob_id.in_(chat_blobs), ChunkTerm.term.in_(terms))
+        )).all()
+        if not postings:
+            return []
+        
+        chunk_count, average_length = (await db.execute(
+            select(func.count(FileChunk.id), func.avg(FileChunk.term_count))
+            .filter(FileChunk.blob_id.in_(chat_blobs))
+        )).one()
+        average_length = float(average_length or 1) or 1.0
+        
+        document_frequency = Counter(term for _, term, _ in postings)
+        candidate_ids = {chunk_id for chunk_id, _, _ in postings}
+        lengths = dict((await db.execute(
+            select(FileChunk.id, FileChunk.term_count).filter(FileChunk.id.in_(candidate_ids))
+        )).all())
+        
+        scores: Dict[int, float] = {}
+        for chunk_id, term, frequency in postings:
+            df = document_frequency[term]
+            idf = math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths.get(chunk_id, 0) / average_length)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        
+        return sorted(scores, key=scores.get, reverse=True)[:top_k]
+    
+    @classmethod
+    async def build_file_context(cls, db: AsyncSession, chat_id: int, query: str) -> str:
+        """Build the file context for a message.
+        
+        Small document sets are included whole. Larger ones contribute only
+        the top-k chunks most relevant to the query, falling back to the
+        opening chunk of each file when nothing matches. Formatted context is
+        cached per chat until its files change.
+        """
+        # Whole-document context (or no files at all) doesn't depend on the query
+        cached = file_context_cache.get(chat_id, FULL_CONTEXT_KEY)
+        if cached is not None:
+            return cached
+        generation = file_context_cache.generation
+        
+        total_size = (await db.execute(
+            select(func.coalesce(func.sum(FileUpload.file_size), 0))
+            .filter(FileUpload.chat_id == chat_id)
+        )).scalar()
+        if not total_size:
+            file_context_cache.put(chat_id, FULL_CONTEXT_KEY, "", generation)
+            return ""
+        
+        if total_size > settings.retrieval_full_context_chars:
+            await cls._index_missing_files(db, chat_id)
+            chunk_ids = await cls.search(db, chat_id, query, settings.retrieval_top_k)
+            cache_key = tuple(sorted(chunk_ids)) or OPENING_CHUNKS_KEY
+            cached = file_context_cache.get(chat_id, cache_key)
+            if cached is not None:
+                return cached
+        else:
+            cache_key = FULL_CONTEXT_KEY
+        
+        # One entry per distinct blob, named after its first upload in the chat
+        files = (await db.execute(
+            select(FileUpload.blob_id, FileUpload.original_filename, FileUpload.file_type)
+            .filter(FileUpload.chat_id == chat_id)
+            .order_by(FileUpload.id)
+        )).all()
+        file_names: Dict[int, Tuple[str, str]] = {}
+        for blob_id, original_filename, file_type in files:
+            file_names.setdefault(blob_id, (original_filename, file_type))
+        
+        if cache_key == FULL_CONTEXT_KEY:
+            contents = dict((await db.execute(
+                select(ContentBlob.id, ContentBlob.content).filter(ContentBlob.id.in_(file_names))
+            )).all())
+            context = FileService.format_file_context([
+                {
+                    'original_filename': original_filename,
+                    'file_type': file_type,
+                    'content': contents[blob_id]
+                } for blob_id, (original_filename, file_type) in file_names.items()
+            ])
+        else:
+            chunk_filter = FileChunk.id.in_(cache_key) if cache_key != OPENING_CHUNKS_KEY else FileChunk.chunk_index == 0
+            rows = (await db.execute(
+                select(FileChunk.blob_id, FileChunk.start_offset, FileChunk.end_offset)
+                .filter(FileChunk.blob_id.in_(file_names), chunk_filter)
+                .order_by(FileChunk.blob_id, FileChunk.chunk_index)
+            )).all()
+            # Chunks are offsets into their blob's text, read once per blob
+            contents = dict((await db.execute(
+                select(ContentBlob.id, ContentBlob.content)
+                .filter(ContentBlob.id.in_({blob_id for blob_id, _, _ in rows}))
+            )).all())
+            
+            # Group the selected chunks per file in document order
+            chunks_by_blob: Dict[int, List[str]] = {}
+            for blob_id, start, end in rows:
+                chunks_by_blob.setdefault(blob_id, []).append(contents[blob_id][start:end])
+            
+            context = FileService.format_file_context([
+                {
+                    'original_filename': file_names[blob_id][0],
+                    'file_type': file_names[blob_id][1],
+                    'content': "\n...\n".join(chunks)
+                } for blob_id, chunks in chunks_by_blob.items()
+            ])
+        
+        file_context_cache.put(chat_id, cache_key, context, generation)
+        return context
@@ -0,0 +1,305 @@
+import html
+import re
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Integer, bindparam, cast, column, func, insert, join, literal, literal_column, null, select, table, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.chat import ArchivedFile, ArchivedMessage, Chat, ContentBlob, FileChunk, FileUpload, Message
+
+QUERY_TERM_PATTERN = re.compile(r"\w+")
+
+# Maximum number of query terms passed to the full-text index
+MAX_QUERY_TERMS = 32
+
+# Approximate number of words around the matches in a snippet
+SNIPPET_WORDS = 16
+
+# Highlight delimiters used inside the database, replaced by <mark> once the snippet is escaped
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+# FTS5 tables kept in step with messages and file_chunks on SQLite (revision 0010)
+# and with the text of archived messages (revision 0017)
+messages_fts = table("messages_fts", column("rowid"))
+file_chunks_fts = table("file_chunks_fts", column("rowid"), column("content"), column("file_chunks_fts"))
+archived_messages_fts = table("archived_messages_fts", column("rowid"))
+
+# PostgreSQL's index of chunk text, set by index_chunks rather than generated (revision 0019)
+file_chunks_vectors = table("file_chunks", column("id"), column("search_vector"))
+
+# A chunk's text sliced from its blob in SQL, for PostgreSQL, which stores blobs uncompressed
+chunk_text = func.substr(ContentBlob.content, FileChunk.start_offset + 1, FileChunk.end_offset - FileChunk.start_offset)
+chunks_with_blobs = join(FileChunk, ContentBlob, ContentBlob.id == FileChunk.blob_id)
+
+# Message text of live chats and of archived ones, with its FTS5 table
+MESSAGE_TABLES = ((Message, messages_fts, "messages_fts"), (ArchivedMessage, archived_messages_fts, "archived_messages_fts"))
+
+class SearchService:
+    """Ranked full-text search over messages and uploaded file text.
+    
+    SQLite uses FTS5 tables ranked with bm25(); PostgreSQL uses generated
+    tsvector columns with GIN indexes ranked with ts_rank_cd(). Both are
+    maintained by the database as rows are written, so searching never
+    scans the tables. Archived chats are found through archived_messages
+    and archived_files. File text is searched per chunk and each file is
+    reported once, at its best chunk. Snippets are built only for the
+    requested page.
+    
+    Chunks hold offsets into their blob rather than text, so the database
+    can't index them by itself: their text is indexed when they are created
+    and, on SQLite, unindexed before their blob is deleted.
+    """
+    
+    @classmethod
+    def chunk_index_statement(cls, dialect: str):
+        """Statement indexing chunk text, executed with {"chunk_id", "chunk_text"} rows"""
+        if dialect == "sqlite":
+            return insert(file_chunks_fts).values(rowid=bindparam("chunk_id"), content=bindparam("chunk_text"))
+        return (
+            update(file_chunks_vectors)
+            .where(file_chunks_vectors.c.id == bindparam("chunk_id"))
+            .values(search_vector=func.to_tsvector("english", bindparam("chunk_text")))
+        )
+    
+    @classmethod
+    async def index_chunks(cls, db: AsyncSession, chunks: Dict[int, str]) -> None:
+        """Make new chunks searchable, given their text by chunk id"""
+        if chunks:
+            await db.execute(
+                cls.chunk_index_statement(db.bind.dialect.name),
+                [{"chunk_id": chunk_id, "chunk_text": text} for chunk_id, text in chunks.items()]
+            )
+    
+    @classmethod
+    async def unindex_blobs(cls, db: AsyncSession, blob_ids: List[int]) -> None:
+        """Remove the chunks of blobs about to be deleted from the search index.
+        
+        Only needed on SQLite, where FTS5 deletes an entry by its text.
+        """
+        if db.bind.dialect.name != "sqlite":
+            return
+        for blob_id in blob_ids:
+            chunks = (await db.execute(
+                select(FileChunk.id, FileChunk.start_offset, FileChunk.end_offset).filter(FileChunk.blob_id == blob_id)
+            )).all()
+            if not chunks:
+                continue
+            content = (await db.execute(select(ContentBlob.content).filter(ContentBlob.id == blob_id))).scalar()
+            await db.execute(
+                insert(file_chunks_fts).values(
+                    file_chunks_fts="delete",
+                    rowid=bindparam("chunk_id"),
+                    content=bindparam("chunk_text")
+                ),
+                [{"chunk_id": chunk_id, "chunk_text": content[start:end]} for chunk_id, start, end in chunks]
+            )
+    
+    @classmethod
+    def query_terms(cls, query: str) -> List[str]:
+        return QUERY_TERM_PATTERN.findall(query)[:MAX_QUERY_TERMS]
+    
+    @classmethod
+    def _sqlite_match(cls, fts_name: str, terms: List[str]):
+        # Each term quoted, so user input can't form FTS5 syntax; terms are ANDed
+        expression = " ".join(f'"{term}"' for term in terms)
+        return literal_column(fts_name).op("MATCH")(expression)
+    
+    @classmethod
+    def _message_hits(cls, dialect: str, terms: List[str], chat_id: Optional[int]) -> list:
+        """Message hits as (id, chat_id, score), one query per message table"""
+        hits = []
+        for model, fts, fts_name in MESSAGE_TABLES:
+            if dialect == "sqlite":
+                query = (
+                    select(model.id.label("id"), model.chat_id.label("chat_id"), (-func.bm25(literal_column(fts_name))).label("score"))
+                    .select_from(fts)
+                    .join(model, model.id == fts.c.rowid)
+                    .where(cls._sqlite_match(fts_name, terms))
+                )
+                # "+ 0" keeps SQLite from probing the FTS table once per message of the
+                # chat, which recomputes the bm25 statistics on every probe
+                chat_column = model.chat_id + 0
+            else:
+                tsquery = func.websearch_to_tsquery("english", " ".join(terms))
+                vector = literal_column(f"{model.__tablename__}.search_vector")
+                query = (
+                    select(model.id.label("id"), model.chat_id.label("chat_id"), func.ts_rank_cd(vector, tsquery).label("score"))
+                    .where(vector.op("@@")(tsquery))
+                )
+                chat_column = model.chat_id
+            if chat_id is not None:
+                query = query.where(chat_column == chat_id)
+            hits.append(query)
+        return hits
+    
+    @classmethod
+    def _ranked_hits(cls, dialect: str, terms: List[str], chat_id: Optional[int]):
+        """Union of message and file hits as (type, id, chat_id, chunk_id, score), best first"""
+        if dialect == "sqlite":
+            chunk_score = -func.bm25(literal_column("file_chunks_fts"))
+            chunk_hits = (
+                select(FileChunk.id.label("chunk_id"), FileChunk.blob_id.label("blob_id"), chunk_score.label("score"))
+                .select_from(file_chunks_fts)
+                .join(FileChunk, FileChunk.id == file_chunks_fts.c.rowid)
+                .where(cls._sqlite_match("file_chunks_fts", terms))
+                .subquery()
+            )
+        else:
+            tsquery = func.websearch_to_tsquery("english", " ".join(terms))
+            chunk_vector = literal_column("file_chunks.search_vector")
+            chunk_hits = (
+                select(FileChunk.id.label("chunk_id"), FileChunk.blob_id.label("blob_id"), func.ts_rank_cd(chunk_vector, tsquery).label("score"))
+                .where(chunk_vector.op("@@")(tsquery))
+                .subquery()
+            )
+        
+        # Files of live and archived chats reach their text through the blob
+        file_hits = []
+        for model in (FileUpload, ArchivedFile):
+            query = (
+                select(model.id.label("id"), model.chat_id.label("chat_id"), chunk_hits.c.chunk_id, chunk_hits.c.score)
+                .join(model, model.blob_id == chunk_hits.c.blob_id)
+            )
+            if chat_id is not None:
+                query = query.where(model.chat_id == chat_id)
+            file_hits.append(query)
+        file_hits = union_all(*file_hits).subquery()
+        
+        # Rank each file's matching chunks so only the best one is reported
+        file_chunk_hits = select(
+            file_hits,
+            func.row_number().over(
+                partition_by=file_hits.c.id,
+                order_by=(file_hits.c.score.desc(), file_hits.c.chunk_id)
+            ).label("position")
+        ).subquery()
+        
+        hits = union_all(
+            *(
+                message_hits.add_columns(literal("message").label("type"), cast(null(), Integer).label("chunk_id"))
+                for message_hits in cls._message_hits(dialect, terms, chat_id)
+            ),
+            select(
+                file_chunk_hits.c.id,
+                file_chunk_hits.c.chat_id,
+                file_chunk_hits.c.score,
+                literal("file").label("type"),
+                file_chunk_hits.c.chunk_id
+            ).where(file_chunk_hits.c.position == 1)
+        ).subquery()
+        return select(hits.c.type, hits.c.id, hits.c.chat_id, hits.c.chunk_id, hits.c.score).order_by(
+            hits.c.score.desc(), hits.c.type, hits.c.id.desc()
+        )
+    
+    @classmethod
+    async def _snippets(
+        cls,
+        db: AsyncSession,
+        dialect: str,
+        terms: List[str],
+        message_ids: List[int],
+        chunk_ids: List[int]
+    ) -> Tuple[Dict[int, str], Dict[int, str]]:
+        """Highlighted snippets by message id and by chunk id"""
+        # A message id is in messages or in archived_messages, so both are asked
+        sources = [(model, model.id, model.content, fts, fts_name, message_ids, 0) for model, fts, fts_name in MESSAGE_TABLES]
+        sources.append((chunks_with_blobs, FileChunk.id, chunk_text, file_chunks_fts, "file_chunks_fts", chunk_ids, 1))
+        tsquery = func.websearch_to_tsquery("english", " ".join(terms))
+        options = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS // 2}"
+        snippets = ({}, {})
+        for source, row_id, content, fts, fts_name, ids, kind in sources:
+            if not ids:
+                continue
+            if dialect == "sqlite":
+                query = select(
+                    fts.c.rowid,
+                    func.snippet(literal_column(fts_name), 0, HIGHLIGHT_START, HIGHLIGHT_END, "…", SNIPPET_WORDS)
+                ).where(cls._sqlite_match(fts_name, terms), fts.c.rowid.in_(ids))
+            else:
+                query = (
+                    select(row_id, func.ts_headline("english", content, tsquery, options))
+                    .select_from(source)
+                    .where(row_id.in_(ids))
+                )
+            snippets[kind].update((await db.execute(query)).all())
+        
+        return tuple(
+            {
+                row_id: html.escape(snippet).replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_END, "</mark>")
+                for row_id, snippet in by_id.items()
+            } for by_id in snippets
+        )
+    
+    @classmethod
+    async def search(
+        cls,
+        db: AsyncSession,
+        query: str,
+        chat_id: Optional[int] = None,
+        skip: int = 0,
+        limit: int = 20
+    ) -> Tuple[List[dict], bool]:
+        """One page of ranked results and whether more follow.
+        
+        Snippets are HTML-escaped with matches wrapped in <mark>.
+        """
+        terms = cls.query_terms(query)
+        if not terms:
+            return [], False
+        dialect = db.bind.dialect.name
+        
+        # Fetch one extra row to know whether another page follows
+        hits = (await db.execute(
+            cls._ranked_hits(dialect, terms, chat_id).offset(skip).limit(limit + 1)
+        )).all()
+        has_more = len(hits) > limit
+        hits = hits[:limit]
+        if not hits:
+            return [], False
+        
+        message_ids = [hit.id for hit in hits if hit.type == "message"]
+        file_ids = [hit.id for hit in hits if hit.type == "file"]
+        chunk_ids = [hit.chunk_id for hit in hits if hit.type == "file"]
+        
+        message_snippets, chunk_snippets = await cls._snippets(db, dialect, terms, message_ids, chunk_ids)
+        chat_titles = dict((await db.execute(
+            select(Chat.id, Chat.title).where(Chat.id.in_({hit.chat_id for hit in hits}))
+        )).all())
+        messages = {}
+        if message_ids:
+            for model in (Message, ArchivedMessage):
+                messages.update((row.id, row) for row in (await db.execute(
+                    select(model.id, model.role, model.created_at).where(model.id.in_(message_ids))
+                )).all())
+        files = {}
+        if file_ids:
+            for model in (FileUpload, ArchivedFile):
+                files.update((row.id, row) for row in (await db.execute(
+                    select(model.id, model.original_filename, model.created_at).where(model.id.in_(file_ids))
+                )).all())
+        
+        results = []
+        for hit in hits:
+            result = {
+                "type": hit.type,
+                "chat_id": hit.chat_id,
+                "chat_title": chat_titles.get(hit.chat_id, ""),
+                "score": float(hit.score),
+            }
+            if hit.type == "message":
+                message = messages[hit.id]
+                result.update(
+                    message_id=hit.id,
+                    role=message.role,
+                    snippet=message_snippets.get(hit.id, ""),
+                    created_at=message.created_at
+                )
+            else:
+                file = files[hit.id]
+                result.update(
+                    file_id=hit.id,
+                    filename=file.original_filename,
+                    snippet=chunk_snippets.get(hit.chunk_id, ""),
+                    created_at=file.created_at
+                )
+            results.append(result)
+        return results, has_more
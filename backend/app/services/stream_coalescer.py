@@ -0,0 +1,74 @@
+import asyncio
+import time
+from typing import AsyncGenerator, AsyncIterator, List
+
+async def coalesce_stream(
+    stream: AsyncIterator[str],
+    max_chars: int,
+    max_delay: float
+) -> AsyncGenerator[str, None]:
+    """Merge small stream deltas into larger chunks.
+    
+    The first delta is passed through immediately to keep time-to-first-token
+    low. After that, deltas are buffered and flushed once the buffer reaches
+    ``max_chars`` or ``max_delay`` seconds have passed since the oldest
+    buffered delta, whichever comes first. A non-positive ``max_delay``
+    disables coalescing.
+    """
+    if max_delay <= 0:
+        async for chunk in stream:
+            yield chunk
+        return
+    
+    iterator = stream.__aiter__()
+    buffer: List[str] = []
+    buffered_chars = 0
+    deadline = None
+    first = True
+    # Keep one pending read across flushes; cancelling __anext__ on a timeout
+    # would tear down the upstream generator.
+    pending = None
+    
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            
+            if not done:
+                # Time window elapsed with data buffered
+                yield "".join(buffer)
+                buffer, buffered_chars, deadline = [], 0, None
+                continue
+            
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                break
+            
+            if first:
+                first = False
+                yield chunk
+                continue
+            
+            buffer.append(chunk)
+            buffered_chars += len(chunk)
+            if deadline is None:
+                deadline = time.monotonic() + max_delay
+            if buffered_chars >= max_chars:
+                yield "".join(buffer)
+                buffer, buffered_chars, deadline = [], 0, None
+        
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            # Let the cancelled read unwind before closing the generator it runs in
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import update
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.chat import Message
+from .chat_summary import chat_summary_scheduler
+from .context_builder import ContextBuilder
+from .stream_coalescer import coalesce_stream
+
+logger = logging.getLogger(__name__)
+
+class ReplayExpiredError(Exception):
+    """The requested events are no longer in the replay buffer"""
+
+class StreamMetrics:
+    """Process-wide counters of streamed generations"""
+    
+    def __init__(self):
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.abandoned = 0
+        self.resumed = 0
+        self.replayed_events = 0
+        # Estimated completion tokens not generated because the client left
+        self.tokens_saved = 0
+    
+    def stats(self) -> dict:
+        return {
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "abandoned": self.abandoned,
+            "resumed": self.resumed,
+            "replayed_events": self.replayed_events,
+            "tokens_saved": self.tokens_saved,
+            "resumable": len(stream_registry.streams),
+        }
+
+class StreamGeneration:
+    """One streamed completion, run in its own task apart from the HTTP response.
+    
+    Event ids are character offsets: a content event's id is the length of
+    the answer up to and including it, and the final event's id is one past
+    the answer. The latest events are kept in a bounded replay buffer, so a
+    client that lost its connection can resume from its Last-Event-ID. The
+    answer is checkpointed to the messages table while it grows. Once no
+    client has been reading for the resume grace period the task is
+    cancelled, which closes the upstream provider stream, and whatever was
+    generated is stored marked as truncated. The last reader leaving cancels
+    it at once when there is no grace period or it could not resume anyway.
+    """
+    
+    def __init__(
+        self,
+        chat_id: int,
+        stream: AsyncIterator[str],
+        model: str,
+        max_tokens: int,
+        message_id: Optional[int] = None,
+        stream_id: Optional[str] = None,
+        cancel_when_abandoned: bool = True
+    ):
+        self.id = stream_id or uuid.uuid4().hex
+        self.chat_id = chat_id
+        self.stream = stream
+        self.model = model
+        self.max_tokens = max_tokens
+        self.chunks: List[str] = []
+        # Existing message to write the answer to; created on first save otherwise
+        self.message_id = message_id
+        self.cancel_when_abandoned = cancel_when_abandoned
+        self.task: Optional[asyncio.Task] = None
+        self.generating = False
+        self.status: Optional[str] = None  # completed, failed or abandoned once finished
+        self.error: Optional[str] = None
+        
+        # (event id, event) pairs
+        self.buffer: deque = deque(maxlen=settings.stream_replay_buffer_events)
+        self.length = 0
+        self.last_event_id = 0
+        self.finished = False
+        # Replaced on every new event; readers wait for it to be set
+        self._changed = asyncio.Event()
+        
+        self.subscribers = 0
+        self._cancel_handle: Optional[asyncio.TimerHandle] = None
+    
+    def start(self) -> None:
+        stream_metrics.started += 1
+        stream_registry.add(self)
+        self.generating = True
+        self.task = asyncio.create_task(self._run())
+    
+    def cancel(self) -> None:
+        """Stop generating; a no-op once the provider stream has ended"""
+        if self.generating:
+            self.task.cancel()
+    
+    def attach(self) -> None:
+        """Register a reader, keeping the generation alive"""
+        self.subscribers += 1
+        if self._cancel_handle is not None:
+            self._cancel_handle.cancel()
+            self._cancel_handle = None
+    
+    def detach(self, after: int) -> None:
+        """Unregister a reader that got the events up to offset ``after``.
+        
+        The last one leaving starts the resume grace period.
+        """
+        self.subscribers -= 1
+        if self.subscribers > 0 or not self.generating or not self.cancel_when_abandoned:
+            return
+        grace = settings.stream_resume_grace_seconds
+        if grace > 0 and self.can_resume(after):
+            self._cancel_handle = asyncio.get_running_loop().call_later(grace, self.cancel)
+        else:
+            self.cancel()
+    
+    def _publish(self, event: dict) -> None:
+        if "content" in event:
+            self.length += len(event["content"])
+            self.last_event_id = self.length
+        else:
+            self.last_event_id = self.length + 1
+        self.buffer.append((self.last_event_id, event))
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    async def _run(self) -> None:
+        error = None
+        checkpointed_at = time.monotonic()
+        try:
+            async for chunk in coalesce_stream(
+                self.stream,
+                settings.stream_flush_chars,
+                settings.stream_flush_interval_ms / 1000
+            ):
+                self.chunks.append(chunk)
+                self._publish({"content": chunk})
+                
+                if time.monotonic() - checkpointed_at >= settings.stream_checkpoint_interval_seconds:
+                    await self._save("".join(self.chunks), truncated=True)
+                    checkpointed_at = time.monotonic()
+            status = "completed"
+        except asyncio.CancelledError:
+            status = "abandoned"
+        except Exception as e:
+            status = "failed"
+            error = str(e)
+        self.generating = False
+        self.status = status
+        self.error = error
+        
+        content = "".join(self.chunks)
+        if status == "completed" or content:
+            await self._save(content, truncated=status != "completed")
+        
+        if status == "completed":
+            stream_metrics.completed += 1
+            self._publish({"done": True})
+            chat_summary_scheduler.schedule(self.chat_id)
+        elif status == "failed":
+            stream_metrics.failed += 1
+            self._publish({"error": error})
+        else:
+            stream_metrics.abandoned += 1
+            generated = ContextBuilder.count_tokens(content, self.model) if content else 0
+            stream_metrics.tokens_saved += max(self.max_tokens - generated, 0)
+            self._publish({"error": "Generation was stopped", "truncated": True})
+        
+        self.finished = True
+        # Stay resumable for a while so a reconnecting client still gets the ending
+        asyncio.get_running_loop().call_later(
+            settings.stream_resume_grace_seconds,
+            stream_registry.remove,
+            self.id
+        )
+    
+    async def _save(self, content: str, truncated: bool) -> None:
+        """Store or update the assistant message in a short-lived session"""
+        try:
+            async with AsyncSessionLocal() as db:
+                if self.message_id is None:
+                    message = Message(
+                        chat_id=self.chat_id,
+                        role="assistant",
+                        content=content,
+                        truncated=truncated
+                    )
+                    db.add(message)
+                    await db.commit()
+                    self.message_id = message.id
+                else:
+                    await db.execute(
+                        update(Message)
+                        .where(Message.id == self.message_id)
+                        .values(content=content, truncated=truncated)
+                    )
+                    await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to save assistant message for chat {self.chat_id}: {e}")
+    
+    @staticmethod
+    def _event_start(event_id: int, event: dict) -> int:
+        """Offset of the answer an event starts at"""
+        return event_id - len(event["content"]) if "content" in event else event_id - 1
+    
+    def check_replay(self, after: int) -> None:
+        """Raise ReplayExpiredError unless everything after offset ``after`` is still buffered"""
+        oldest = self._event_start(*self.buffer[0]) if self.buffer else 0
+        if after < oldest or after > self.last_event_id:
+            raise ReplayExpiredError(f"Events after {after} are no longer available")
+    
+    def can_resume(self, after: int) -> bool:
+        try:
+            self.check_replay(after)
+        except ReplayExpiredError:
+            return False
+        return True
+    
+    def events_after(self, after: int) -> List[Tuple[int, dict]]:
+        events = []
+        for event_id, event in self.buffer:
+            if event_id <= after:
+                continue
+            start = self._event_start(event_id, event)
+            if "content" in event and start < after:
+                # Resuming part-way into an event, e.g. after following a checkpoint
+                event = {"content": event["content"][after - start:]}
+            events.append((event_id, event))
+        return events
+    
+    async def events(
+        self,
+        is_disconnected: Callable[[], Awaitable[bool]],
+        after: int = 0
+    ) -> AsyncGenerator[Tuple[int, dict], None]:
+        """Yield numbered events after ``after`` until the generation ends or the client disconnects"""
+        poll_interval = settings.stream_disconnect_poll_ms / 1000
+        cursor = after
+        while True:
+            try:
+                self.check_replay(cursor)
+            except ReplayExpiredError:
+                # This reader fell further behind than the buffer holds
+                yield cursor, {"error": "Stream fell behind and cannot be resumed"}
+                return
+            
+            pending = self.events_after(cursor)
+            if not pending:
+                if self.finished:
+                    return
+                try:
+                    await asyncio.wait_for(self._changed.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                # Checked on every wakeup: some servers never fail a send to a gone client
+                if await is_disconnected():
+                    return
+                continue
+            
+            for event_id, event in pending:
+                yield event_id, event
+                cursor = event_id
+                if "content" not in event:
+                    return
+            if await is_disconnected():
+                return
+
+class StreamRegistry:
+    """Generations of this process that can still be resumed, by stream id"""
+    
+    def __init__(self):
+        self.streams: Dict[str, StreamGeneration] = {}
+    
+    def add(self, generation: StreamGeneration) -> None:
+        self.streams[generation.id] = generation
+    
+    def get(self, stream_id: str) -> Optional[StreamGeneration]:
+        return self.streams.get(stream_id)
+    
+    def remove(self, stream_id: str) -> None:
+        self.streams.pop(stream_id, None)
+
+# Global instances
+stream_metrics = StreamMetrics()
+stream_registry = StreamRegistry()
@@ -0,0 +1,79 @@
+"""Export or import chats as NDJSON against DATABASE_URL.
+
+    python -m app.transfer export [--output FILE] [--gzip] [--chat-id ID ...]
+    python -m app.transfer import FILE
+
+Exporting from one deployment and importing into another (e.g. SQLite to
+PostgreSQL) migrates the history; imported chats get new ids. "-" reads
+from stdin or writes to stdout. Gzipped input is detected automatically.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import AsyncIterator
+from .core.database import AsyncSessionLocal, async_engine
+from .core.migrations import run_migrations
+from .services.chat_transfer import ChatTransfer
+
+READ_SIZE = 1024 * 1024
+
+async def _read_chunks(stream) -> AsyncIterator[bytes]:
+    while chunk := stream.read(READ_SIZE):
+        yield chunk
+
+async def export(output, compress: bool, chat_ids) -> None:
+    async with AsyncSessionLocal() as db:
+        async for data in ChatTransfer.encode_ndjson(ChatTransfer.export_records(db, chat_ids), compress):
+            output.write(data)
+    output.flush()
+
+async def import_file(stream) -> dict:
+    async with AsyncSessionLocal() as db:
+        return await ChatTransfer.import_records(db, ChatTransfer.decode_ndjson(_read_chunks(stream)))
+
+async def run(args) -> int:
+    try:
+        if args.command == "export":
+            output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+            try:
+                await export(output, args.gzip, args.chat_id)
+            finally:
+                if output is not sys.stdout.buffer:
+                    output.close()
+            return 0
+        
+        stream = sys.stdin.buffer if args.file == "-" else open(args.file, "rb")
+        started = time.perf_counter()
+        try:
+            counts = await import_file(stream)
+        except ValueError as e:
+            print(f"Import failed: {e}", file=sys.stderr)
+            return 1
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+        elapsed = time.perf_counter() - started
+        rows = sum(counts.values())
+        print(f"Imported {counts} in {elapsed:.1f}s ({rows / max(elapsed, 1e-6):.0f} rows/s)", file=sys.stderr)
+        return 0
+    finally:
+        await async_engine.dispose()
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="write chats as NDJSON")
+    export_parser.add_argument("--output", "-o", default="-")
+    export_parser.add_argument("--gzip", action="store_true", help="compress the output")
+    export_parser.add_argument("--chat-id", type=int, action="append", help="only this chat; repeatable")
+    import_parser = commands.add_parser("import", help="add chats from an NDJSON export")
+    import_parser.add_argument("file")
+    args = parser.parse_args()
+    
+    if args.command == "import":
+        run_migrations()
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
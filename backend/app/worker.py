@@ -0,0 +1,29 @@
+"""Run generation workers without the API: python -m app.worker [concurrency]"""
+import asyncio
+import logging
+import signal
+import sys
+from .core.config import settings
+from .services.ai_service import ai_service
+from .services.generation_jobs import GenerationWorker
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def run(concurrency: int) -> None:
+    worker = GenerationWorker(concurrency)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    
+    worker.start()
+    try:
+        await stopping.wait()
+    finally:
+        logger.info("Stopping generation workers")
+        await worker.stop()
+        await ai_service.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else max(settings.generation_workers, 1)))
@@ -0,0 +1,4 @@
+"""Cold start checks, load tests and benchmarks, kept out of the app package.
+
+Run them from backend/ with ``python -m benchmarks.<name> --help``.
+"""
@@ -0,0 +1,164 @@
+"""Benchmark full-text search: python -m benchmarks.search_benchmark [options]
+
+Fills the database at DATABASE_URL with synthetic chats, messages and file
+chunks, then times SearchService.search for rare, common and multi-term
+queries. Works on SQLite and PostgreSQL alike; run it once per backend
+against a scratch database, which must not contain any chats.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import func, insert, select
+from app.core.database import AsyncSessionLocal, SessionLocal, async_engine
+from app.core.migrations import run_migrations
+from app.models.chat import Chat, ContentBlob, FileChunk, FileUpload, Message
+from app.services.search_service import SearchService
+
+VOCABULARY_SIZE = 20000
+WORDS_PER_MESSAGE = 60
+WORDS_PER_CHUNK = 250
+BATCH_SIZE = 5000
+
+def _vocabulary(rng: random.Random) -> list:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(4, 10))))
+    return sorted(words)
+
+def _text(rng: random.Random, vocabulary: list, weights: list, words: int) -> str:
+    # Zipf-like word frequencies, so some terms are in most rows and most are rare
+    return " ".join(rng.choices(vocabulary, cum_weights=weights, k=words))
+
+def seed(chats: int, messages_per_chat: int, chunks_per_chat: int, rng: random.Random, vocabulary: list) -> float:
+    """Insert the synthetic history; returns rows per second including index upkeep"""
+    weights = []
+    total = 0.0
+    for rank in range(1, len(vocabulary) + 1):
+        total += 1 / rank
+        weights.append(total)
+    
+    started = time.perf_counter()
+    rows = 0
+    now = datetime.utcnow()
+    chats_per_batch = max(BATCH_SIZE // max(messages_per_chat, 1), 1)
+    with SessionLocal() as db:
+        dialect = db.bind.dialect.name
+        for first_chat in range(0, chats, chats_per_batch):
+            batch = range(first_chat, min(first_chat + chats_per_batch, chats))
+            chat_ids = db.execute(
+                insert(Chat).returning(Chat.id, sort_by_parameter_order=True),
+                [{"title": f"Chat {index}", "created_at": now, "updated_at": now} for index in batch]
+            ).scalars().all()
+            db.execute(insert(Message), [
+                {
+                    "chat_id": chat_id,
+                    "role": "user" if turn % 2 == 0 else "assistant",
+                    "content": _text(rng, vocabulary, weights, WORDS_PER_MESSAGE),
+                    "truncated": False,
+                    "created_at": now
+                } for chat_id in chat_ids for turn in range(messages_per_chat)
+            ])
+            rows += len(chat_ids) * messages_per_chat
+            
+            if chunks_per_chat:
+                for chat_id in chat_ids:
+                    chunks = [_text(rng, vocabulary, weights, WORDS_PER_CHUNK) for _ in range(chunks_per_chat)]
+                    blob_id = db.execute(
+                        insert(ContentBlob).returning(ContentBlob.id),
+                        [{"content": "\n".join(chunks), "size": sum(map(len, chunks)), "ref_count": 1, "created_at": now}]
+                    ).scalar()
+                    offsets = [0]
+                    for chunk in chunks:
+                        offsets.append(offsets[-1] + len(chunk) + 1)
+                    chunk_ids = db.execute(
+                        insert(FileChunk).returning(FileChunk.id, sort_by_parameter_order=True),
+                        [
+                            {
+                                "blob_id": blob_id,
+                                "chunk_index": index,
+                                "start_offset": offsets[index],
+                                "end_offset": offsets[index] + len(chunk),
+                                "term_count": WORDS_PER_CHUNK
+                            } for index, chunk in enumerate(chunks)
+                        ]
+                    ).scalars().all()
+                    db.execute(SearchService.chunk_index_statement(dialect), [
+                        {"chunk_id": chunk_id, "chunk_text": chunk} for chunk_id, chunk in zip(chunk_ids, chunks)
+                    ])
+                    db.execute(insert(FileUpload), [{
+                        "chat_id": chat_id,
+                        "filename": f"{blob_id}.txt",
+                        "original_filename": f"document-{blob_id}.txt",
+                        "file_type": "txt",
+                        "file_size": sum(map(len, chunks)),
+                        "blob_id": blob_id,
+                        "created_at": now
+                    }])
+                    rows += chunks_per_chat
+            db.commit()
+    return rows / (time.perf_counter() - started)
+
+async def measure(queries: dict, repeat: int, chat_id: int) -> list:
+    """(label, p50 ms, p95 ms, results on the first page) per query"""
+    results = []
+    async with AsyncSessionLocal() as db:
+        for label, query in queries.items():
+            for restricted in (False, True):
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    page, _ = await SearchService.search(db, query, chat_id if restricted else None)
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                results.append((
+                    f"{label}{' in one chat' if restricted else ''}",
+                    statistics.median(timings),
+                    timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+                    len(page)
+                ))
+    await async_engine.dispose()
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=2000)
+    parser.add_argument("--messages-per-chat", type=int, default=50)
+    parser.add_argument("--chunks-per-chat", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    
+    run_migrations()
+    with SessionLocal() as db:
+        if db.execute(select(func.count(Chat.id))).scalar():
+            print("The database already has chats; point DATABASE_URL at a scratch database", file=sys.stderr)
+            return 1
+    
+    rng = random.Random(args.seed)
+    vocabulary = _vocabulary(rng)
+    print(f"Backend: {async_engine.dialect.name}")
+    rate = seed(args.chats, args.messages_per_chat, args.chunks_per_chat, rng, vocabulary)
+    print(f"Inserted {args.chats * (args.messages_per_chat + args.chunks_per_chat)} indexed rows at {rate:.0f} rows/s")
+    
+    # Vocabulary is in frequency order: early words are common, late ones rare
+    queries = {
+        "rare term": vocabulary[-1],
+        "medium term": vocabulary[500],
+        "common term": vocabulary[0],
+        "two terms": f"{vocabulary[10]} {vocabulary[200]}",
+        "no match": "zzzzzzzzzzzz",
+    }
+    print(f"{'query':<28} {'p50':>9} {'p95':>9} {'hits':>5}")
+    with SessionLocal() as db:
+        chat_id = db.execute(select(func.min(Chat.id))).scalar()
+    for label, p50, p95, hits in asyncio.run(measure(queries, args.repeat, chat_id)):
+        print(f"{label:<28} {p50:>7.1f}ms {p95:>7.1f}ms {hits:>5}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
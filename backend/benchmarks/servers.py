@@ -0,0 +1,36 @@
+"""Starting uvicorn processes for the benchmarks and waiting for them to answer"""
+import socket
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from typing import Optional
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for(url: str, started: float, timeout: float) -> Optional[float]:
+    """Seconds from ``started`` until ``url`` answers 200, or None on timeout"""
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(0.02)
+    return None
+
+def start(command: list, env: Optional[dict], ready_url: str, timeout: float = 30) -> subprocess.Popen:
+    """Run ``command`` and wait until ``ready_url`` answers; raises if it doesn't in time"""
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if wait_for(ready_url, time.perf_counter(), timeout) is None:
+        stop(process)
+        raise RuntimeError(f"{' '.join(command)} did not start")
+    return process
+
+def stop(process: subprocess.Popen) -> None:
+    process.terminate()
+    process.wait()
@@ -0,0 +1,200 @@
+"""Load test concurrent message streams: python -m benchmarks.stream_load_test [options]
+
+Starts a fake OpenAI-compatible provider that streams every answer over about
+--stream-seconds, and the API on a scratch SQLite database pointed at it. For
+each concurrency level it opens that many SSE streams at once and reports the
+wall time, time to first token, and /health latency while they run. With
+async provider clients the wall time stays close to one stream's as the
+level grows; a client that blocks the event loop serializes the streams, so
+wall time grows with the level and /health waits behind them.
+
+Past what one core can serve, first tokens queue up while /health stays fast.
+On SQLite, writers beyond that wait on the database lock and may fail with
+"database is locked"; pass --database-url to measure on PostgreSQL.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from . import servers
+
+LEVELS = "1,10,50,100,200"
+STREAM_SECONDS = 1.0
+CHUNKS = 20
+
+def _fake_provider():
+    """OpenAI-compatible app that streams CHUNKS deltas over STREAM_SECONDS"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+    
+    chunks = int(os.getenv("LOAD_TEST_CHUNKS", str(CHUNKS)))
+    delay = float(os.getenv("LOAD_TEST_STREAM_SECONDS", str(STREAM_SECONDS))) / chunks
+    provider = FastAPI()
+    
+    @provider.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        if not body.get("stream"):
+            return JSONResponse({
+                "id": "load-test",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            })
+        
+        async def events():
+            for index in range(chunks):
+                await asyncio.sleep(delay)
+                chunk = {
+                    "id": "load-test",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": f"token{index} "}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+    
+    return provider
+
+async def _stream(client, base_url: str, chat_id: int) -> float:
+    """Seconds to the first token of one streamed answer; raises if it does not finish"""
+    started = time.perf_counter()
+    first_token = None
+    payload = {"content": "Tell me a story", "model_provider": "openai", "model_name": "gpt-3.5-turbo"}
+    async with client.stream("POST", f"{base_url}/api/chats/{chat_id}/messages/stream", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            data = json.loads(line[6:])
+            if data.get("content") and first_token is None:
+                first_token = time.perf_counter() - started
+            elif data.get("error"):
+                raise RuntimeError(data["error"])
+            elif data.get("done"):
+                return first_token if first_token is not None else time.perf_counter() - started
+    raise RuntimeError("Stream ended without finishing")
+
+async def _probe_health(client, base_url: str, stop: asyncio.Event) -> list:
+    """/health round trips in milliseconds until ``stop`` is set"""
+    timings = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await client.get(f"{base_url}/health")
+        timings.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.05)
+    return timings
+
+def _describe(error: Exception) -> str:
+    response = getattr(error, "response", None)
+    if response is not None:
+        return f"HTTP {response.status_code}"
+    return f"{type(error).__name__}: {error}"
+
+def _p95(values: list) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * 0.95), len(values) - 1)]
+
+async def measure(base_url: str, levels: list) -> list:
+    """(streams, wall s, first token p50/p95 ms, /health p95 ms, failures) per level"""
+    import httpx
+    
+    results = []
+    limits = httpx.Limits(max_connections=max(levels) + 10)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        for streams in levels:
+            chat_ids = []
+            for _ in range(streams):
+                response = await client.post(f"{base_url}/api/chats", json={"title": "Load test"})
+                chat_ids.append(response.json()["id"])
+            
+            stop = asyncio.Event()
+            probe = asyncio.create_task(_probe_health(client, base_url, stop))
+            started = time.perf_counter()
+            outcomes = await asyncio.gather(
+                *(_stream(client, base_url, chat_id) for chat_id in chat_ids),
+                return_exceptions=True
+            )
+            wall = time.perf_counter() - started
+            stop.set()
+            health = await probe
+            
+            first_tokens = [outcome * 1000 for outcome in outcomes if isinstance(outcome, float)]
+            errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+            results.append((
+                streams,
+                wall,
+                statistics.median(first_tokens) if first_tokens else float("nan"),
+                _p95(first_tokens) if first_tokens else float("nan"),
+                _p95(health) if health else float("nan"),
+                errors
+            ))
+    return results
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", default=LEVELS, help="comma-separated numbers of concurrent streams")
+    parser.add_argument("--stream-seconds", type=float, default=STREAM_SECONDS)
+    parser.add_argument("--chunks", type=int, default=CHUNKS)
+    parser.add_argument("--database-url", help="scratch database for the API; a new SQLite file by default")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+    
+    provider_port = servers.free_port()
+    api_port = servers.free_port()
+    env = dict(
+        os.environ,
+        LOAD_TEST_CHUNKS=str(args.chunks),
+        LOAD_TEST_STREAM_SECONDS=str(args.stream_seconds),
+        DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load_test.db')}",
+        ASYNC_DATABASE_URL="",
+        OPENAI_API_KEY="load-test",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{provider_port}/v1",
+        # Admit every stream at once and keep background work out of the numbers
+        AI_MAX_IN_FLIGHT=str(max(levels)),
+        AI_REQUESTS_PER_MINUTE="0",
+        AI_TOKENS_PER_MINUTE="0",
+        AI_LANE_LIMITS="",
+        AI_FALLBACK_ROUTES="",
+        COMPLETION_CACHE_BACKEND="",
+        GENERATION_WORKERS="0",
+        CHAT_SUMMARY_EVERY="0",
+        CHAT_ARCHIVE_AFTER="0",
+    )
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning"]
+    provider = servers.start(
+        uvicorn + ["--factory", "benchmarks.stream_load_test:_fake_provider", "--port", str(provider_port)],
+        env,
+        f"http://127.0.0.1:{provider_port}/docs"
+    )
+    try:
+        api = servers.start(uvicorn + ["app.main:app", "--port", str(api_port)], env, f"http://127.0.0.1:{api_port}/ready")
+        try:
+            results = asyncio.run(measure(f"http://127.0.0.1:{api_port}", levels))
+        finally:
+            servers.stop(api)
+    finally:
+        servers.stop(provider)
+    
+    print(f"One stream takes about {args.stream_seconds:.2f}s at the provider")
+    print(f"{'streams':>7} {'wall':>8} {'first p50':>10} {'first p95':>10} {'health p95':>11} {'errors':>7}")
+    failed = False
+    for streams, wall, first_p50, first_p95, health_p95, errors in results:
+        print(f"{streams:>7} {wall:>7.2f}s {first_p50:>8.0f}ms {first_p95:>8.0f}ms {health_p95:>9.0f}ms {len(errors):>7}")
+        failed = failed or bool(errors)
+    for streams, *_, errors in results:
+        for error, count in Counter(map(_describe, errors)).most_common():
+            print(f"{streams} streams: {count} x {error}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+"""Every test module shares one scratch SQLite database, set before the app creates its engines."""
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'tests.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
@@ -0,0 +1,93 @@
+"""Archived chats stay searchable (revision 0017) and come back unchanged."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from app.core.database import AsyncSessionLocal, SessionLocal
+from app.core.migrations import run_migrations
+from app.main import app
+from app.models.chat import Chat, Message
+from app.services.chat_archive import ChatArchiver
+
+
+@pytest.fixture
+def client():
+    run_migrations()
+    # Without the context manager the background workers are not started
+    return TestClient(app)
+
+
+@pytest.fixture
+def archived_chat(client):
+    """A chat with a message and a file, archived; deleted afterwards"""
+    chat_id = client.post("/api/chats", json={"title": "Zoology notes"}).json()["id"]
+    with SessionLocal() as db:
+        db.add(Message(chat_id=chat_id, role="user", content="Zebras have striped coats " + "and manes " * 200))
+        db.commit()
+    response = client.post(
+        f"/api/chats/{chat_id}/files",
+        files={"file": ("okapi.txt", b"Okapis are the closest living relatives of giraffes", "text/plain")}
+    )
+    assert response.status_code == 200
+    
+    long_ago = datetime.utcnow() - timedelta(days=30)
+    with SessionLocal() as db:
+        db.execute(update(Chat).where(Chat.id == chat_id).values(updated_at=long_ago))
+        db.commit()
+    
+    async def archive():
+        async with AsyncSessionLocal() as db:
+            return await ChatArchiver.archive(db, chat_id, datetime.utcnow() - timedelta(days=7))
+    assert asyncio.run(archive())
+    with SessionLocal() as db:
+        assert db.get(Chat, chat_id).archived_at is not None
+    
+    yield chat_id
+    client.delete(f"/api/chats/{chat_id}")
+
+
+def search(client, query, **params):
+    response = client.get("/api/search", params={"q": query, **params})
+    assert response.status_code == 200
+    return response.json()["results"]
+
+
+@pytest.mark.parametrize("scoped", [False, True])
+def test_archived_chat_is_searchable(client, archived_chat, scoped):
+    params = {"chat_id": archived_chat} if scoped else {}
+    
+    [message] = search(client, "striped", **params)
+    assert message["type"] == "message"
+    assert message["chat_id"] == archived_chat
+    assert message["role"] == "user"
+    assert "<mark>striped</mark>" in message["snippet"]
+    
+    [file] = search(client, "giraffes", **params)
+    assert file["type"] == "file"
+    assert file["chat_id"] == archived_chat
+    assert file["filename"] == "okapi.txt"
+    assert "<mark>giraffes</mark>" in file["snippet"]
+    
+    # Searching doesn't restore the chat
+    with SessionLocal() as db:
+        assert db.get(Chat, archived_chat).archived_at is not None
+
+
+def test_restored_chat_is_found_once(client, archived_chat):
+    [archived] = search(client, "striped")
+    
+    messages = client.get(f"/api/chats/{archived_chat}/messages").json()
+    assert [message["content"] for message in messages] == ["Zebras have striped coats " + "and manes " * 200]
+    
+    [restored] = search(client, "striped")
+    assert restored["message_id"] == archived["message_id"] == messages[0]["id"]
+    assert len(search(client, "giraffes")) == 1
+
+
+def test_deleting_an_archived_chat_unindexes_it(client, archived_chat):
+    assert client.delete(f"/api/chats/{archived_chat}").status_code == 200
+    assert search(client, "striped") == []
+    assert search(client, "giraffes") == []
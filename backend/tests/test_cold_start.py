@@ -0,0 +1,30 @@
+"""Cold start stays within the budgets of benchmarks/cold_start.py, measured in fresh processes."""
+import os
+
+from app.core.migrations import run_migrations
+from benchmarks.cold_start import (
+    FIRST_RESPONSE_BUDGET,
+    IMPORT_BUDGET,
+    READY_BUDGET,
+    measure_import,
+    measure_server,
+)
+
+
+def test_import_within_budget():
+    assert measure_import() <= IMPORT_BUDGET
+
+
+def test_first_response_and_ready_within_budget():
+    # Already migrated, as on a machine starting again with its volume
+    run_migrations()
+    # Like fly.toml, which migrates only SQLite at startup
+    first_response, ready = measure_server(
+        timeout=READY_BUDGET * 2,
+        env=dict(os.environ, RUN_MIGRATIONS_ON_STARTUP="sqlite")
+    )
+    
+    assert first_response is not None, "no /health response"
+    assert first_response <= FIRST_RESPONSE_BUDGET
+    assert ready is not None, "/ready never reported ready"
+    assert ready <= READY_BUDGET
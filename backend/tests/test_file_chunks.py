@@ -0,0 +1,92 @@
+"""File chunks are offsets into their blob (revision 0019), indexed for search by the app."""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, SessionLocal, engine
+from app.core.migrations import run_migrations
+from app.main import app
+from app.models.chat import ContentBlob, FileChunk, FileUpload
+from app.services.file_context_cache import file_context_cache
+from app.services.retrieval_service import RetrievalService
+
+# Long enough for many chunks, with one rare word far into the text
+TEXT = "\n  ".join(f"Paragraph {i} covers ledgers, invoices and audits." for i in range(400)) + " Narwhals appear once."
+
+
+@pytest.fixture
+def client():
+    run_migrations()
+    # Without the context manager the background workers are not started
+    return TestClient(app)
+
+
+@pytest.fixture
+def chat_id(client):
+    chat_id = client.post("/api/chats", json={"title": "Accounts"}).json()["id"]
+    yield chat_id
+    client.delete(f"/api/chats/{chat_id}")
+
+
+def upload(client, chat_id):
+    response = client.post(f"/api/chats/{chat_id}/files", files={"file": ("accounts.txt", TEXT.encode(), "text/plain")})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def search(client, query):
+    response = client.get("/api/search", params={"q": query})
+    assert response.status_code == 200
+    return response.json()["results"]
+
+
+def assert_index_matches_chunks():
+    """FTS5 checks its entries against the text read back through the chunks' view"""
+    with engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO file_chunks_fts(file_chunks_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_chunks_slice_their_blob(client, chat_id):
+    file_id = upload(client, chat_id)
+    
+    with SessionLocal() as db:
+        blob_id = db.get(FileUpload, file_id).blob_id
+        content = db.get(ContentBlob, blob_id).content
+        spans = db.query(FileChunk.start_offset, FileChunk.end_offset).filter(FileChunk.blob_id == blob_id).order_by(FileChunk.chunk_index).all()
+    assert [tuple(span) for span in spans] == RetrievalService.chunk_spans(content)
+    assert len(spans) > 1
+    for start, end in spans:
+        assert content[start:end] == content[start:end].strip() != ""
+    assert_index_matches_chunks()
+
+
+def test_file_context_and_search_read_the_sliced_text(client, chat_id, monkeypatch):
+    upload(client, chat_id)
+    monkeypatch.setattr(settings, "retrieval_full_context_chars", 1000)
+    
+    async def build_context():
+        async with AsyncSessionLocal() as db:
+            return await RetrievalService.build_file_context(db, chat_id, "Where do narwhals appear?")
+    file_context_cache.invalidate(chat_id)
+    context = asyncio.run(build_context())
+    assert "Narwhals appear once." in context
+    assert len(context) < len(TEXT) // 2
+    
+    [result] = search(client, "narwhals")
+    assert result["filename"] == "accounts.txt"
+    assert "<mark>Narwhals</mark> appear once" in result["snippet"]
+
+
+def test_deleting_the_last_reference_unindexes_chunks(client, chat_id):
+    first = upload(client, chat_id)
+    second = upload(client, chat_id)
+    assert len(search(client, "narwhals")) == 2
+    
+    # The blob is shared, so its chunks stay until the last file goes
+    assert client.delete(f"/api/chats/{chat_id}/files/{first}").status_code == 200
+    assert len(search(client, "narwhals")) == 1
+    assert client.delete(f"/api/chats/{chat_id}/files/{second}").status_code == 200
+    assert search(client, "narwhals") == []
+    assert_index_matches_chunks()
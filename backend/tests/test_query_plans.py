@@ -0,0 +1,218 @@
+"""Chat, message and file lookups by chat are served from the indexes of revisions 0003 and 0004.
+
+Requests run against a migrated SQLite database while their statements are
+recorded, and each statement's EXPLAIN QUERY PLAN is checked. The plan of a
+DELETE includes the lookups of the ON DELETE actions it sets off.
+"""
+import asyncio
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select, update
+
+from app.core.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+from app.core.migrations import run_migrations
+from app.main import app
+from app.models.chat import Chat, FileUpload, Message
+from app.services.file_context_cache import file_context_cache
+from app.services.retrieval_service import RetrievalService
+
+CHATS = 30
+MESSAGES_PER_CHAT = 20
+
+
+@pytest.fixture(scope="module")
+def chat_ids():
+    """Seeded chat ids, newest first"""
+    run_migrations()
+    now = datetime.utcnow()
+    ids = []
+    with SessionLocal() as db:
+        for i in range(CHATS):
+            chat = Chat(title=f"Chat {i}", updated_at=now - timedelta(minutes=i))
+            db.add(chat)
+            db.flush()
+            ids.append(chat.id)
+            db.add_all(
+                Message(chat_id=chat.id, role="user", content=f"Message {j}", created_at=now + timedelta(seconds=j))
+                for j in range(MESSAGES_PER_CHAT)
+            )
+        db.commit()
+    return ids
+
+
+@pytest.fixture(scope="module")
+def client(chat_ids):
+    # Without the context manager the background workers are not started
+    return TestClient(app)
+
+
+def upload(client, chat_id, filename, text):
+    response = client.post(f"/api/chats/{chat_id}/files", files={"file": (filename, text.encode(), "text/plain")})
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+@pytest.fixture(scope="module")
+def files_chat_id(client):
+    """A chat with files large enough to be served by retrieval rather than whole"""
+    chat_id = client.post("/api/chats", json={"title": "Files"}).json()["id"]
+    for i in range(3):
+        upload(client, chat_id, f"report{i}.txt", f"Quarterly report {i}. " + "Revenue grew in every region. " * 500)
+    with SessionLocal() as db:
+        # Off the first page of the chat list, which holds the seeded chats
+        db.execute(update(Chat).where(Chat.id == chat_id).values(updated_at=datetime.utcnow() - timedelta(days=1)))
+        db.commit()
+    return chat_id
+
+
+@contextmanager
+def recorded_statements(verb="SELECT"):
+    """Collect the statements starting with ``verb`` that the app runs, with their parameters"""
+    statements = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(verb):
+            statements.append((statement, parameters))
+    
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+def query_plan(statement, parameters):
+    with engine.connect() as conn:
+        return [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+
+
+def plan_of(statements, *fragments):
+    """Plan of the one recorded statement that contains all ``fragments``"""
+    matching = [
+        (statement, parameters) for statement, parameters in statements
+        if all(fragment in statement for fragment in fragments)
+    ]
+    assert len(matching) == 1, matching
+    return query_plan(*matching[0])
+
+
+def assert_no_table_scan(plan, table=""):
+    # Scanning a covering index in order is fine; reading the table row by row is not
+    scans = [step for step in plan if step.startswith(f"SCAN {table}") and "COVERING INDEX" not in step]
+    assert not scans, plan
+
+
+@pytest.mark.parametrize("with_cursor", [False, True])
+def test_chat_list_uses_keyset_indexes(client, with_cursor):
+    params = {"limit": 10}
+    if with_cursor:
+        params["cursor"] = client.get("/api/chats", params=params).json()["next_cursor"]
+    
+    with recorded_statements() as statements:
+        response = client.get("/api/chats", params=params)
+    assert response.status_code == 200
+    assert [chat["message_count"] for chat in response.json()["chats"]] == [MESSAGES_PER_CHAT] * 10
+    
+    plan = plan_of(statements, "FROM chats JOIN", "GROUP BY messages.chat_id")
+    assert any("ix_chats_updated_at_id" in step for step in plan), plan
+    if with_cursor:
+        assert any(step.startswith("SEARCH chats USING COVERING INDEX ix_chats_updated_at_id") for step in plan), plan
+    assert any(
+        step.startswith("SEARCH messages USING COVERING INDEX ix_messages_chat_id_created_at_id") for step in plan
+    ), plan
+    assert_no_table_scan(plan, "chats")
+    assert_no_table_scan(plan, "messages")
+
+
+@pytest.mark.parametrize("with_cursor", [False, True])
+def test_message_pages_use_chat_index(client, chat_ids, with_cursor):
+    url = f"/api/chats/{chat_ids[0]}/messages"
+    params = {"limit": 5}
+    if with_cursor:
+        params["before"] = client.get(url, params=params).headers["X-Next-Cursor"]
+    
+    with recorded_statements() as statements:
+        response = client.get(url, params=params)
+    assert response.status_code == 200
+    assert len(response.json()) == 5
+    
+    plan = plan_of(statements, "FROM messages")
+    assert len(plan) == 1, plan
+    expected = "(chat_id=? AND created_at<?)" if with_cursor else "(chat_id=?)"
+    assert plan[0] == f"SEARCH messages USING INDEX ix_messages_chat_id_created_at_id {expected}"
+
+
+def test_file_list_uses_chat_index(client, files_chat_id):
+    with recorded_statements() as statements:
+        response = client.get(f"/api/chats/{files_chat_id}/files")
+    assert response.status_code == 200
+    assert len(response.json()["files"]) == 3
+    
+    plan = plan_of(statements, "FROM file_uploads")
+    assert plan == ["SEARCH file_uploads USING INDEX ix_file_uploads_chat_id (chat_id=?)"]
+
+
+def test_file_delete_uses_indexes(client, files_chat_id):
+    file_id = upload(client, files_chat_id, "draft.txt", "A draft to delete")
+    
+    with recorded_statements("DELETE") as statements:
+        response = client.delete(f"/api/chats/{files_chat_id}/files/{file_id}")
+    assert response.status_code == 200
+    
+    # The id finds the row; chat_id only checks that it belongs to the chat
+    plan = plan_of(statements, "DELETE FROM file_uploads")
+    assert plan == ["SEARCH file_uploads USING INTEGER PRIMARY KEY (rowid=?)"]
+    # Releasing the last reference deletes the blob, cascading to its chunks and postings
+    plan = plan_of(statements, "DELETE FROM content_blobs")
+    assert any("ix_file_chunks_blob_id_chunk_index" in step for step in plan), plan
+    assert any("ix_file_uploads_blob_id" in step for step in plan), plan
+    assert_no_table_scan(plan)
+
+
+def test_file_context_uses_chat_index(client, files_chat_id):
+    async def build_context():
+        async with AsyncSessionLocal() as db:
+            return await RetrievalService.build_file_context(db, files_chat_id, "How did revenue grow?")
+    
+    file_context_cache.invalidate(files_chat_id)
+    with recorded_statements() as statements:
+        context = asyncio.run(build_context())
+    assert "Revenue grew" in context
+    
+    # The size check, the unindexed-file check, the chat's blobs for BM25 and the file names
+    by_chat = [(statement, parameters) for statement, parameters in statements if "file_uploads.chat_id" in statement]
+    assert len(by_chat) >= 4, statements
+    for statement, parameters in by_chat:
+        plan = query_plan(statement, parameters)
+        assert any("USING INDEX ix_file_uploads_chat_id (chat_id=?)" in step for step in plan), (statement, plan)
+        assert_no_table_scan(plan, "file_uploads")
+        assert_no_table_scan(plan, "file_chunks")
+        assert_no_table_scan(plan, "chunk_terms")
+
+
+def test_chat_delete_cascades_use_indexes(client):
+    chat_id = client.post("/api/chats", json={"title": "To delete"}).json()["id"]
+    with SessionLocal() as db:
+        db.add_all(Message(chat_id=chat_id, role="user", content=f"Message {j}") for j in range(5))
+        db.commit()
+    upload(client, chat_id, "notes.txt", "Notes to delete with the chat")
+    
+    with recorded_statements("DELETE") as statements:
+        response = client.delete(f"/api/chats/{chat_id}")
+    assert response.status_code == 200
+    
+    plan = plan_of(statements, "DELETE FROM chats")
+    assert any(step.startswith("SEARCH messages USING COVERING INDEX ix_messages_chat_id_created_at_id") for step in plan), plan
+    assert any(step.startswith("SEARCH file_uploads USING COVERING INDEX ix_file_uploads_chat_id") for step in plan), plan
+    assert_no_table_scan(plan)
+    # One level down: each deleted message clears generation_jobs.message_id (revision 0018)
+    plan = query_plan("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+    assert "SEARCH generation_jobs USING COVERING INDEX ix_generation_jobs_message_id (message_id=?)" in plan, plan
+    assert_no_table_scan(plan)
+    
+    with SessionLocal() as db:
+        assert db.execute(select(func.count(Message.id)).filter(Message.chat_id == chat_id)).scalar() == 0
+        assert db.execute(select(func.count(FileUpload.id)).filter(FileUpload.chat_id == chat_id)).scalar() == 0
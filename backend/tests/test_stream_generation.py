@@ -0,0 +1,117 @@
+"""A streamed generation closes its provider stream once its reader is gone for good."""
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.migrations import run_migrations
+from app.models.chat import Chat
+from app.services.stream_generation import StreamGeneration, stream_metrics
+
+# Longer than the disconnect poll, well short of the resume grace period
+PROMPT_SECONDS = 1.0
+
+
+class Provider:
+    """An answer that would go on for much longer than the test"""
+    
+    def __init__(self):
+        self.closed_at = None
+    
+    async def stream(self):
+        try:
+            for _ in range(100000):
+                yield "token "
+                await asyncio.sleep(0.005)
+        finally:
+            self.closed_at = time.monotonic()
+
+
+@pytest.fixture
+def chat_id():
+    run_migrations()
+    with SessionLocal() as db:
+        chat = Chat(title="Streaming")
+        db.add(chat)
+        db.commit()
+        chat_id = chat.id
+    yield chat_id
+    with SessionLocal() as db:
+        db.delete(db.get(Chat, chat_id))
+        db.commit()
+
+
+@pytest.fixture(autouse=True)
+def stream_settings(monkeypatch):
+    monkeypatch.setattr(settings, "stream_flush_interval_ms", 0)
+    monkeypatch.setattr(settings, "stream_disconnect_poll_ms", 50)
+    monkeypatch.setattr(settings, "stream_resume_grace_seconds", 15.0)
+
+
+async def read_then_leave(generation: StreamGeneration, events: int, detected_after: float = 0) -> float:
+    """Read some events, then disconnect; returns when the disconnect was noticed"""
+    received = 0
+    
+    async def is_disconnected():
+        if received < events:
+            return False
+        # The server may only notice a while after the client left
+        await asyncio.sleep(detected_after)
+        return True
+    
+    generation.attach()
+    cursor = 0
+    async for event_id, event in generation.events(is_disconnected):
+        received += 1
+        cursor = event_id
+    generation.detach(cursor)
+    return time.monotonic()
+
+
+def run(chat_id, leave, **kwargs):
+    """Stream to one reader who leaves; returns the generation, its provider and when the reader left"""
+    async def main():
+        provider = Provider()
+        generation = StreamGeneration(chat_id, provider.stream(), "gpt-3.5-turbo", max_tokens=1000)
+        generation.start()
+        left_at = await leave(generation, **kwargs)
+        # Long enough for a prompt cancellation to reach the provider
+        await asyncio.sleep(PROMPT_SECONDS)
+        still_generating = generation.generating
+        generation.cancel()
+        await generation.task
+        return generation, provider, left_at, still_generating
+    return asyncio.run(main())
+
+
+def test_no_grace_period_cancels_on_disconnect(chat_id, monkeypatch):
+    monkeypatch.setattr(settings, "stream_resume_grace_seconds", 0)
+    abandoned = stream_metrics.abandoned
+    tokens_saved = stream_metrics.tokens_saved
+    
+    generation, provider, left_at, still_generating = run(chat_id, read_then_leave, events=3)
+    
+    assert not still_generating
+    assert provider.closed_at - left_at < PROMPT_SECONDS
+    assert generation.status == "abandoned"
+    assert stream_metrics.abandoned == abandoned + 1
+    assert stream_metrics.tokens_saved > tokens_saved
+
+
+def test_reader_that_cannot_resume_cancels_on_disconnect(chat_id, monkeypatch):
+    # The events the reader missed while its disconnect went unnoticed fall out of the buffer
+    monkeypatch.setattr(settings, "stream_replay_buffer_events", 4)
+    
+    generation, provider, left_at, still_generating = run(chat_id, read_then_leave, events=3, detected_after=0.2)
+    
+    assert not still_generating
+    assert provider.closed_at - left_at < PROMPT_SECONDS
+
+
+def test_resumable_reader_keeps_generation_for_grace_period(chat_id):
+    generation, provider, left_at, still_generating = run(chat_id, read_then_leave, events=3)
+    
+    assert still_generating
+    assert provider.closed_at - left_at >= PROMPT_SECONDS
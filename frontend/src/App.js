@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect, useMemo, useRef } from 'react';
 import ChatList from './components/ChatList';
 import ChatWindow from './components/ChatWindow';
 import { chatAPI } from './services/api';
@@ -8,6 +8,9 @@ function App() {
     const [chats, setChats] = useState([]);
     const [currentChat, setCurrentChat] = useState(null);
     const [messages, setMessages] = useState([]);
+    const [olderMessagesCursor, setOlderMessagesCursor] = useState(null); // Cursor for the page before the loaded messages
+    const [isLoadingOlder, setIsLoadingOlder] = useState(false);
+    const messagesChatIdRef = useRef(null); // Chat the loaded messages belong to
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState(null);
     const [thinkMode, setThinkMode] = useState(false);
@@ -31,7 +34,9 @@ function App() {
             }
             loadMessages(currentChat.id);
         } else {
+            messagesChatIdRef.current = null;
             setMessages([]);
+            setOlderMessagesCursor(null);
         }
     }, [currentChat, isStreaming]);
 
@@ -56,16 +61,40 @@ function App() {
         }
     };
 
+    // Load the newest page of a chat's messages; older pages follow as the user scrolls up
     const loadMessages = async (chatId) => {
         try {
-            const messagesData = await chatAPI.getMessages(chatId);
-            setMessages(messagesData);
+            const page = await chatAPI.getMessages(chatId);
+            messagesChatIdRef.current = chatId;
+            setMessages(page.messages);
+            setOlderMessagesCursor(page.before);
         } catch (err) {
             setError('Failed to load messages');
             console.error('Error loading messages:', err);
         }
     };
 
+    const loadOlderMessages = async () => {
+        const chatId = messagesChatIdRef.current;
+        if (!chatId || !olderMessagesCursor || isLoadingOlder) {
+            return;
+        }
+        setIsLoadingOlder(true);
+        try {
+            const page = await chatAPI.getMessages(chatId, olderMessagesCursor);
+            // Drop the page if another chat was opened meanwhile
+            if (messagesChatIdRef.current === chatId) {
+                setMessages(prevMessages => [...page.messages, ...prevMessages]);
+                setOlderMessagesCursor(page.before);
+            }
+        } catch (err) {
+            setError('Failed to load older messages');
+            console.error('Error loading older messages:', err);
+        } finally {
+            setIsLoadingOlder(false);
+        }
+    };
+
     const handleChatSelect = async (chatId) => {
         try {
             const chatData = await chatAPI.getChat(chatId);
@@ -86,7 +115,9 @@ function App() {
             model_provider: 'openai',
             model_name: 'gpt-3.5-turbo'
         });
+        messagesChatIdRef.current = null;
         setMessages([]);
+        setOlderMessagesCursor(null);
     };
 
     const handleDeleteChat = async (chatId) => {
@@ -97,7 +128,9 @@ function App() {
             // If deleted chat was current, clear current chat
             if (currentChat && currentChat.id === chatId) {
                 setCurrentChat(null);
+                messagesChatIdRef.current = null;
                 setMessages([]);
+                setOlderMessagesCursor(null);
             }
         } catch (err) {
             setError('Failed to delete chat');
@@ -294,6 +327,9 @@ function App() {
                 <ChatWindow
                     currentChat={currentChat}
                     messages={messages}
+                    hasOlderMessages={!!olderMessagesCursor}
+                    isLoadingOlder={isLoadingOlder}
+                    onLoadOlderMessages={loadOlderMessages}
                     onSendMessage={handleSendMessage}
                     isLoading={isLoading}
                     thinkMode={thinkMode}
@@ -1,4 +1,4 @@
-import React, { useState, useRef, useEffect } from 'react';
+import React, { useState, useRef, useEffect, useLayoutEffect } from 'react';
 import { Send, User, Bot, Brain, Search, Paperclip, Settings } from 'lucide-react';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
@@ -7,6 +7,9 @@ import FileUpload from './FileUpload';
 const ChatWindow = ({
     currentChat,
     messages,
+    hasOlderMessages,
+    isLoadingOlder,
+    onLoadOlderMessages,
     onSendMessage,
     isLoading,
     thinkMode,
@@ -20,15 +23,47 @@ const ChatWindow = ({
     const [showFileUpload, setShowFileUpload] = useState(false);
     const [showModelSelector, setShowModelSelector] = useState(false);
     const messagesEndRef = useRef(null);
+    const messagesContainerRef = useRef(null);
+    const scrollAnchorRef = useRef(null); // Scroll position kept while older messages are added above
+    const oldestMessageIdRef = useRef(null);
+    const lastScrollTopRef = useRef(0);
 
     const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
     };
 
-    useEffect(() => {
+    useLayoutEffect(() => {
+        const container = messagesContainerRef.current;
+        const oldestMessageId = messages.length ? messages[0].id : null;
+        const prepended = scrollAnchorRef.current && oldestMessageId !== oldestMessageIdRef.current;
+        oldestMessageIdRef.current = oldestMessageId;
+        if (prepended && container) {
+            // Keep the messages the user was reading in place
+            const { scrollHeight, scrollTop } = scrollAnchorRef.current;
+            container.scrollTop = container.scrollHeight - scrollHeight + scrollTop;
+            scrollAnchorRef.current = null;
+            return;
+        }
         scrollToBottom();
     }, [messages]);
 
+    useEffect(() => {
+        if (!isLoadingOlder) {
+            scrollAnchorRef.current = null;
+        }
+    }, [isLoadingOlder]);
+
+    // Fetch the page before the loaded messages once the user scrolls to the top
+    const handleMessagesScroll = (e) => {
+        const container = e.currentTarget;
+        const scrolledUp = container.scrollTop < lastScrollTopRef.current;
+        lastScrollTopRef.current = container.scrollTop;
+        if (scrolledUp && container.scrollTop < 80 && hasOlderMessages && !isLoadingOlder && onLoadOlderMessages) {
+            scrollAnchorRef.current = { scrollHeight: container.scrollHeight, scrollTop: container.scrollTop };
+            onLoadOlderMessages();
+        }
+    };
+
     const handleSubmit = (e) => {
         e.preventDefault();
         if (inputValue.trim() && !isLoading) {
@@ -140,7 +175,10 @@ const ChatWindow = ({
             )}
 
             {/* Messages */}
-            <div className="messages-container">
+            <div className="messages-container" ref={messagesContainerRef} onScroll={handleMessagesScroll}>
+                {isLoadingOlder && (
+                    <div className="messages-loading-older">Loading earlier messages…</div>
+                )}
                 {messages.length === 0 ? (
                     <div className="empty-state">
                         <Bot className="w-12 h-12 text-gray-400" />
@@ -206,6 +244,7 @@ const ChatWindow = ({
                                 </div>
                                 <div className="message-time">
                                     {formatTime(message.created_at)}
+                                    {message.truncated && <span className="message-truncated"> · stopped early</span>}
                                 </div>
                             </div>
                         </div>
@@ -2,6 +2,9 @@ import axios from 'axios';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
 
+// Attempts to resume a dropped message stream before giving up
+const MAX_STREAM_RESUMES = 3;
+
 const api = axios.create({
     baseURL: API_BASE_URL,
     headers: {
@@ -34,10 +37,14 @@ export const chatAPI = {
         return response.data;
     },
 
-    // Get messages for a chat
-    getMessages: async (chatId) => {
-        const response = await api.get(`/api/chats/${chatId}/messages`);
-        return response.data;
+    // Get a page of messages for a chat: the newest one, or the one before the given cursor
+    getMessages: async (chatId, before = null) => {
+        const params = before ? { before } : {};
+        const response = await api.get(`/api/chats/${chatId}/messages`, { params });
+        return {
+            messages: response.data,
+            before: response.headers['x-next-cursor'] || null,
+        };
     },
 
     // Send message to AI (non-streaming)
@@ -46,23 +53,14 @@ export const chatAPI = {
         return response.data;
     },
 
-    // Send message to AI with streaming
+    // Send message to AI with streaming, resuming the stream if the connection drops
     sendMessageStream: async (chatId, messageData, onChunk, onComplete, onError) => {
-        try {
-            console.log('Starting streaming request...');
-            const response = await fetch(`${API_BASE_URL}/api/chats/${chatId}/messages/stream`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(messageData),
-            });
-
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
+        let streamId = null;
+        let lastEventId = 0;
+        let finished = false;
 
-            console.log('Streaming response received, starting to read...');
+        // Read server-sent events until the stream ends; false if the connection dropped
+        const readEvents = async (response) => {
             const reader = response.body.getReader();
             const decoder = new TextDecoder();
             let buffer = '';
@@ -71,12 +69,10 @@ export const chatAPI = {
                 const { done, value } = await reader.read();
 
                 if (done) {
-                    console.log('Stream complete');
-                    break;
+                    return finished;
                 }
 
-                const chunk = decoder.decode(value, { stream: true });
-                buffer += chunk;
+                buffer += decoder.decode(value, { stream: true });
 
                 // Process complete lines
                 const lines = buffer.split('\n');
@@ -84,33 +80,30 @@ export const chatAPI = {
 
                 for (const line of lines) {
                     const trimmedLine = line.trim();
-                    if (trimmedLine && trimmedLine.startsWith('data: ')) {
+                    if (trimmedLine.startsWith('id: ')) {
+                        lastEventId = parseInt(trimmedLine.slice(4), 10);
+                    } else if (trimmedLine.startsWith('data: ')) {
                         try {
-                            const jsonStr = trimmedLine.slice(6);
-                            const data = JSON.parse(jsonStr);
-                            console.log('Stream data:', data);
+                            const data = JSON.parse(trimmedLine.slice(6));
 
                             if (data.content) {
                                 // This is a content chunk
-                                console.log('Chunk received:', data.content);
-                                if (onChunk && data.content) {
+                                if (onChunk) {
                                     onChunk(data.content);
                                 }
                             } else if (data.done) {
-                                // Stream is complete
-                                console.log('Stream complete');
+                                finished = true;
                                 if (onComplete) {
-                                    // Call onComplete with the accumulated content
                                     onComplete({ done: true });
                                 }
-                                return;
+                                return true;
                             } else if (data.error) {
-                                // Error occurred
                                 console.error('Stream error:', data.error);
+                                finished = true;
                                 if (onError) {
                                     onError(data.error);
                                 }
-                                return;
+                                return true;
                             }
                         } catch (e) {
                             console.error('Error parsing stream data:', e, 'Line:', trimmedLine);
@@ -118,6 +111,53 @@ export const chatAPI = {
                     }
                 }
             }
+        };
+
+        try {
+            const response = await fetch(`${API_BASE_URL}/api/chats/${chatId}/messages/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify(messageData),
+            });
+
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            streamId = response.headers.get('X-Stream-Id');
+
+            let ended = false;
+            let error = null;
+            for (let attempt = 0; attempt <= MAX_STREAM_RESUMES; attempt++) {
+                try {
+                    if (attempt === 0) {
+                        ended = await readEvents(response);
+                    } else {
+                        // Pick up after the last event received; the server replays the rest
+                        await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+                        const resumed = await fetch(
+                            `${API_BASE_URL}/api/chats/${chatId}/messages/stream/${streamId}`,
+                            { headers: { 'Last-Event-ID': String(lastEventId) } }
+                        );
+                        if (!resumed.ok) {
+                            throw new Error(`HTTP error! status: ${resumed.status}`);
+                        }
+                        ended = await readEvents(resumed);
+                    }
+                    error = null;
+                } catch (e) {
+                    error = e;
+                }
+                if (ended || !streamId) {
+                    break;
+                }
+                console.warn('Stream connection dropped, resuming after event', lastEventId);
+            }
+
+            if (!ended) {
+                throw error || new Error('Stream ended unexpectedly');
+            }
         } catch (error) {
             console.error('Streaming error:', error);
             if (onError) {